@@ -0,0 +1,271 @@
+"""
+Many boards at once as NumPy arrays, for generating training data without a GameState per position. A BoardBatch
+holds N boards as an N x 8 x 8 int8 array of piece codes (0 empty, 1-6 white pawn, knight, bishop, rook, queen,
+king, negative for black, row 0 is the 8th rank like GameState.board) plus the side to move, castling rights and en
+passant square of each board. Pseudo-legal move masks, attack maps and the evaluation of ChessSearch.evaluate are
+computed for the whole batch with array operations, a handful of them per direction instead of a Python loop per
+position.
+
+    batch = BoardBatch.fromFENs(fens)
+    scores = batch.evaluate()                  # N centipawn scores from the side to move
+    masks = batch.getMoveMasks()               # N x 64 x 64 bool, [board, start square, end square]
+    gs = batch.toGameState(17)                 # spot check one board with the full rules
+
+Pseudo-legal means pins and checks are ignored and castling only needs the right, the rook and empty squares
+between, so the masks hold every legal move plus some illegal ones. Needs numpy.
+"""
+
+import numpy as np
+
+from Chess import ChessEngine, ChessSearch
+
+EMPTY, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(7)
+PIECE_CODES = {"--": 0, "wp": 1, "wN": 2, "wB": 3, "wR": 4, "wQ": 5, "wK": 6,
+               "bp": -1, "bN": -2, "bB": -3, "bR": -4, "bQ": -5, "bK": -6}
+CODE_PIECES = {code: piece for piece, code in PIECE_CODES.items()}
+FEN_CODES = {"P": 1, "N": 2, "B": 3, "R": 4, "Q": 5, "K": 6, "p": -1, "n": -2, "b": -3, "r": -4, "q": -5, "k": -6}
+CODE_FEN = {code: char for char, code in FEN_CODES.items()}
+
+"""
+Start and end square index arrays of a step of (dr, dc) from every square that stays on the board"""
+def buildStep(dr, dc, rows=range(8)):
+    pairs = [(r * 8 + c, (r + dr) * 8 + c + dc) for r in rows for c in range(8)
+             if 0 <= r + dr < 8 and 0 <= c + dc < 8]
+    return np.array([start for start, _ in pairs], np.intp), np.array([end for _, end in pairs], np.intp)
+
+"""
+For a slider direction, the k-th step of the ray from every square that has one: a list of 7 (start, end) index
+array pairs, k = 1 to 7"""
+def buildRaySteps(dr, dc):
+    steps = []
+    for k in range(1, 8):
+        steps.append(buildStep(dr * k, dc * k))
+    return steps
+
+KNIGHT_STEPS = [buildStep(dr, dc) for dr, dc in ChessEngine.KNIGHT_OFFSETS]
+KING_STEPS = [buildStep(dr, dc) for dr, dc in ChessEngine.KING_OFFSETS]
+ROOK_STEPS = [buildStep(dr, dc) for dr, dc in ChessEngine.ROOK_DIRECTIONS]
+BISHOP_STEPS = [buildStep(dr, dc) for dr, dc in ChessEngine.BISHOP_DIRECTIONS]
+ROOK_RAY_STEPS = [buildRaySteps(dr, dc) for dr, dc in ChessEngine.ROOK_DIRECTIONS]
+BISHOP_RAY_STEPS = [buildRaySteps(dr, dc) for dr, dc in ChessEngine.BISHOP_DIRECTIONS]
+# pawns, by color: single push, double push (with the square passed over), captures
+PAWN_PUSHES = {1: buildStep(-1, 0), -1: buildStep(1, 0)}
+PAWN_DOUBLE_PUSHES = {1: buildStep(-2, 0, rows=(6,)), -1: buildStep(2, 0, rows=(1,))}
+PAWN_CAPTURES = {1: (buildStep(-1, -1), buildStep(-1, 1)), -1: (buildStep(1, -1), buildStep(1, 1))}
+PROMOTION_ROWS = np.zeros(64, bool)
+PROMOTION_ROWS[:8] = PROMOTION_ROWS[56:] = True
+
+# castling: (rights column, king square, king target, rook square, squares that must be empty)
+CASTLES = {1: ((0, 60, 62, 63, (61, 62)), (2, 60, 58, 56, (57, 58, 59))),
+           -1: ((1, 4, 6, 7, (5, 6)), (3, 4, 2, 0, (1, 2, 3)))}
+
+"""
+VALUE_TABLE[code + 6, square], material plus piece square value of ChessSearch.PIECE_SQUARE_VALUES, negative for
+black pieces"""
+def buildValueTable():
+    table = np.zeros((13, 64), np.int32)
+    for piece, code in PIECE_CODES.items():
+        if code:
+            values = ChessSearch.PIECE_SQUARE_VALUES[piece]
+            table[code + 6] = [values[sq // 8][sq % 8] for sq in range(64)]
+    return table
+
+VALUE_TABLE = buildValueTable()
+SQUARES = np.arange(64)
+
+class BoardBatch():
+    def __init__(self, pieces, whiteToMove, castling=None, enpassant=None):
+        self.pieces = np.ascontiguousarray(pieces, np.int8).reshape(-1, 8, 8)
+        count = len(self.pieces)
+        self.whiteToMove = np.asarray(whiteToMove, bool).reshape(count)
+        # columns wks, bks, wqs, bqs like CastleRights
+        self.castling = np.zeros((count, 4), bool) if castling is None else np.asarray(castling, bool).reshape(count, 4)
+        # en passant target square (row * 8 + col) or -1
+        self.enpassant = np.full(count, -1, np.int16) if enpassant is None else np.asarray(enpassant, np.int16).reshape(count)
+
+    def __len__(self):
+        return len(self.pieces)
+
+    @classmethod
+    def fromGameStates(cls, gameStates):
+        pieces = np.array([[[PIECE_CODES[piece] for piece in row] for row in gs.board] for gs in gameStates], np.int8)
+        castling = [(gs.currentCastlingRight.wks, gs.currentCastlingRight.bks, gs.currentCastlingRight.wqs,
+                     gs.currentCastlingRight.bqs) for gs in gameStates]
+        enpassant = [gs.enpassantPossible[0] * 8 + gs.enpassantPossible[1] if gs.enpassantPossible else -1
+                     for gs in gameStates]
+        return cls(pieces.reshape(-1, 8, 8), [gs.whiteToMove for gs in gameStates], castling, enpassant)
+
+    """
+    Parse FENs straight into the arrays, without building a GameState for each"""
+    @classmethod
+    def fromFENs(cls, fens):
+        fens = list(fens)
+        pieces = np.zeros((len(fens), 64), np.int8)
+        whiteToMove = np.ones(len(fens), bool)
+        castling = np.zeros((len(fens), 4), bool)
+        enpassant = np.full(len(fens), -1, np.int16)
+        for i, fen in enumerate(fens):
+            fields = fen.split()
+            sq = 0
+            for char in fields[0]:
+                if char.isdigit():
+                    sq += int(char)
+                elif char != "/":
+                    pieces[i, sq] = FEN_CODES[char]
+                    sq += 1
+            if sq != 64:
+                raise ValueError("bad FEN %r" % fen)
+            whiteToMove[i] = len(fields) < 2 or fields[1] == "w"
+            rights = fields[2] if len(fields) > 2 else "-"
+            castling[i] = ("K" in rights, "k" in rights, "Q" in rights, "q" in rights)
+            if len(fields) > 3 and fields[3] != "-":
+                enpassant[i] = ChessEngine.Move.ranksToRows[fields[3][1]] * 8 + ChessEngine.Move.filesToCols[fields[3][0]]
+        return cls(pieces, whiteToMove, castling, enpassant)
+
+    """
+    FEN of board i, move counters are not kept so they are written as 0 1"""
+    def getFEN(self, i):
+        ranks = []
+        for row in self.pieces[i]:
+            rank = ""
+            empty = 0
+            for code in row:
+                if code == 0:
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += CODE_FEN[int(code)]
+            ranks.append(rank + (str(empty) if empty else ""))
+        rights = "".join(char for char, right in zip("KkQq", self.castling[i]) if right)
+        rights = "".join(sorted(rights, key="KQkq".index)) or "-"
+        enpassant = "-" if self.enpassant[i] < 0 else ChessEngine.Move.colsToFiles[self.enpassant[i] % 8] + \
+            ChessEngine.Move.rowsToRanks[self.enpassant[i] // 8]
+        return "%s %s %s %s 0 1" % ("/".join(ranks), "w" if self.whiteToMove[i] else "b", rights, enpassant)
+
+    """
+    Board i as a GameState (ChessEngine.GameState or another engine's class) for checks with the full rules"""
+    def toGameState(self, i, gameStateClass=ChessEngine.GameState):
+        gs = gameStateClass()
+        gs.loadFEN(self.getFEN(i))
+        return gs
+
+    """
+    Static evaluation of every board in centipawns from the side to move, the same numbers as
+    ChessSearch.evaluate"""
+    def evaluate(self):
+        flat = self.pieces.reshape(len(self), 64)
+        scores = VALUE_TABLE[flat.astype(np.intp) + 6, SQUARES].sum(axis=1)
+        return np.where(self.whiteToMove, scores, -scores)
+
+    """
+    N x 8 x 8 bool map of the squares attacked by white (white=True) or black pieces on each board, squares of
+    their own pieces they defend included. With throughKing the sliders go on through the other side's king, the
+    squares behind it on a checking line are attacked too"""
+    def getAttackMaps(self, white=True, throughKing=False):
+        color = 1 if white else -1
+        flat = self.pieces.reshape(len(self), 64) * np.int8(color) # the attacking side is positive
+        empty = (flat == 0) | (flat == -KING) if throughKing else flat == 0
+        attacked = np.zeros(flat.shape, bool)
+        for start, end in PAWN_CAPTURES[color]:
+            attacked[:, end] |= flat[:, start] == PAWN
+        for steps, code in ((KNIGHT_STEPS, KNIGHT), (KING_STEPS, KING)):
+            isPiece = flat == code
+            for start, end in steps:
+                attacked[:, end] |= isPiece[:, start]
+        for steps, code in ((ROOK_STEPS, ROOK), (BISHOP_STEPS, BISHOP)):
+            front = (flat == code) | (flat == QUEEN)
+            for start, end in steps: # walk every ray one square at a time, stopping on any piece
+                current = front
+                for _ in range(7):
+                    moved = np.zeros(flat.shape, bool)
+                    moved[:, end] = current[:, start]
+                    if not moved.any():
+                        break
+                    attacked |= moved
+                    current = moved & empty
+        return attacked.reshape(len(self), 8, 8)
+
+    """
+    Attack maps of the side that is not to move, the squares the side to move's king can't go to. Like
+    ChessEngine.GameState.getEnemyAttackMap the king doesn't block, so it can't step back along a check"""
+    def getEnemyAttackMaps(self):
+        white = self.getAttackMaps(True, throughKing=True)
+        black = self.getAttackMaps(False, throughKing=True)
+        return np.where(self.whiteToMove[:, None, None], black, white)
+
+    """
+    Whether the side to move is in check on each board"""
+    def getInCheck(self):
+        kings = self.pieces == np.where(self.whiteToMove, KING, -KING).astype(np.int8)[:, None, None]
+        return (kings & self.getEnemyAttackMaps()).any(axis=(1, 2))
+
+    """
+    N x 64 x 64 bool pseudo-legal move masks, masks[i, start, end] is set when the side to move on board i can move
+    from start to end. A pawn move to the last rank stands for all four promotions"""
+    def getMoveMasks(self):
+        count = len(self)
+        sign = np.where(self.whiteToMove, 1, -1).astype(np.int8)[:, None]
+        own = self.pieces.reshape(count, 64) * sign # pieces of the side to move are positive
+        empty = own == 0
+        notOwn = own <= 0
+        enemy = own < 0
+        masks = np.zeros((count, 64, 64), bool)
+
+        for steps, code in ((KNIGHT_STEPS, KNIGHT), (KING_STEPS, KING)):
+            isPiece = own == code
+            for start, end in steps:
+                masks[:, start, end] |= isPiece[:, start] & notOwn[:, end]
+
+        for raySteps, code in ((ROOK_RAY_STEPS, ROOK), (BISHOP_RAY_STEPS, BISHOP)):
+            isSlider = (own == code) | (own == QUEEN)
+            for steps in raySteps: # one direction, its squares in order outwards from every start square
+                blocked = np.zeros((count, 64), bool)
+                for start, end in steps:
+                    masks[:, start, end] |= isSlider[:, start] & ~blocked[:, start] & notOwn[:, end]
+                    blocked[:, start] |= ~empty[:, end]
+
+        captureTargets = enemy.copy()
+        hasEnpassant = self.enpassant >= 0
+        captureTargets[np.nonzero(hasEnpassant)[0], self.enpassant[hasEnpassant]] = True
+        for color in (1, -1):
+            pawns = (own == PAWN) & (self.whiteToMove == (color == 1))[:, None]
+            start, end = PAWN_PUSHES[color]
+            masks[:, start, end] |= pawns[:, start] & empty[:, end]
+            start, end = PAWN_DOUBLE_PUSHES[color]
+            masks[:, start, end] |= pawns[:, start] & empty[:, (start + end) // 2] & empty[:, end]
+            for start, end in PAWN_CAPTURES[color]:
+                masks[:, start, end] |= pawns[:, start] & captureTargets[:, end]
+
+            toMove = self.whiteToMove == (color == 1)
+            for rightsColumn, kingSq, kingTarget, rookSq, between in CASTLES[color]:
+                canCastle = toMove & self.castling[:, rightsColumn] & (own[:, kingSq] == KING) & (own[:, rookSq] == ROOK)
+                for sq in between:
+                    canCastle &= empty[:, sq]
+                masks[:, kingSq, kingTarget] |= canCastle
+        return masks
+
+    """
+    Number of pseudo-legal moves of every board, promotions counted once per promotion piece"""
+    def getMoveCounts(self, masks=None):
+        if masks is None:
+            masks = self.getMoveMasks()
+        own = self.pieces.reshape(len(self), 64) * np.where(self.whiteToMove, 1, -1).astype(np.int8)[:, None]
+        promotions = (masks & ((own == PAWN)[:, :, None] & PROMOTION_ROWS[None, None, :])).sum(axis=(1, 2))
+        return masks.sum(axis=(1, 2)) + 3 * promotions
+
+    """
+    The move IDs in the mask of board i, with every promotion piece, to compare with GameState.getValidMoveIDs"""
+    def getMoveIDs(self, i, masks=None):
+        if masks is None:
+            masks = self.getMoveMasks()
+        moveIDs = []
+        ownPawn = PAWN if self.whiteToMove[i] else -PAWN
+        for start, end in zip(*np.nonzero(masks[i])):
+            moveID = int(start) | int(end) << 6
+            if self.pieces[i].flat[start] == ownPawn and PROMOTION_ROWS[end]:
+                moveIDs.extend(moveID | code << 12 for code in range(1, 5))
+            else:
+                moveIDs.append(moveID)
+        return moveIDs
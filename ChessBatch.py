@@ -0,0 +1,233 @@
+"""
+Headless bulk analysis of positions, without pygame. Reads a FEN/EPD list (one position per line) or a PGN file (every
+position of every game) as a stream, works out the legal move count and the check status of each position, and
+optionally an engine evaluation, and writes one JSON object per line as it goes.
+
+Memory stays bounded whatever the size of the input: positions and games are read lazily, handed to the workers in
+chunks (a game is replayed by the worker) and only a fixed number of chunks is in flight at once. The output is
+written in input order and flushed as it goes, so it is its own checkpoint: --resume continues after the line or
+game ply of the last finished line.
+
+    python -m Chess.ChessBatch positions.fen --output results.jsonl --workers 8
+    python -m Chess.ChessBatch games.pgn --output results.jsonl --eval-depth 3 --resume
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import takewhile
+
+from Chess import ChessParallel, ChessPerft, ChessPGN
+
+CHUNK_SIZE = 64 # positions per task sent to a worker
+CHUNKS_IN_FLIGHT_PER_WORKER = 2 # how far reading may run ahead of the workers
+
+"""
+Generator of the tasks of a FEN/EPD file, one (record, fen, None, 0) per position, record describes where it came
+from"""
+def readFENPositions(lines):
+    for lineNumber, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        fields = line.split(";")[0].split()
+        # an EPD line has 4 fields and operations ("bm e4", "hmvc 0"), a FEN line has the 2 move counters there
+        yield {"line": lineNumber}, " ".join(fields[:4] + list(takewhile(str.isdigit, fields[4:6]))), None, 0
+
+"""
+Generator of the tasks of a PGN file, one (record, starting FEN, SAN moves, 0) per game. Replaying the moves costs
+about as much as analyzing the positions, so it is left to the workers (see analyzeGame)"""
+def readPGNGames(lines):
+    for gameNumber, game in enumerate(ChessPGN.readGames(lines), 1):
+        yield {"game": gameNumber}, game["headers"].get("FEN", ChessPerft.STARTING_FEN), game["moves"], 0
+
+def readTasks(path, inputFormat=None):
+    if inputFormat is None:
+        inputFormat = "pgn" if path.lower().endswith(".pgn") else "fen"
+    with open(path, encoding="utf-8", errors="replace") as inputFile:
+        if inputFormat == "pgn":
+            yield from readPGNGames(inputFile)
+        else:
+            yield from readFENPositions(inputFile)
+
+"""
+Drop the tasks an earlier run finished, lastRecord being the last line of its output: the positions up to its line,
+the games before its game and the plies of that game up to its ply (the whole game when it ended with an error)"""
+def skipFinished(tasks, lastRecord):
+    for record, fen, moves, firstPly in tasks:
+        if moves is None:
+            if record["line"] > lastRecord["line"]:
+                yield record, fen, moves, firstPly
+        elif record["game"] > lastRecord["game"]:
+            yield record, fen, moves, firstPly
+        elif record["game"] == lastRecord["game"] and "error" not in lastRecord and lastRecord["ply"] < len(moves):
+            yield record, fen, moves, lastRecord["ply"] + 1
+
+"""
+Legal move count, check status and the optional evaluation of one position as a dictionary"""
+def analyzePosition(record, fen, engine="list", evalDepth=None, evalTime=None):
+    result = dict(record, fen=fen)
+    if fen is None:
+        return result
+    try:
+        gs = ChessParallel.loadPosition(engine, fen) # the FEN is validated, ValueError says what is wrong
+    except ValueError as error:
+        result["error"] = "bad FEN: %s" % error
+        return result
+    return analyzeGameState(result, gs, evalDepth, evalTime)
+
+"""
+Fill in the analysis of the position of gs, the position is left unchanged"""
+def analyzeGameState(result, gs, evalDepth=None, evalTime=None):
+    try:
+        moves = gs.getValidMoveIDs()
+        result["legalMoves"] = len(moves)
+        result["inCheck"] = gs.inCheck
+        result["status"] = "checkmate" if gs.checkmate else "stalemate" if gs.stalemate else "ongoing"
+        if (evalDepth or evalTime) and len(moves):
+            search = ChessParallel.getWorkerSearcher().search(gs, maxTime=evalTime, maxDepth=evalDepth).toDict()
+            result["eval"] = {key: search[key] for key in ("bestMove", "score", "mateIn", "depth", "pv", "nodes")}
+    except (ValueError, IndexError, KeyError) as error: # one broken position must not stop the run
+        for key in ("legalMoves", "inCheck", "status", "eval"):
+            result.pop(key, None)
+        result["error"] = "analysis failed: %s" % error
+    return result
+
+"""
+Replay a game and analyze the starting position and the position after each move, from firstPly on. A game with a
+bad FEN header or a move that can't be played is reported once with an error and left there"""
+def analyzeGame(record, fen, moves, firstPly=0, engine="list", evalDepth=None, evalTime=None):
+    try:
+        gs = ChessParallel.loadPosition(engine, fen)
+    except ValueError as error:
+        return [dict(record, ply=0, error="bad FEN: %s" % error, fen=None)]
+    results = []
+    if firstPly == 0:
+        results.append(analyzeGameState(dict(record, ply=0, fen=gs.getFEN()), gs, evalDepth, evalTime))
+    for ply, san in enumerate(moves, 1):
+        try:
+            moveID = ChessPGN.parseSAN(gs, san)
+        except ValueError as error:
+            results.append(dict(record, ply=ply, error=str(error), fen=None))
+            break
+        gs.makeMove(gs.moveFromID(moveID))
+        if ply >= firstPly:
+            results.append(analyzeGameState(dict(record, ply=ply, move=san, fen=gs.getFEN()), gs, evalDepth, evalTime))
+    return results
+
+"""
+Worker task, analyzes a chunk of tasks: single positions and whole games"""
+def analyzeChunk(chunk, engine, evalDepth, evalTime):
+    results = []
+    for record, fen, moves, firstPly in chunk:
+        if moves is None:
+            results.append(analyzePosition(record, fen, engine, evalDepth, evalTime))
+        else:
+            results.extend(analyzeGame(record, fen, moves, firstPly, engine, evalDepth, evalTime))
+    return results
+
+"""
+Group the tasks in chunks of about chunkSize positions, a game counts for the positions it has left to analyze"""
+def makeChunks(tasks, chunkSize):
+    chunk = []
+    positions = 0
+    for task in tasks:
+        chunk.append(task)
+        positions += 1 if task[2] is None else len(task[2]) + 1 - task[3]
+        if positions >= chunkSize:
+            yield chunk
+            chunk = []
+            positions = 0
+    if chunk:
+        yield chunk
+
+"""
+Number of complete lines of an earlier run's output and the last of them as a dictionary (None when there is none).
+A line cut off by a crash is removed so appending continues on a clean line"""
+def countFinished(outputPath):
+    if not os.path.exists(outputPath):
+        return 0, None
+    finished = 0
+    goodLength = 0
+    lastLine = None
+    with open(outputPath, "rb") as outputFile:
+        for line in outputFile:
+            if not line.endswith(b"\n"):
+                break
+            finished += 1
+            goodLength += len(line)
+            lastLine = line
+    if goodLength != os.path.getsize(outputPath):
+        with open(outputPath, "r+b") as outputFile:
+            outputFile.truncate(goodLength)
+    return finished, json.loads(lastLine) if lastLine is not None else None
+
+"""
+Generator of the analysis results of the tasks in input order. With one worker everything runs in this process,
+otherwise a process pool analyzes the chunks while at most workers * CHUNKS_IN_FLIGHT_PER_WORKER of them are pending"""
+def analyzeTasks(tasks, workers=1, engine="list", evalDepth=None, evalTime=None, chunkSize=CHUNK_SIZE):
+    chunks = makeChunks(tasks, chunkSize)
+    if workers <= 1:
+        for chunk in chunks:
+            yield from analyzeChunk(chunk, engine, evalDepth, evalTime)
+        return
+    with ProcessPoolExecutor(workers) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(analyzeChunk, chunk, engine, evalDepth, evalTime))
+            if len(pending) >= workers * CHUNKS_IN_FLIGHT_PER_WORKER:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze the positions of a FEN list or PGN file, JSON lines out")
+    parser.add_argument("input", help="FEN/EPD file (one position per line) or PGN file")
+    parser.add_argument("--format", choices=("fen", "pgn"), default=None, help="input format, by default from the extension")
+    parser.add_argument("--output", default=None, help="JSON lines file to write, standard output when not given")
+    parser.add_argument("--resume", action="store_true", help="continue an interrupted run, appending to --output")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes")
+    parser.add_argument("--chunk", type=int, default=CHUNK_SIZE, help="positions per worker task")
+    parser.add_argument("--engine", choices=sorted(ChessPerft.ENGINES), default="bitboard")
+    parser.add_argument("--eval-depth", type=int, default=None, help="also search every position to this depth")
+    parser.add_argument("--eval-time", type=float, default=None, help="also search every position for this many seconds")
+    args = parser.parse_args(argv)
+
+    skip = 0
+    lastRecord = None
+    if args.output is None:
+        outputFile = sys.stdout
+    else:
+        if args.resume:
+            skip, lastRecord = countFinished(args.output)
+        outputFile = open(args.output, "a" if args.resume else "w", encoding="utf-8")
+    tasks = readTasks(args.input, args.format)
+    if lastRecord is not None:
+        tasks = skipFinished(tasks, lastRecord)
+    start = time.perf_counter()
+    count = 0
+    errors = 0
+    try:
+        for count, result in enumerate(analyzeTasks(tasks, args.workers, args.engine, args.eval_depth,
+                                                    args.eval_time, args.chunk), 1):
+            if "error" in result:
+                errors += 1
+            outputFile.write(json.dumps(result) + "\n")
+            if count % args.chunk == 0:
+                outputFile.flush()
+    finally:
+        outputFile.flush()
+        if outputFile is not sys.stdout:
+            outputFile.close()
+    seconds = time.perf_counter() - start
+    summary = {"summary": True, "skipped": skip, "positions": count, "errors": errors, "seconds": round(seconds, 6),
+               "positionsPerSecond": int(count / seconds) if seconds > 0 else None}
+    print(json.dumps(summary), file=sys.stderr, flush=True) # errors are in the output, they don't fail the run
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
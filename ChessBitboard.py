@@ -0,0 +1,703 @@
+"""
+Bitboard backed GameState. Every piece type of every color is stored as a 64 bit integer with one bit per square
+(bit index = row * 8 + col, so bit 0 is a8 and bit 63 is h1), plus an occupancy mask per color. Attacks come from
+tables built once at import time and sliding pieces find their blocker with a single bit scan per direction.
+
+It has the same getValidMoves / makeMove / undoMove API as ChessEngine.GameState and keeps the 8x8 board list in
+sync, so ChessMain and every other caller can use either engine.
+"""
+
+from array import array
+
+from Chess import ChessEngine
+
+FULL_BOARD = (1 << 64) - 1
+
+# (row, col) of every square index
+SQUARE_COORDS = tuple(divmod(sq, 8) for sq in range(64))
+
+"""
+For every square, the mask of squares reached by one step with each of the offsets"""
+def buildStepTable(offsets):
+    table = []
+    for r, c in SQUARE_COORDS:
+        mask = 0
+        for dr, dc in offsets:
+            if 0 <= r + dr < 8 and 0 <= c + dc < 8:
+                mask |= 1 << ((r + dr) * 8 + c + dc)
+        table.append(mask)
+    return tuple(table)
+
+KNIGHT_ATTACKS = buildStepTable(((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)))
+KING_ATTACKS = buildStepTable(((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)))
+# squares a pawn of the given color standing on the square attacks
+PAWN_ATTACKS = {"w": buildStepTable(((-1, -1), (-1, 1))), "b": buildStepTable(((1, -1), (1, 1)))}
+
+# the first four directions are orthogonal (rook), the last four diagonal (bishop)
+DIRECTIONS = ((1, 0), (0, 1), (-1, 0), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1))
+ROOK_DIRECTIONS = (0, 1, 2, 3)
+BISHOP_DIRECTIONS = (4, 5, 6, 7)
+# rays going to higher square indexes find their first blocker with the lowest set bit, the others with the highest
+POSITIVE_DIRECTIONS = tuple(d[0] * 8 + d[1] > 0 for d in DIRECTIONS)
+
+"""
+RAYS[direction][square] is the mask of all squares from the square to the edge of the board (square excluded)"""
+def buildRays():
+    rays = []
+    for dr, dc in DIRECTIONS:
+        table = []
+        for r, c in SQUARE_COORDS:
+            mask = 0
+            endRow, endCol = r + dr, c + dc
+            while 0 <= endRow < 8 and 0 <= endCol < 8:
+                mask |= 1 << (endRow * 8 + endCol)
+                endRow += dr
+                endCol += dc
+            table.append(mask)
+        rays.append(tuple(table))
+    return tuple(rays)
+
+RAYS = buildRays()
+
+"""
+BETWEEN[a][b] is the mask of the squares strictly between a and b when they share a line, otherwise 0"""
+def buildBetween():
+    between = [[0] * 64 for _ in range(64)]
+    for start in range(64):
+        for d in range(8):
+            ray = RAYS[d][start]
+            mask = 0
+            while ray:
+                if POSITIVE_DIRECTIONS[d]:
+                    end = (ray & -ray).bit_length() - 1
+                else:
+                    end = ray.bit_length() - 1
+                between[start][end] = mask
+                mask |= 1 << end
+                ray ^= 1 << end
+    return tuple(tuple(row) for row in between)
+
+BETWEEN = buildBetween()
+
+"""
+Attacks of a sliding piece on square sq along the given directions, stopping at the first occupied square"""
+def slidingAttacks(sq, occupied, directions):
+    attacks = 0
+    for d in directions:
+        ray = RAYS[d][sq]
+        blockers = ray & occupied
+        if blockers:
+            if POSITIVE_DIRECTIONS[d]:
+                first = (blockers & -blockers).bit_length() - 1
+            else:
+                first = blockers.bit_length() - 1
+            ray ^= RAYS[d][first]
+        attacks |= ray
+    return attacks
+
+def rookAttacks(sq, occupied):
+    return slidingAttacks(sq, occupied, ROOK_DIRECTIONS)
+
+def bishopAttacks(sq, occupied):
+    return slidingAttacks(sq, occupied, BISHOP_DIRECTIONS)
+
+# castling: (rights attribute, king start, king end, squares that must be empty, squares that can't be attacked)
+CASTLES = {
+    "w": (("wks", 60, 62, (1 << 61) | (1 << 62), (61, 62)),
+          ("wqs", 60, 58, (1 << 57) | (1 << 58) | (1 << 59), (59, 58))),
+    "b": (("bks", 4, 6, (1 << 5) | (1 << 6), (5, 6)),
+          ("bqs", 4, 2, (1 << 1) | (1 << 2) | (1 << 3), (3, 2))),
+}
+
+# promotion part of a move ID for each promotion piece, see ChessEngine.Move
+PROMOTION_BITS = tuple(code << 12 for code in sorted(ChessEngine.Move.promotionCodes.values()))
+
+# piece type of each promotion code, and the attacker part of the MVV-LVA score of a pawn
+PROMOTION_TYPES = (None,) + ChessEngine.Move.promotionPieces
+PAWN_ORDER_PENALTY = ChessEngine.MVV_LVA_VALUES["p"] // 10
+
+# squares not on the a file and not on the h file, a pawn there can capture towards that side
+NOT_FILE_A = sum(1 << sq for sq in range(64) if sq & 7 != 0)
+NOT_FILE_H = sum(1 << sq for sq in range(64) if sq & 7 != 7)
+
+PIECES = ("wp", "wN", "wB", "wR", "wQ", "wK", "bp", "bN", "bB", "bR", "bQ", "bK")
+
+
+class GameState(ChessEngine.GameState):
+    def __init__(self):
+        super().__init__()
+        self.loadBitboards()
+
+    def loadFEN(self, fen):
+        super().loadFEN(fen)
+        self.loadBitboards()
+
+    """
+    Build the piece bitboards and occupancy masks from the 8x8 board list"""
+    def loadBitboards(self):
+        self.pieces = {piece: 0 for piece in PIECES}
+        self.occupancy = {"w": 0, "b": 0}
+        for sq, (r, c) in enumerate(SQUARE_COORDS):
+            piece = self.board[r][c]
+            if piece != "--":
+                self.pieces[piece] |= 1 << sq
+                self.occupancy[piece[0]] |= 1 << sq
+
+    """
+    Takes a move as a parameter and executes it on the bitboards and the board list"""
+    def makeMove(self, move):
+        board = self.board
+        pieces = self.pieces
+        occupancy = self.occupancy
+        pieceMoved = move.pieceMoved
+        pieceCaptured = move.pieceCaptured
+        allyColor = pieceMoved[0]
+        enemyColor = "b" if allyColor == "w" else "w"
+        startBit = 1 << (move.startRow * 8 + move.startCol)
+        endBit = 1 << (move.endRow * 8 + move.endCol)
+
+        pieces[pieceMoved] ^= startBit
+        occupancy[allyColor] ^= startBit | endBit
+        board[move.startRow][move.startCol] = "--"
+        if move.isEnpassantMove: # the captured pawn is beside the start square
+            captureBit = 1 << (move.startRow * 8 + move.endCol)
+            pieces[pieceCaptured] ^= captureBit
+            occupancy[enemyColor] ^= captureBit
+            board[move.startRow][move.endCol] = "--"
+        elif pieceCaptured != "--":
+            pieces[pieceCaptured] ^= endBit
+            occupancy[enemyColor] ^= endBit
+        piecePlaced = allyColor + move.promotionChoice if move.isPawnPromotion else pieceMoved
+        pieces[piecePlaced] ^= endBit
+        board[move.endRow][move.endCol] = piecePlaced
+
+        if pieceMoved[1] == "K":
+            if allyColor == "w":
+                self.whiteKingLocation = (move.endRow, move.endCol)
+            else:
+                self.blackKingLocation = (move.endRow, move.endCol)
+            if move.isCastleMove:
+                self.moveCastleRook(move, allyColor)
+
+        if pieceMoved[1] == "p" and abs(move.startRow - move.endRow) == 2:
+            self.enpassantPossible = self.getEnpassantSquare(move.startRow, move.endRow, move.startCol)
+        else:
+            self.enpassantPossible = ()
+        self.enpassantPossibleLog.append(self.enpassantPossible)
+        self.updateCastleRights(move)
+        self.castleRightsLog.append(self.currentCastlingRight.copy())
+        self.updateZobristKey(move)
+
+        self.moveLog.append(move)
+        self.whiteToMove = not self.whiteToMove
+        self.enemyAttackMap = None
+
+    def undoMove(self):
+        if len(self.moveLog) != 0:
+            move = self.moveLog.pop()
+            self.whiteToMove = not self.whiteToMove
+            self.enemyAttackMap = None
+            board = self.board
+            pieces = self.pieces
+            occupancy = self.occupancy
+            pieceMoved = move.pieceMoved
+            pieceCaptured = move.pieceCaptured
+            allyColor = pieceMoved[0]
+            enemyColor = "b" if allyColor == "w" else "w"
+            startBit = 1 << (move.startRow * 8 + move.startCol)
+            endBit = 1 << (move.endRow * 8 + move.endCol)
+
+            piecePlaced = allyColor + move.promotionChoice if move.isPawnPromotion else pieceMoved
+            pieces[piecePlaced] ^= endBit
+            pieces[pieceMoved] ^= startBit
+            occupancy[allyColor] ^= startBit | endBit
+            board[move.startRow][move.startCol] = pieceMoved
+            if move.isEnpassantMove:
+                captureBit = 1 << (move.startRow * 8 + move.endCol)
+                pieces[pieceCaptured] ^= captureBit
+                occupancy[enemyColor] ^= captureBit
+                board[move.startRow][move.endCol] = pieceCaptured
+                board[move.endRow][move.endCol] = "--"
+            else:
+                if pieceCaptured != "--":
+                    pieces[pieceCaptured] ^= endBit
+                    occupancy[enemyColor] ^= endBit
+                board[move.endRow][move.endCol] = pieceCaptured
+
+            if pieceMoved[1] == "K":
+                if allyColor == "w":
+                    self.whiteKingLocation = (move.startRow, move.startCol)
+                else:
+                    self.blackKingLocation = (move.startRow, move.startCol)
+                if move.isCastleMove:
+                    self.moveCastleRook(move, allyColor)
+
+            self.enpassantPossibleLog.pop()
+            self.enpassantPossible = self.enpassantPossibleLog[-1]
+            self.castleRightsLog.pop()
+            self.currentCastlingRight = self.castleRightsLog[-1].copy()
+            self.zobristKeyLog.pop()
+            self.zobristKey = self.zobristKeyLog[-1]
+            self.checkmate = False
+            self.stalemate = False
+
+    """
+    Move the rook of a castle move, it toggles so the same call also puts the rook back on undo"""
+    def moveCastleRook(self, move, allyColor):
+        r = move.endRow
+        if move.endCol - move.startCol == 2: # king side
+            rookStart, rookEnd = 7, 5
+        else: # queen side
+            rookStart, rookEnd = 0, 3
+        rook = allyColor + "R"
+        rookBits = (1 << (r * 8 + rookStart)) | (1 << (r * 8 + rookEnd))
+        self.pieces[rook] ^= rookBits
+        self.occupancy[allyColor] ^= rookBits
+        if self.board[r][rookStart] == rook:
+            self.board[r][rookStart] = "--"
+            self.board[r][rookEnd] = rook
+        else:
+            self.board[r][rookEnd] = "--"
+            self.board[r][rookStart] = rook
+
+    """
+    Bitboard of the pieces of the given color attacking square sq with the given occupancy"""
+    def attackersTo(self, sq, occupied, color):
+        pieces = self.pieces
+        queens = pieces[color + "Q"]
+        return (PAWN_ATTACKS["b" if color == "w" else "w"][sq] & pieces[color + "p"]) | \
+               (KNIGHT_ATTACKS[sq] & pieces[color + "N"]) | \
+               (KING_ATTACKS[sq] & pieces[color + "K"]) | \
+               (rookAttacks(sq, occupied) & (pieces[color + "R"] | queens)) | \
+               (bishopAttacks(sq, occupied) & (pieces[color + "B"] | queens))
+
+    """
+    Bitboard of every square attacked by the given color with the given occupancy"""
+    def attackedSquares(self, color, occupied):
+        pieces = self.pieces
+        attacks = 0
+        pawnAttacks = PAWN_ATTACKS[color]
+        bb = pieces[color + "p"]
+        while bb:
+            low = bb & -bb
+            attacks |= pawnAttacks[low.bit_length() - 1]
+            bb ^= low
+        bb = pieces[color + "N"]
+        while bb:
+            low = bb & -bb
+            attacks |= KNIGHT_ATTACKS[low.bit_length() - 1]
+            bb ^= low
+        queens = pieces[color + "Q"]
+        bb = pieces[color + "R"] | queens
+        while bb:
+            low = bb & -bb
+            attacks |= rookAttacks(low.bit_length() - 1, occupied)
+            bb ^= low
+        bb = pieces[color + "B"] | queens
+        while bb:
+            low = bb & -bb
+            attacks |= bishopAttacks(low.bit_length() - 1, occupied)
+            bb ^= low
+        attacks |= KING_ATTACKS[pieces[color + "K"].bit_length() - 1]
+        return attacks
+
+    """
+    Returns if the player is in check, a list of pins, and a list of checks (same format as ChessEngine)"""
+    def checkForPinsAndChecks(self):
+        allyColor = "w" if self.whiteToMove else "b"
+        enemyColor = "b" if self.whiteToMove else "w"
+        kingSq = self.pieces[allyColor + "K"].bit_length() - 1
+        kingRow, kingCol = SQUARE_COORDS[kingSq]
+        occupied = self.occupancy["w"] | self.occupancy["b"]
+        checks = []
+        checkers = self.attackersTo(kingSq, occupied, enemyColor)
+        while checkers:
+            low = checkers & -checkers
+            r, c = SQUARE_COORDS[low.bit_length() - 1]
+            dr, dc = r - kingRow, c - kingCol
+            if self.board[r][c][1] != "N":
+                dr, dc = (dr > 0) - (dr < 0), (dc > 0) - (dc < 0)
+            checks.append((r, c, dr, dc))
+            checkers ^= low
+        pins = []
+        for sq, pinMask in self.getPins(kingSq, allyColor, enemyColor).items():
+            r, c = SQUARE_COORDS[sq]
+            dr, dc = r - kingRow, c - kingCol
+            pins.append((r, c, (dr > 0) - (dr < 0), (dc > 0) - (dc < 0)))
+        return len(checks) > 0, pins, checks
+
+    """
+    Dictionary of pinned square to the mask of squares that piece can still move to (the pin line)"""
+    def getPins(self, kingSq, allyColor, enemyColor):
+        pieces = self.pieces
+        ally = self.occupancy[allyColor]
+        enemy = self.occupancy[enemyColor]
+        queens = pieces[enemyColor + "Q"]
+        # x-ray through our own pieces: attacks from the king with only the enemy pieces as blockers
+        snipers = (rookAttacks(kingSq, enemy) & (pieces[enemyColor + "R"] | queens)) | \
+                  (bishopAttacks(kingSq, enemy) & (pieces[enemyColor + "B"] | queens))
+        pins = {}
+        while snipers:
+            low = snipers & -snipers
+            sniperSq = low.bit_length() - 1
+            blockers = BETWEEN[kingSq][sniperSq] & ally
+            if blockers and not blockers & (blockers - 1): # exactly one of our pieces in between
+                pins[blockers.bit_length() - 1] = BETWEEN[kingSq][sniperSq] | low
+            snipers ^= low
+        return pins
+
+    """All moves considering checks"""
+    def getValidMoves(self):
+        return [self.moveFromID(moveID) for moveID in self.getValidMoveIDs()]
+
+    """
+    All valid moves as packed move IDs (see ChessEngine.Move). The bitboards produce the IDs directly, so no Move
+    object is allocated for a move until it is actually played"""
+    def generateMoveIDs(self):
+        moves = []
+        pieces = self.pieces
+        allyColor = "w" if self.whiteToMove else "b"
+        enemyColor = "b" if self.whiteToMove else "w"
+        ally = self.occupancy[allyColor]
+        enemy = self.occupancy[enemyColor]
+        occupied = ally | enemy
+        empty = ~occupied & FULL_BOARD
+        kingSq = pieces[allyColor + "K"].bit_length() - 1
+
+        checkers = self.attackersTo(kingSq, occupied, enemyColor)
+        self.inCheck = checkers != 0
+        # squares the king can't go to, sliders see through the king so it can't step back along a check ray
+        danger = self.attackedSquares(enemyColor, occupied ^ (1 << kingSq))
+
+        targets = KING_ATTACKS[kingSq] & ~ally & ~danger
+        while targets:
+            low = targets & -targets
+            moves.append(kingSq | (low.bit_length() - 1) << 6)
+            targets ^= low
+
+        if checkers & (checkers - 1) == 0: # not in double check, so other pieces can move
+            if checkers:
+                # capture the checking piece or block between it and the king
+                checkerSq = checkers.bit_length() - 1
+                checkMask = checkers | BETWEEN[kingSq][checkerSq]
+            else:
+                checkMask = FULL_BOARD
+                self.generateCastleMoves(kingSq, allyColor, occupied, danger, moves)
+            pins = self.getPins(kingSq, allyColor, enemyColor)
+            self.generatePawnMoves(allyColor, enemyColor, kingSq, occupied, empty, checkMask, pins, moves)
+            targetMask = ~ally & checkMask
+            queens = pieces[allyColor + "Q"]
+            for bb, pieceType in ((pieces[allyColor + "N"], "N"), (pieces[allyColor + "B"] | queens, "B"),
+                                  (pieces[allyColor + "R"] | queens, "R")):
+                while bb:
+                    low = bb & -bb
+                    sq = low.bit_length() - 1
+                    if pieceType == "N":
+                        if sq in pins: # a pinned knight can never move
+                            bb ^= low
+                            continue
+                        targets = KNIGHT_ATTACKS[sq] & targetMask
+                    elif pieceType == "B":
+                        targets = bishopAttacks(sq, occupied) & targetMask
+                    else:
+                        targets = rookAttacks(sq, occupied) & targetMask
+                    if sq in pins:
+                        targets &= pins[sq]
+                    while targets:
+                        target = targets & -targets
+                        moves.append(sq | (target.bit_length() - 1) << 6)
+                        targets ^= target
+                    bb ^= low
+
+        if len(moves) == 0:
+            self.checkmate = self.inCheck
+            self.stalemate = not self.inCheck
+        else:
+            self.checkmate = False
+            self.stalemate = False
+        return array("H", moves)
+
+    """Get all the pawn moves for the side to move and add their move IDs to the list"""
+    def generatePawnMoves(self, allyColor, enemyColor, kingSq, occupied, empty, checkMask, pins, moves):
+        enemy = self.occupancy[enemyColor]
+        if allyColor == "w":
+            step = -8
+            startRank = 6
+            lastRank = 0
+        else:
+            step = 8
+            startRank = 1
+            lastRank = 7
+        pawnAttacks = PAWN_ATTACKS[allyColor]
+        enpassantSq = -1
+        if self.enpassantPossible:
+            enpassantSq = self.enpassantPossible[0] * 8 + self.enpassantPossible[1]
+        bb = self.pieces[allyColor + "p"]
+        while bb:
+            low = bb & -bb
+            sq = low.bit_length() - 1
+            bb ^= low
+            mask = checkMask & pins[sq] if sq in pins else checkMask
+            targets = pawnAttacks[sq] & enemy
+            oneStep = sq + step
+            if (empty >> oneStep) & 1:
+                targets |= 1 << oneStep
+                if sq >> 3 == startRank and (empty >> (oneStep + step)) & 1:
+                    targets |= 1 << (oneStep + step)
+            targets &= mask
+            while targets:
+                target = targets & -targets
+                moveID = sq | (target.bit_length() - 1) << 6
+                if (target.bit_length() - 1) >> 3 == lastRank:
+                    for promotion in PROMOTION_BITS:
+                        moves.append(moveID | promotion)
+                else:
+                    moves.append(moveID)
+                targets ^= target
+            if enpassantSq >= 0 and (pawnAttacks[sq] >> enpassantSq) & 1:
+                # play the capture on the occupancy and make sure nothing attacks the king afterwards,
+                # this covers pins, checks and the two pawns leaving the same rank at once
+                captureSq = enpassantSq - step
+                after = occupied ^ low ^ (1 << captureSq) | (1 << enpassantSq)
+                if self.attackersTo(kingSq, after, enemyColor) & ~(1 << captureSq) == 0:
+                    moves.append(sq | enpassantSq << 6)
+
+    """
+    Generate the castle moves for the king on kingSq, the king is not in check"""
+    def generateCastleMoves(self, kingSq, allyColor, occupied, danger, moves):
+        for right, kingStart, kingEnd, emptyMask, safeSquares in CASTLES[allyColor]:
+            if getattr(self.currentCastlingRight, right) and kingSq == kingStart and not occupied & emptyMask:
+                if not (danger >> safeSquares[0]) & 1 and not (danger >> safeSquares[1]) & 1:
+                    moves.append(kingStart | kingEnd << 6)
+
+    """
+    Staged move picker for the search, see ChessEngine.GameState.getStagedMoveIDs. Here every stage comes straight
+    from the attack masks: captures are the legal targets on enemy pieces, quiet moves the legal targets on empty
+    squares, where the legal targets of a piece are cut down by the check and pin masks"""
+    def getStagedMoveIDs(self, hashMove=None, killers=(), history=None):
+        enemyColor = "b" if self.whiteToMove else "w"
+        kingSq = self.pieces[("w" if self.whiteToMove else "b") + "K"].bit_length() - 1
+        checkers = self.attackersTo(kingSq, self.occupancy["w"] | self.occupancy["b"], enemyColor)
+        self.inCheck = checkers != 0
+        return self.stagedMoveIDs(hashMove, killers, history, kingSq, checkers)
+
+    def stagedMoveIDs(self, hashMove, killers, history, kingSq, checkers):
+        board = self.board
+        pieces = self.pieces
+        allyColor = "w" if self.whiteToMove else "b"
+        enemyColor = "b" if self.whiteToMove else "w"
+        ally = self.occupancy[allyColor]
+        enemy = self.occupancy[enemyColor]
+        occupied = ally | enemy
+        empty = ~occupied & FULL_BOARD
+        if not checkers:
+            checkMask = FULL_BOARD
+        elif checkers & (checkers - 1) == 0: # capture the checking piece or block between it and the king
+            checkMask = checkers | BETWEEN[kingSq][checkers.bit_length() - 1]
+        else: # double check, only the king can move
+            checkMask = 0
+        pins = self.getPins(kingSq, allyColor, enemyColor) if checkMask else {}
+        step = -8 if allyColor == "w" else 8
+        startRank = 6 if allyColor == "w" else 1
+        lastRankMask = 0xFF if allyColor == "w" else 0xFF << 56
+        pawnAttacks = PAWN_ATTACKS[allyColor]
+        enpassantSq = self.enpassantPossible[0] * 8 + self.enpassantPossible[1] if self.enpassantPossible else -1
+        notAlly = ~ally & FULL_BOARD
+        # pawn moves as shifts of the whole bitboard: white moves to lower square indexes, black to higher ones
+        if allyColor == "w":
+            forward = lambda bb, n: bb >> n
+            leftShift, rightShift, leftBack, rightBack, pushBack = 9, 7, 9, 7, 8
+            doubleRankMask = 0xFF << 40 # a pawn that moved one step from the 2nd rank
+        else:
+            forward = lambda bb, n: (bb << n) & FULL_BOARD
+            leftShift, rightShift, leftBack, rightBack, pushBack = 7, 9, -7, -9, -8
+            doubleRankMask = 0xFF << 16
+        danger = [] # squares the king can't go to, worked out the first time a king move needs them
+
+        def getDanger():
+            if not danger:
+                danger.append(self.attackedSquares(enemyColor, occupied ^ (1 << kingSq)))
+            return danger[0]
+
+        # legal target squares of the piece on sq, castling and en passant aside
+        def getTargets(sq, pieceType):
+            if pieceType == "K":
+                return KING_ATTACKS[sq] & ~ally & ~getDanger()
+            if pieceType == "p":
+                targets = pawnAttacks[sq] & enemy
+                oneStep = sq + step
+                if (empty >> oneStep) & 1:
+                    targets |= 1 << oneStep
+                    if sq >> 3 == startRank and (empty >> (oneStep + step)) & 1:
+                        targets |= 1 << (oneStep + step)
+            elif pieceType == "N":
+                targets = KNIGHT_ATTACKS[sq]
+            elif pieceType == "B":
+                targets = bishopAttacks(sq, occupied)
+            elif pieceType == "R":
+                targets = rookAttacks(sq, occupied)
+            else:
+                targets = rookAttacks(sq, occupied) | bishopAttacks(sq, occupied)
+            targets &= ~ally & checkMask
+            if sq in pins:
+                targets &= pins[sq]
+            return targets
+
+        # play the capture on the occupancy, nothing may attack the king afterwards (pins, checks, both pawns
+        # leaving the rank at once)
+        def isEnpassantLegal(sq):
+            captureSq = enpassantSq - step
+            after = occupied ^ (1 << sq) ^ (1 << captureSq) | (1 << enpassantSq)
+            return self.attackersTo(kingSq, after, enemyColor) & ~(1 << captureSq) == 0
+
+        def getCastleMoves():
+            moves = []
+            if not checkers:
+                self.generateCastleMoves(kingSq, allyColor, occupied, getDanger(), moves)
+            return moves
+
+        # a hash or killer move may come from another position, check it like the generator would have made it
+        def isValid(moveID, quietOnly):
+            startSq = moveID & 63
+            endSq = moveID >> 6 & 63
+            promotion = moveID >> 12
+            piece = board[startSq >> 3][startSq & 7]
+            if piece[0] != allyColor or promotion > 4:
+                return False
+            pieceType = piece[1]
+            if pieceType == "p" and endSq == enpassantSq and (pawnAttacks[startSq] >> endSq) & 1:
+                return not quietOnly and not promotion and isEnpassantLegal(startSq)
+            if pieceType == "K" and abs(endSq - startSq) == 2:
+                return moveID in getCastleMoves()
+            if (pieceType == "p" and (lastRankMask >> endSq) & 1) != (promotion != 0):
+                return False
+            if quietOnly and (promotion or not (empty >> endSq) & 1):
+                return False
+            return (getTargets(startSq, pieceType) >> endSq) & 1 == 1
+
+        if hashMove is not None and isValid(hashMove, False):
+            yield hashMove
+
+        # captures and promotions as (score, move ID), the unpinned pawns are shifted all at once
+        values = ChessEngine.MVV_LVA_VALUES
+        captures = []
+        quietTargets = [] # (square, legal quiet targets) of the pieces other than pawns, for the quiet stage
+        pinned = 0
+        for sq in pins:
+            pinned |= 1 << sq
+        pawns = pieces[allyColor + "p"]
+        freePawns = pawns & ~pinned
+        if checkMask:
+            for targets, back in ((forward(freePawns & NOT_FILE_A, leftShift) & enemy & checkMask, leftBack),
+                                  (forward(freePawns & NOT_FILE_H, rightShift) & enemy & checkMask, rightBack),
+                                  (forward(freePawns, 8) & empty & lastRankMask & checkMask, pushBack)):
+                while targets:
+                    target = targets & -targets
+                    endSq = target.bit_length() - 1
+                    moveID = (endSq + back) | endSq << 6
+                    victim = board[endSq >> 3][endSq & 7]
+                    score = values[victim[1] if victim != "--" else "p"] * 10 - PAWN_ORDER_PENALTY # like getCaptureScore
+                    if target & lastRankMask:
+                        captures.extend((score + values[PROMOTION_TYPES[promotion >> 12]] * 10, moveID | promotion)
+                                        for promotion in PROMOTION_BITS)
+                    else:
+                        captures.append((score, moveID))
+                    targets ^= target
+            bb = pawns & pinned
+            while bb:
+                low = bb & -bb
+                sq = low.bit_length() - 1
+                bb ^= low
+                targets = getTargets(sq, "p") & (enemy | lastRankMask)
+                while targets:
+                    target = targets & -targets
+                    endSq = target.bit_length() - 1
+                    captures.extend((ChessEngine.getCaptureScore(self, moveID), moveID) for moveID in
+                                    ((sq | endSq << 6 | promotion for promotion in PROMOTION_BITS)
+                                     if target & lastRankMask else (sq | endSq << 6,)))
+                    targets ^= target
+            if enpassantSq >= 0:
+                bb = PAWN_ATTACKS[enemyColor][enpassantSq] & pawns
+                while bb:
+                    low = bb & -bb
+                    sq = low.bit_length() - 1
+                    bb ^= low
+                    if isEnpassantLegal(sq):
+                        captures.append((values["p"] * 10 - PAWN_ORDER_PENALTY, sq | enpassantSq << 6))
+            queens = pieces[allyColor + "Q"]
+            for pieceType in ("N", "B", "R", "Q"):
+                penalty = values[pieceType] // 10
+                bb = pieces[allyColor + pieceType]
+                while bb:
+                    low = bb & -bb
+                    sq = low.bit_length() - 1
+                    bb ^= low
+                    if pieceType == "N":
+                        if low & pinned: # a pinned knight can never move
+                            continue
+                        targets = KNIGHT_ATTACKS[sq] & notAlly & checkMask
+                    else:
+                        if pieceType == "B":
+                            targets = bishopAttacks(sq, occupied)
+                        elif pieceType == "R":
+                            targets = rookAttacks(sq, occupied)
+                        else:
+                            targets = rookAttacks(sq, occupied) | bishopAttacks(sq, occupied)
+                        targets &= notAlly & checkMask
+                        if low & pinned:
+                            targets &= pins[sq]
+                    quietTargets.append((sq, targets & empty))
+                    targets &= enemy
+                    while targets:
+                        target = targets & -targets
+                        endSq = target.bit_length() - 1
+                        captures.append((values[board[endSq >> 3][endSq & 7][1]] * 10 - penalty, sq | endSq << 6))
+                        targets ^= target
+        kingTargets = KING_ATTACKS[kingSq] & notAlly
+        if kingTargets & enemy:
+            kingTargets &= ~getDanger()
+            targets = kingTargets & enemy
+            while targets:
+                target = targets & -targets
+                endSq = target.bit_length() - 1
+                captures.append((values[board[endSq >> 3][endSq & 7][1]] * 10, kingSq | endSq << 6))
+                targets ^= target
+        captures.sort(reverse=True)
+        for score, moveID in captures:
+            if moveID != hashMove:
+                yield moveID
+
+        searched = [hashMove]
+        for moveID in killers:
+            if moveID is not None and moveID not in searched and isValid(moveID, True):
+                searched.append(moveID)
+                yield moveID
+
+        quiets = getCastleMoves()
+        if checkMask:
+            single = forward(freePawns, 8) & empty
+            for targets, back in ((single & ~lastRankMask & checkMask, pushBack),
+                                  (forward(single & doubleRankMask, 8) & empty & checkMask, pushBack * 2)):
+                while targets:
+                    target = targets & -targets
+                    endSq = target.bit_length() - 1
+                    quiets.append((endSq + back) | endSq << 6)
+                    targets ^= target
+            bb = pawns & pinned
+            while bb:
+                low = bb & -bb
+                sq = low.bit_length() - 1
+                bb ^= low
+                quietTargets.append((sq, getTargets(sq, "p") & empty & ~lastRankMask))
+        if kingTargets & empty:
+            quietTargets.append((kingSq, kingTargets & empty & ~getDanger()))
+        for sq, targets in quietTargets:
+            while targets:
+                target = targets & -targets
+                quiets.append(sq | (target.bit_length() - 1) << 6)
+                targets ^= target
+        if history is not None:
+            quiets.sort(key=lambda moveID: (history[moveID & 4095], moveID), reverse=True)
+        for moveID in quiets:
+            if moveID not in searched:
+                yield moveID
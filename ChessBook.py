@@ -0,0 +1,154 @@
+"""
+Opening book on disk. The file is a 16 byte header (magic and record count) followed by fixed width records sorted
+by position:
+
+    zobrist key (8 bytes) | move ID (2 bytes) | weight (2 bytes), big endian
+
+so a position is found by binary search straight in the memory mapped file. Nothing is loaded into the heap, the
+lookup needs no move generation, and every process that opens the same book shares it through the page cache.
+
+    python -m Chess.ChessBook build games.pgn more.pgn --output book.bin --plies 20
+    python -m Chess.ChessBook probe book.bin --fen "<fen>"
+
+    book = OpeningBook("book.bin")
+    moveID = book.getMove(gs) # None when the position is not in the book
+"""
+
+import argparse
+import json
+import mmap
+import os
+import random
+import struct
+import sys
+
+from Chess import ChessEngine, ChessPerft, ChessPGN
+
+BOOK_MAGIC = b"UICBOOK1"
+HEADER = struct.Struct(">8sQ")
+RECORD = struct.Struct(">QHH")
+KEY = struct.Struct(">Q")
+MAX_WEIGHT = 65535
+
+class OpeningBook():
+    def __init__(self, path, seed=None):
+        self.path = path
+        self.file = open(path, "rb")
+        if os.fstat(self.file.fileno()).st_size < HEADER.size: # too short for the header, mmap can't map an empty file
+            self.file.close()
+            raise ValueError("%s is not an opening book" % path)
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.size = HEADER.unpack_from(self.data, 0)
+        if magic != BOOK_MAGIC or len(self.data) != HEADER.size + self.size * RECORD.size:
+            self.close()
+            raise ValueError("%s is not an opening book" % path)
+        self.random = random.Random(seed)
+
+    def close(self):
+        if not self.data.closed:
+            self.data.close()
+        self.file.close()
+
+    def keyAt(self, index):
+        return KEY.unpack_from(self.data, HEADER.size + index * RECORD.size)[0]
+
+    """
+    List of (move ID, weight) stored for a zobrist key, empty when the position is not in the book"""
+    def getMoves(self, key):
+        low, high = 0, self.size
+        while low < high: # first record with a key >= the key
+            middle = (low + high) // 2
+            if self.keyAt(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        moves = []
+        while low < self.size:
+            recordKey, moveID, weight = RECORD.unpack_from(self.data, HEADER.size + low * RECORD.size)
+            if recordKey != key:
+                break
+            moves.append((moveID, weight))
+            low += 1
+        return moves
+
+    """
+    A book move for the position, picked at random by weight (the heaviest when best is True), or None. The move is
+    not checked against getValidMoveIDs, only that it moves a piece of the side to move, which catches the
+    extremely rare hash collision without the cost of move generation"""
+    def getMove(self, gs, best=False):
+        moves = self.getMoves(gs.zobristKey)
+        color = "w" if gs.whiteToMove else "b"
+        moves = [(moveID, weight) for moveID, weight in moves
+                 if weight > 0 and gs.board[(moveID & 63) // 8][moveID & 7][0] == color]
+        if not moves:
+            return None
+        if best:
+            return max(moves, key=lambda move: move[1])[0]
+        return self.random.choices([moveID for moveID, _ in moves], [weight for _, weight in moves])[0]
+
+"""
+Weight of a move from the game result: 2 for the side that won, 1 for a draw or an unknown result, 0 for a loss"""
+def getResultWeight(result, whiteToMove):
+    if result == "1/2-1/2" or result not in ("1-0", "0-1"):
+        return 1
+    return 2 if (result == "1-0") == whiteToMove else 0
+
+"""
+Stream the games of PGN files into a book file: every move of the first maxPly plies adds its result weight to the
+(position, move) record. Only the book itself is held in memory, never a whole PGN file. Returns the number of games
+and records"""
+def buildBook(pgnPaths, outputPath, maxPly=20, minWeight=1, engine="bitboard"):
+    weights = {}
+    games = 0
+    for pgnPath in pgnPaths:
+        with open(pgnPath, encoding="utf-8", errors="replace") as pgnFile:
+            for game in ChessPGN.readGames(pgnFile):
+                games += 1
+                gs = ChessPerft.ENGINES[engine]()
+                gs.loadFEN(game["headers"].get("FEN", ChessPerft.STARTING_FEN))
+                for san in game["moves"][:maxPly]:
+                    try:
+                        moveID = ChessPGN.parseSAN(gs, san)
+                    except ValueError:
+                        break # the rest of a broken game is skipped
+                    record = (gs.zobristKey, moveID)
+                    weights[record] = weights.get(record, 0) + getResultWeight(game["result"], gs.whiteToMove)
+                    gs.makeMove(gs.moveFromID(moveID))
+    records = sorted((key, moveID, min(weight, MAX_WEIGHT)) for (key, moveID), weight in weights.items()
+                     if weight >= minWeight)
+    tempPath = outputPath + ".tmp"
+    with open(tempPath, "wb") as bookFile:
+        bookFile.write(HEADER.pack(BOOK_MAGIC, len(records)))
+        for record in records:
+            bookFile.write(RECORD.pack(*record))
+    os.replace(tempPath, outputPath)
+    return games, len(records)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or look up a memory mapped opening book")
+    subparsers = parser.add_subparsers(dest="mode", required=True)
+    build = subparsers.add_parser("build", help="build a book from PGN files")
+    build.add_argument("pgn", nargs="+")
+    build.add_argument("--output", required=True)
+    build.add_argument("--plies", type=int, default=20, help="book moves taken from the start of every game")
+    build.add_argument("--min-weight", type=int, default=1, help="drop moves with a lower total weight")
+    probe = subparsers.add_parser("probe", help="list the book moves of a position")
+    probe.add_argument("book")
+    probe.add_argument("--fen", default=ChessPerft.STARTING_FEN)
+    args = parser.parse_args(argv)
+
+    if args.mode == "build":
+        games, records = buildBook(args.pgn, args.output, args.plies, args.min_weight)
+        print(json.dumps({"output": args.output, "games": games, "records": records}))
+        return 0
+    book = OpeningBook(args.book)
+    gs = ChessPerft.ENGINES["bitboard"]()
+    gs.loadFEN(args.fen)
+    moves = sorted(book.getMoves(gs.zobristKey), key=lambda move: -move[1])
+    print(json.dumps({"fen": args.fen, "moves": [{"move": ChessEngine.Move.notationFromID(moveID), "weight": weight}
+                                                for moveID, weight in moves]}))
+    book.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
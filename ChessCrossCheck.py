@@ -0,0 +1,134 @@
+"""
+Regression checks that the faster move generators still agree with the plain ones, on positions from random games
+played out of the standard perft positions. Perft only counts the moves; these compare them move by move:
+
+    staged: GameState.getStagedMoveIDs yields exactly getValidMoveIDs, each move once, with any hash move, killers
+            and history, and both engines yield them in the same order
+    arrays: the ChessArrays batch move masks hold every valid move, and the batch evaluation, check status and
+            enemy attack maps equal those of GameState (needs numpy)
+
+Every problem found is printed as one JSON object per line, then a summary line per check. The exit status is 1
+when anything disagrees.
+
+    python -m Chess.ChessCrossCheck                  # every check, 40 random games
+    python -m Chess.ChessCrossCheck --games 200 --seed 7
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+
+from Chess import ChessEngine, ChessPerft
+
+DEFAULT_GAMES = 40
+DEFAULT_PLIES = 80
+
+"""
+FENs of the standard perft positions and of every position of random games played from them, the list engine
+picks the moves"""
+def randomPositions(games=DEFAULT_GAMES, plies=DEFAULT_PLIES, seed=1):
+    rng = random.Random(seed)
+    fens = [fen for _, fen, _ in ChessPerft.PERFT_POSITIONS]
+    for game in range(games):
+        gs = ChessEngine.GameState()
+        gs.loadFEN(ChessPerft.PERFT_POSITIONS[game % len(ChessPerft.PERFT_POSITIONS)][1])
+        for _ in range(plies):
+            moveIDs = gs.getValidMoveIDs()
+            if len(moveIDs) == 0:
+                break
+            gs.makeMove(gs.moveFromID(rng.choice(moveIDs)))
+            fens.append(gs.getFEN())
+    return fens
+
+"""
+Compare the staged move picker of both engines with getValidMoveIDs on every position, yields a dictionary for each
+problem. The hash move is a valid move, a random (mostly invalid) move or None, the killers are random and the
+history is random, so the checks for invalid hash and killer moves are exercised too"""
+def checkStagedMoves(fens, seed=1):
+    rng = random.Random(seed)
+    for fen in fens:
+        validMoves = {}
+        for name, gameStateClass in sorted(ChessPerft.ENGINES.items()):
+            gs = gameStateClass()
+            gs.loadFEN(fen)
+            validMoves[name] = sorted(gs.getValidMoveIDs())
+        if len(set(map(tuple, validMoves.values()))) != 1:
+            yield {"check": "staged", "fen": fen, "problem": "the engines' valid moves differ",
+                   "moves": {name: [ChessEngine.Move.notationFromID(moveID) for moveID in moveIDs]
+                             for name, moveIDs in validMoves.items()}}
+            continue
+        validIDs = validMoves["list"]
+        randomID = lambda: rng.randrange(64) | rng.randrange(64) << 6
+        hashMove = rng.choice((None, randomID(), rng.choice(validIDs) if validIDs else None))
+        killers = [rng.choice((None, randomID(), rng.choice(validIDs) if validIDs else None)) for _ in range(2)]
+        history = [rng.randrange(1000) for _ in range(4096)]
+        orders = {}
+        for name, gameStateClass in sorted(ChessPerft.ENGINES.items()):
+            gs = gameStateClass()
+            gs.loadFEN(fen)
+            staged = list(gs.getStagedMoveIDs(hashMove, killers, history))
+            orders[name] = staged
+            if len(staged) != len(set(staged)) or sorted(staged) != validIDs:
+                yield {"check": "staged", "engine": name, "fen": fen,
+                       "problem": "staged moves differ from the valid moves",
+                       "missing": [ChessEngine.Move.notationFromID(moveID) for moveID in set(validIDs) - set(staged)],
+                       "extra": [ChessEngine.Move.notationFromID(moveID) for moveID in set(staged) - set(validIDs)],
+                       "duplicated": len(staged) - len(set(staged))}
+        if len({tuple(order) for order in orders.values()}) != 1:
+            yield {"check": "staged", "fen": fen, "problem": "the engines yield the staged moves in another order",
+                   "orders": {name: [ChessEngine.Move.notationFromID(moveID) for moveID in order]
+                              for name, order in orders.items()}}
+
+"""
+Compare ChessArrays.BoardBatch of all the positions with a list engine GameState of each, yields a dictionary for
+each problem"""
+def checkArrays(fens, seed=1):
+    from Chess import ChessArrays, ChessSearch # numpy is only needed for this check
+    batch = ChessArrays.BoardBatch.fromFENs(fens)
+    masks = batch.getMoveMasks()
+    scores = batch.evaluate()
+    inCheck = batch.getInCheck()
+    attackMaps = batch.getEnemyAttackMaps()
+    for i, fen in enumerate(fens):
+        gs = ChessEngine.GameState()
+        gs.loadFEN(fen)
+        missing = set(gs.getValidMoveIDs()) - set(batch.getMoveIDs(i, masks))
+        if missing:
+            yield {"check": "arrays", "fen": fen, "problem": "valid moves missing from the move mask",
+                   "missing": [ChessEngine.Move.notationFromID(moveID) for moveID in missing]}
+        if scores[i] != ChessSearch.evaluate(gs):
+            yield {"check": "arrays", "fen": fen, "problem": "evaluate differs",
+                   "batch": int(scores[i]), "gameState": ChessSearch.evaluate(gs)}
+        if inCheck[i] != gs.inCheck:
+            yield {"check": "arrays", "fen": fen, "problem": "inCheck differs",
+                   "batch": bool(inCheck[i]), "gameState": gs.inCheck}
+        if attackMaps[i].tolist() != gs.getEnemyAttackMap():
+            yield {"check": "arrays", "fen": fen, "problem": "enemy attack map differs"}
+
+CHECKS = {"staged": checkStagedMoves, "arrays": checkArrays}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the fast move generators against the plain ones")
+    parser.add_argument("--check", choices=sorted(CHECKS), action="append", help="run only this check (repeatable)")
+    parser.add_argument("--games", type=int, default=DEFAULT_GAMES, help="random games to take positions from")
+    parser.add_argument("--plies", type=int, default=DEFAULT_PLIES, help="maximum length of a random game")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    fens = randomPositions(args.games, args.plies, args.seed)
+    failures = 0
+    for name in args.check or sorted(CHECKS):
+        start = time.perf_counter()
+        problems = 0
+        for problem in CHECKS[name](fens, args.seed):
+            problems += 1
+            print(json.dumps(problem), flush=True)
+        failures += problems
+        print(json.dumps({"summary": True, "check": name, "positions": len(fens), "problems": problems,
+                          "seconds": round(time.perf_counter() - start, 6)}), flush=True)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
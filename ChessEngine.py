@@ -1,3 +1,161 @@
+import random
+from array import array
+
+# Zobrist keys, one random 64 bit number per piece and square, castling rights combination, en passant file and the
+# side to move. The seed is fixed so a position hashes the same in every process (opening books, worker pools)
+zobristRandom = random.Random(20240601)
+ZOBRIST_PIECES = {piece: tuple(zobristRandom.getrandbits(64) for _ in range(64))
+                  for piece in ("wp", "wN", "wB", "wR", "wQ", "wK", "bp", "bN", "bB", "bR", "bQ", "bK")}
+ZOBRIST_CASTLING = tuple(zobristRandom.getrandbits(64) for _ in range(16))
+ZOBRIST_ENPASSANT = tuple(zobristRandom.getrandbits(64) for _ in range(8))
+ZOBRIST_BLACK_TO_MOVE = zobristRandom.getrandbits(64)
+
+ROOK_DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1))
+BISHOP_DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+KING_OFFSETS = ROOK_DIRECTIONS + BISHOP_DIRECTIONS # also the queen directions
+KNIGHT_OFFSETS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+
+"""
+Lookup tables built once at import so the move generators never compute offsets or check the board edges.
+Every table is indexed [row][col] of the start square"""
+def buildTargetTable(offsets):
+    return [[tuple((r + m[0], c + m[1]) for m in offsets if 0 <= r + m[0] < 8 and 0 <= c + m[1] < 8)
+             for c in range(8)] for r in range(8)]
+
+"""
+For every square, a (direction, squares) pair for each direction with the squares from there to the edge of the board"""
+def buildRayTable(directions):
+    table = []
+    for r in range(8):
+        row = []
+        for c in range(8):
+            rays = []
+            for d in directions:
+                ray = []
+                endRow = r + d[0]
+                endCol = c + d[1]
+                while 0 <= endRow < 8 and 0 <= endCol < 8:
+                    ray.append((endRow, endCol))
+                    endRow += d[0]
+                    endCol += d[1]
+                rays.append((d, tuple(ray)))
+            row.append(tuple(rays))
+        table.append(row)
+    return table
+
+"""
+CHECK_BLOCK_SQUARES[king square][checking square] (square = row * 8 + col) is the set of squares that stop the check:
+capturing the checking piece or moving between it and the king. Knight and pawn checks can only be captured"""
+def buildCheckBlockTable():
+    table = [[frozenset([divmod(checkSq, 8)]) for checkSq in range(64)] for _ in range(64)]
+    for kingSq in range(64):
+        kingRow, kingCol = divmod(kingSq, 8)
+        for d, ray in QUEEN_RAYS[kingRow][kingCol]:
+            for i in range(len(ray)):
+                checkRow, checkCol = ray[i]
+                table[kingSq][checkRow * 8 + checkCol] = frozenset(ray[:i + 1])
+    return table
+
+KNIGHT_TARGETS = buildTargetTable(KNIGHT_OFFSETS)
+KING_TARGETS = buildTargetTable(KING_OFFSETS)
+ROOK_RAYS = buildRayTable(ROOK_DIRECTIONS)
+BISHOP_RAYS = buildRayTable(BISHOP_DIRECTIONS)
+QUEEN_RAYS = buildRayTable(KING_OFFSETS) # orthogonal rays first, then the diagonals
+CHECK_BLOCK_SQUARES = buildCheckBlockTable()
+
+# piece values for ordering captures by most valuable victim / least valuable attacker
+MVV_LVA_VALUES = {"p": 100, "N": 320, "B": 330, "R": 500, "Q": 900, "K": 0}
+
+"""
+Most valuable victim / least valuable attacker score of a capture or promotion, higher is searched first"""
+def getCaptureScore(gs, moveID):
+    startRow, startCol = divmod(moveID & 63, 8)
+    endRow, endCol = divmod(moveID >> 6 & 63, 8)
+    victim = gs.board[endRow][endCol]
+    victimValue = MVV_LVA_VALUES[victim[1]] if victim != "--" else MVV_LVA_VALUES["p"] # empty: en passant
+    attackerValue = MVV_LVA_VALUES[gs.board[startRow][startCol][1]]
+    score = victimValue * 10 - attackerValue // 10
+    if moveID >> 12:
+        score += MVV_LVA_VALUES[Move.promotionPieces[(moveID >> 12) - 1]] * 10
+    return score
+
+"""
+True when a piece of the given side attacks board[row][col], board being the 8 strings of FEN characters of
+validateFEN (upper case for white)"""
+def isAttackedOnBoard(board, row, col, byWhite):
+    pawn, knight, bishop, rook, queen, king = "PNBRQK" if byWhite else "pnbrqk"
+    pawnRow = row + 1 if byWhite else row - 1 # white pawns attack towards row 0
+    if 0 <= pawnRow < 8 and any(0 <= pawnCol < 8 and board[pawnRow][pawnCol] == pawn for pawnCol in (col - 1, col + 1)):
+        return True
+    if any(board[r][c] == knight for r, c in KNIGHT_TARGETS[row][col]) or \
+            any(board[r][c] == king for r, c in KING_TARGETS[row][col]):
+        return True
+    for rays, slider in ((ROOK_RAYS, rook), (BISHOP_RAYS, bishop)):
+        for d, ray in rays[row][col]:
+            for r, c in ray:
+                if board[r][c] != "-":
+                    if board[r][c] in (slider, queen):
+                        return True
+                    break
+    return False
+
+"""
+Check a FEN string before it is loaded, raises ValueError saying what is wrong. The board needs 8 ranks of 8 files,
+one king per side, kings that don't touch, no pawn on the first or last rank and the side that just moved not in
+check; the side to move, castling and en passant fields are optional but must be valid and agree with the board
+when given"""
+def validateFEN(fen):
+    fields = fen.split()
+    if not fields or len(fields) > 6:
+        raise ValueError("a FEN has 1 to 6 fields")
+    ranks = fields[0].split("/")
+    if len(ranks) != 8:
+        raise ValueError("the board needs 8 ranks")
+    board = []
+    for rank in ranks:
+        row = ""
+        for char in rank:
+            if char in "12345678":
+                row += "-" * int(char)
+            elif char in "pnbrqkPNBRQK":
+                row += char
+            else:
+                raise ValueError("bad character %r on the board" % char)
+        if len(row) != 8:
+            raise ValueError("rank %r doesn't have 8 files" % rank)
+        board.append(row)
+    placement = "".join(board)
+    if placement.count("K") != 1 or placement.count("k") != 1:
+        raise ValueError("each side needs exactly one king")
+    if "p" in board[0] + board[7] or "P" in board[0] + board[7]:
+        raise ValueError("pawn on the first or last rank")
+    whiteToMove = len(fields) < 2 or fields[1] == "w"
+    if len(fields) > 1 and fields[1] not in ("w", "b"):
+        raise ValueError("the side to move must be w or b")
+    whiteKing = divmod(placement.index("K"), 8)
+    blackKing = divmod(placement.index("k"), 8)
+    if abs(whiteKing[0] - blackKing[0]) <= 1 and abs(whiteKing[1] - blackKing[1]) <= 1:
+        raise ValueError("the kings are next to each other")
+    if isAttackedOnBoard(board, *(blackKing if whiteToMove else whiteKing), byWhite=whiteToMove):
+        raise ValueError("the side not to move is in check")
+    castling = fields[2] if len(fields) > 2 else "-"
+    if castling != "-":
+        if not castling or any(char not in "KQkq" or castling.count(char) > 1 for char in castling):
+            raise ValueError("bad castling field %r" % castling)
+        for char, row, rookCol in (("K", 7, 7), ("Q", 7, 0), ("k", 0, 7), ("q", 0, 0)):
+            king, rook = ("K", "R") if char.isupper() else ("k", "r")
+            if char in castling and (board[row][4] != king or board[row][rookCol] != rook):
+                raise ValueError("castling right %s without the king and rook at home" % char)
+    enpassant = fields[3] if len(fields) > 3 else "-"
+    if enpassant != "-":
+        if len(enpassant) != 2 or enpassant[0] not in "abcdefgh" or enpassant[1] != ("6" if whiteToMove else "3"):
+            raise ValueError("bad en passant field %r" % enpassant)
+        col = "abcdefgh".index(enpassant[0])
+        if board[3 if whiteToMove else 4][col] != ("p" if whiteToMove else "P"):
+            raise ValueError("en passant square %s without the pawn that moved" % enpassant)
+    if any(not field.isdigit() for field in fields[4:]):
+        raise ValueError("the move counters must be numbers")
+
 """
 This class is responsible for storing all the information about the current state of a chess game.
 It is also responsible for determining the valid moves at the current state.
@@ -25,23 +183,189 @@ class GameState():
         self.whiteKingLocation = (7, 4)
         self.blackKingLocation = (0, 4)
         self.inCheck = False
+        self.checkmate = False
+        self.stalemate = False
         self.pins = []
         self.checks = []
+        self.enemyAttackMap = None # squares the enemy attacks, built on first use and dropped when the position changes
+        self.enpassantPossible = () # coordinates for the square where en passant capture is possible
+        self.enpassantPossibleLog = [self.enpassantPossible]
+        self.currentCastlingRight = CastleRights(True, True, True, True)
+        self.castleRightsLog = [self.currentCastlingRight.copy()]
+        self.zobristKey = self.computeZobristKey() # hash of the position, updated incrementally by makeMove
+        self.zobristKeyLog = [self.zobristKey]
+        self.transpositionTable = None # set to a ChessTransposition.TranspositionTable to cache the valid moves
+
+    """
+    Sets up the position described by a FEN string (the move counters are ignored). An invalid FEN raises
+    ValueError and leaves the position as it was"""
+    def loadFEN(self, fen):
+        validateFEN(fen)
+        fields = fen.split()
+        self.board = []
+        for rank in fields[0].split("/"):
+            row = []
+            for char in rank:
+                if char.isdigit():
+                    row.extend(["--"] * int(char))
+                else:
+                    color = "w" if char.isupper() else "b"
+                    piece = "p" if char in "pP" else char.upper()
+                    row.append(color + piece)
+                    if piece == "K":
+                        if color == "w":
+                            self.whiteKingLocation = (len(self.board), len(row) - 1)
+                        else:
+                            self.blackKingLocation = (len(self.board), len(row) - 1)
+            self.board.append(row)
+        self.whiteToMove = len(fields) < 2 or fields[1] == "w"
+        castling = fields[2] if len(fields) > 2 else "-"
+        self.currentCastlingRight = CastleRights("K" in castling, "k" in castling, "Q" in castling, "q" in castling)
+        self.castleRightsLog = [self.currentCastlingRight.copy()]
+        enpassant = fields[3] if len(fields) > 3 else "-"
+        if enpassant == "-":
+            self.enpassantPossible = ()
+        else: # the pawn that moved is on row 3 (black) or row 4 (white), see validateFEN
+            startRow, endRow = (1, 3) if self.whiteToMove else (6, 4)
+            self.enpassantPossible = self.getEnpassantSquare(startRow, endRow, Move.filesToCols[enpassant[0]])
+        self.enpassantPossibleLog = [self.enpassantPossible]
+        self.moveLog = []
+        self.inCheck = False
+        self.checkmate = False
+        self.stalemate = False
+        self.pins = []
+        self.checks = []
+        self.enemyAttackMap = None
+        self.zobristKey = self.computeZobristKey()
+        self.zobristKeyLog = [self.zobristKey]
+
+    """
+    The FEN string of the current position. Move counters are not tracked, the halfmove clock is always 0"""
+    def getFEN(self):
+        rows = []
+        for row in self.board:
+            fenRow = ""
+            empty = 0
+            for piece in row:
+                if piece == "--":
+                    empty += 1
+                    continue
+                if empty:
+                    fenRow += str(empty)
+                    empty = 0
+                letter = "P" if piece[1] == "p" else piece[1]
+                fenRow += letter if piece[0] == "w" else letter.lower()
+            if empty:
+                fenRow += str(empty)
+            rows.append(fenRow)
+        rights = self.currentCastlingRight
+        castling = ("K" if rights.wks else "") + ("Q" if rights.wqs else "") + ("k" if rights.bks else "") + ("q" if rights.bqs else "")
+        if self.enpassantPossible:
+            enpassant = Move.colsToFiles[self.enpassantPossible[1]] + Move.rowsToRanks[self.enpassantPossible[0]]
+        else:
+            enpassant = "-"
+        return "%s %s %s %s 0 %d" % ("/".join(rows), "w" if self.whiteToMove else "b", castling or "-", enpassant,
+                                     1 + len(self.moveLog) // 2)
+
+    """
+    Hash the whole position from scratch, makeMove and undoMove keep it up to date after this"""
+    def computeZobristKey(self):
+        key = 0
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != "--":
+                    key ^= ZOBRIST_PIECES[piece][r * 8 + c]
+        key ^= ZOBRIST_CASTLING[self.currentCastlingRight.getIndex()]
+        if self.enpassantPossible:
+            key ^= ZOBRIST_ENPASSANT[self.enpassantPossible[1]]
+        if not self.whiteToMove:
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        return key
 
     """
-    Takes a move as a parameter and executes it (this will not work for castling, pawn promotion, and en-passant
+    Update the zobrist key for a move that was just made, only the squares the move touched change"""
+    def updateZobristKey(self, move):
+        key = self.zobristKey ^ ZOBRIST_BLACK_TO_MOVE
+        startSq = move.startRow * 8 + move.startCol
+        endSq = move.endRow * 8 + move.endCol
+        key ^= ZOBRIST_PIECES[move.pieceMoved][startSq]
+        key ^= ZOBRIST_PIECES[self.board[move.endRow][move.endCol]][endSq] # the promoted piece for promotions
+        if move.isEnpassantMove:
+            key ^= ZOBRIST_PIECES[move.pieceCaptured][move.startRow * 8 + move.endCol]
+        elif move.pieceCaptured != "--":
+            key ^= ZOBRIST_PIECES[move.pieceCaptured][endSq]
+        if move.isCastleMove:
+            rook = move.pieceMoved[0] + "R"
+            if move.endCol - move.startCol == 2: # king side
+                key ^= ZOBRIST_PIECES[rook][endSq + 1] ^ ZOBRIST_PIECES[rook][endSq - 1]
+            else: # queen side
+                key ^= ZOBRIST_PIECES[rook][endSq - 2] ^ ZOBRIST_PIECES[rook][endSq + 1]
+        previousRights = self.castleRightsLog[-2].getIndex()
+        currentRights = self.currentCastlingRight.getIndex()
+        if previousRights != currentRights:
+            key ^= ZOBRIST_CASTLING[previousRights] ^ ZOBRIST_CASTLING[currentRights]
+        previousEnpassant = self.enpassantPossibleLog[-2]
+        if previousEnpassant:
+            key ^= ZOBRIST_ENPASSANT[previousEnpassant[1]]
+        if self.enpassantPossible:
+            key ^= ZOBRIST_ENPASSANT[self.enpassantPossible[1]]
+        self.zobristKey = key
+        self.zobristKeyLog.append(key)
+
+    """
+    The en passant square after a pawn of column col advanced from startRow to endRow, or () when no enemy pawn
+    stands beside it to capture. A square nobody can use is not kept, so the zobrist key and the FEN of a position
+    are the same whether it was loaded or reached by moves"""
+    def getEnpassantSquare(self, startRow, endRow, col):
+        row = self.board[endRow]
+        enemyPawn = ("b" if row[col][0] == "w" else "w") + "p"
+        if (col > 0 and row[col - 1] == enemyPawn) or (col < 7 and row[col + 1] == enemyPawn):
+            return ((startRow + endRow) // 2, col)
+        return ()
+
+    """
+    Takes a move as a parameter and executes it (including castling, pawn promotion, and en-passant)
     """
     def makeMove(self, move):
         self.board[move.startRow][move.startCol] = "--"
         self.board[move.endRow][move.endCol] = move.pieceMoved
         self.moveLog.append(move) # log the move so we can undo it later
         self.whiteToMove = not self.whiteToMove # swap payers
+        self.enemyAttackMap = None
         # update the king's location if moved
-        if move.pieceMoved[1] == "K":
-            if move.pieceMoved[0] == "b":
-                self.blackKingLocation =(move.endRow, move.endCol)
-            if move.pieceMoved[0] == "w":
-                self.blackKingLocation = (move.endRow, move.endCol)
+        if move.pieceMoved == "wK":
+            self.whiteKingLocation = (move.endRow, move.endCol)
+        elif move.pieceMoved == "bK":
+            self.blackKingLocation = (move.endRow, move.endCol)
+
+        # pawn promotion
+        if move.isPawnPromotion:
+            self.board[move.endRow][move.endCol] = move.pieceMoved[0] + move.promotionChoice
+
+        # en passant, the captured pawn is beside the start square not on the end square
+        if move.isEnpassantMove:
+            self.board[move.startRow][move.endCol] = "--"
+
+        # only a two square pawn advance makes en passant possible on the next move
+        if move.pieceMoved[1] == "p" and abs(move.startRow - move.endRow) == 2:
+            self.enpassantPossible = self.getEnpassantSquare(move.startRow, move.endRow, move.startCol)
+        else:
+            self.enpassantPossible = ()
+        self.enpassantPossibleLog.append(self.enpassantPossible)
+
+        # castle move, the rook jumps over the king
+        if move.isCastleMove:
+            if move.endCol - move.startCol == 2: # king side
+                self.board[move.endRow][move.endCol-1] = self.board[move.endRow][move.endCol+1]
+                self.board[move.endRow][move.endCol+1] = "--"
+            else: # queen side
+                self.board[move.endRow][move.endCol+1] = self.board[move.endRow][move.endCol-2]
+                self.board[move.endRow][move.endCol-2] = "--"
+
+        self.updateCastleRights(move)
+        self.castleRightsLog.append(self.currentCastlingRight.copy())
+        self.updateZobristKey(move)
 
 
     def undoMove(self):
@@ -50,16 +374,70 @@ class GameState():
             self.board[move.startRow][move.startCol] = move.pieceMoved
             self.board[move.endRow][move.endCol] = move.pieceCaptured
             self.whiteToMove = not self.whiteToMove # switch turns back
-            if move.pieceMoved == "wk":
+            self.enemyAttackMap = None
+            if move.pieceMoved == "wK":
                 self.whiteKingLocation = (move.startRow, move.startCol)
-            elif move.pieceMoved == "bk":
+            elif move.pieceMoved == "bK":
                 self.blackKingLocation = (move.startRow, move.startCol)
+            # undo en passant, the end square goes back to empty and the pawn goes back beside the start square
+            if move.isEnpassantMove:
+                self.board[move.endRow][move.endCol] = "--"
+                self.board[move.startRow][move.endCol] = move.pieceCaptured
+            self.enpassantPossibleLog.pop()
+            self.enpassantPossible = self.enpassantPossibleLog[-1]
+            # undo castle rights
+            self.castleRightsLog.pop()
+            self.currentCastlingRight = self.castleRightsLog[-1].copy()
+            self.zobristKeyLog.pop()
+            self.zobristKey = self.zobristKeyLog[-1]
+            # undo castle move, put the rook back in the corner
+            if move.isCastleMove:
+                if move.endCol - move.startCol == 2: # king side
+                    self.board[move.endRow][move.endCol+1] = self.board[move.endRow][move.endCol-1]
+                    self.board[move.endRow][move.endCol-1] = "--"
+                else: # queen side
+                    self.board[move.endRow][move.endCol-2] = self.board[move.endRow][move.endCol+1]
+                    self.board[move.endRow][move.endCol+1] = "--"
+            self.checkmate = False
+            self.stalemate = False
+
+    """
+    Update the castle rights given the move, a king or rook move or a rook capture loses the right"""
+    def updateCastleRights(self, move):
+        if move.pieceMoved == "wK":
+            self.currentCastlingRight.wks = False
+            self.currentCastlingRight.wqs = False
+        elif move.pieceMoved == "bK":
+            self.currentCastlingRight.bks = False
+            self.currentCastlingRight.bqs = False
+        elif move.pieceMoved == "wR" and move.startRow == 7:
+            if move.startCol == 0:
+                self.currentCastlingRight.wqs = False
+            elif move.startCol == 7:
+                self.currentCastlingRight.wks = False
+        elif move.pieceMoved == "bR" and move.startRow == 0:
+            if move.startCol == 0:
+                self.currentCastlingRight.bqs = False
+            elif move.startCol == 7:
+                self.currentCastlingRight.bks = False
+        # a rook captured in its corner can no longer castle
+        if move.pieceCaptured == "wR" and move.endRow == 7:
+            if move.endCol == 0:
+                self.currentCastlingRight.wqs = False
+            elif move.endCol == 7:
+                self.currentCastlingRight.wks = False
+        elif move.pieceCaptured == "bR" and move.endRow == 0:
+            if move.endCol == 0:
+                self.currentCastlingRight.bqs = False
+            elif move.endCol == 7:
+                self.currentCastlingRight.bks = False
 
     """All moves considering checks"""
 
     def getValidMoves(self):
         moves = []
         self.inCheck, self.pins, self.checks = self.checkForPinsAndChecks()
+        self.enemyAttackMap = None # built on first use, king moves and castling only look squares up in it
         if self.whiteToMove:
             kingRow = self.whiteKingLocation[0]
             kingCol = self.whiteKingLocation[1]
@@ -73,30 +451,236 @@ class GameState():
                 check = self.checks[0]  # check information
                 checkRow = check[0]
                 checkCol = check[1]
-                pieceChecking = self.board[checkRow][checkCol]  # enemy piece causing the check
-                validSquares = []
-                #  if knight, must capture knight or move king, other piece cannot block
-                if pieceChecking[1] == "N":
-                    validSquares = [(checkRow, checkCol)]
-                else:
-                    for i in range(1,8):
-                        validSquare = (kingRow + check[2] * i, kingCol + check[3] * i) # check 2 and three are check directions
-                        validSquares.append(validSquare)
-                        if validSquare[0] == checkRow and validSquare[1] == checkCol:  # once you get the piece and checks
-                            break
+                # the squares between the enemy piece and the king plus the piece itself (only the piece for a knight)
+                validSquares = CHECK_BLOCK_SQUARES[kingRow * 8 + kingCol][checkRow * 8 + checkCol]
                 # get rid of any moves that don't block check or move king
                 for i in range(len(moves) -1, -1, -1): # go through backwareds when you are removing from a list as iterating
                     if moves[i].pieceMoved[1] != "K":
+                        if moves[i].isEnpassantMove and (moves[i].startRow, moves[i].endCol) == (checkRow, checkCol):
+                            continue  # en passant captures the pawn that is giving check
                         if not (moves[i].endRow, moves[i].endCol) in validSquares:  # move does not block squares or capture pieces
                             moves.remove(moves[i])
             else:  # double check, king has to move
                 self.getKingMoves(kingRow, kingCol, moves)
         else:  # not in check so all moves are fine
             moves = self.getAllPossibleMoves()
+            self.getCastleMoves(kingRow, kingCol, moves)
+
+        if len(moves) == 0:
+            if self.inCheck:
+                self.checkmate = True
+            else:
+                self.stalemate = True
+        else:
+            self.checkmate = False
+            self.stalemate = False
 
         return moves
 
 
+    """
+    All valid moves as packed move IDs (see Move) in an array, cheap to store, compare and send between processes.
+    With a transposition table the moves of a position are only generated the first time the position is seen"""
+    def getValidMoveIDs(self):
+        if self.transpositionTable is None:
+            return self.generateMoveIDs()
+        entry = self.transpositionTable.probe(self.zobristKey)
+        if entry is not None and entry.moves is not None:
+            self.inCheck = entry.inCheck
+            self.checkmate = len(entry.moves) == 0 and entry.inCheck
+            self.stalemate = len(entry.moves) == 0 and not entry.inCheck
+            return entry.moves
+        moves = self.generateMoveIDs()
+        self.transpositionTable.storeMoves(self.zobristKey, moves, self.inCheck)
+        return moves
+
+    """
+    The valid move IDs straight from getPieceMoveIDs and the legality filter, no Move is built"""
+    def generateMoveIDs(self):
+        self.inCheck, self.pins, self.checks = self.checkForPinsAndChecks()
+        isLegal = self.getLegalityFilter(self.inCheck, self.pins, self.checks)
+        pinned = {(pin[0], pin[1]) for pin in self.pins}
+        enpassant = bool(self.enpassantPossible)
+        board = self.board
+        allyColor = "w" if self.whiteToMove else "b"
+        moveIDs = array("H")
+        for r in range(8):
+            row = board[r]
+            for c in range(8):
+                piece = row[c]
+                if piece[0] == allyColor:
+                    # out of check only the king, pinned pieces and en passant need the filter
+                    if self.inCheck or piece[1] == "K" or (r, c) in pinned or (piece[1] == "p" and enpassant):
+                        moveIDs.extend(filter(isLegal, self.getPieceMoveIDs(r, c, None)))
+                    else:
+                        moveIDs.extend(self.getPieceMoveIDs(r, c, None))
+        self.checkmate = len(moveIDs) == 0 and self.inCheck
+        self.stalemate = len(moveIDs) == 0 and not self.inCheck
+        return moveIDs
+
+    """
+    Staged, lazy move picker for the search. Yields the valid move IDs in the order: the hash move, captures and
+    promotions by MVV-LVA, the killer moves, then the quiet moves (by history[moveID & 4095] when given). Each stage
+    is only generated when the one before it is used up, and pins and checks are only applied to a move when it is
+    about to be yielded, so a cutoff on an early move skips the rest of the work.
+    The pins and checks are worked out here and inCheck is set before this returns; the generator may be resumed
+    after the caller made and undid moves, as long as the position is the same again."""
+    def getStagedMoveIDs(self, hashMove=None, killers=(), history=None):
+        self.inCheck, pins, checks = self.checkForPinsAndChecks()
+        return self.stagedMoveIDs(hashMove, killers, history, self.inCheck, pins, checks)
+
+    def stagedMoveIDs(self, hashMove, killers, history, inCheck, pins, checks):
+        board = self.board
+        allyColor = "w" if self.whiteToMove else "b"
+        isLegal = self.getLegalityFilter(inCheck, pins, checks)
+
+        if hashMove is not None:
+            startRow, startCol = divmod(hashMove & 63, 8)
+            if board[startRow][startCol][0] == allyColor and \
+                    (hashMove in self.getPieceMoveIDs(startRow, startCol, True) or
+                     hashMove in self.getPieceMoveIDs(startRow, startCol, False)) and isLegal(hashMove):
+                yield hashMove
+
+        captures = []
+        for r in range(8):
+            row = board[r]
+            for c in range(8):
+                if row[c][0] == allyColor:
+                    captures.extend(self.getPieceMoveIDs(r, c, True))
+        scored = sorted(((getCaptureScore(self, moveID), moveID) for moveID in captures), reverse=True)
+        for score, moveID in scored:
+            if moveID != hashMove and isLegal(moveID):
+                yield moveID
+
+        searched = [hashMove]
+        for moveID in killers:
+            if moveID is None or moveID in searched:
+                continue
+            startRow, startCol = divmod(moveID & 63, 8)
+            if board[startRow][startCol][0] == allyColor and \
+                    moveID in self.getPieceMoveIDs(startRow, startCol, False) and isLegal(moveID):
+                searched.append(moveID)
+                yield moveID
+
+        quiets = []
+        for r in range(8):
+            row = board[r]
+            for c in range(8):
+                if row[c][0] == allyColor:
+                    quiets.extend(self.getPieceMoveIDs(r, c, False))
+        if history is not None:
+            quiets.sort(key=lambda moveID: (history[moveID & 4095], moveID), reverse=True)
+        for moveID in quiets:
+            if moveID not in searched and isLegal(moveID):
+                yield moveID
+
+    """
+    A function telling whether a pseudo-legal move ID of getPieceMoveIDs is valid, from the pins and checks of
+    checkForPinsAndChecks, shared by the staged picker and generateMoveIDs"""
+    def getLegalityFilter(self, inCheck, pins, checks):
+        board = self.board
+        enemyColor = "b" if self.whiteToMove else "w"
+        kingRow, kingCol = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+        pinDirections = {(r, c): (dr, dc) for r, c, dr, dc in pins}
+        if len(checks) == 1:
+            checkRow, checkCol = checks[0][0], checks[0][1]
+            validSquares = CHECK_BLOCK_SQUARES[kingRow * 8 + kingCol][checkRow * 8 + checkCol]
+        attackMap = [] # built the first time a king move is checked
+
+        def isLegal(moveID):
+            startRow, startCol = divmod(moveID & 63, 8)
+            endRow, endCol = divmod(moveID >> 6 & 63, 8)
+            piece = board[startRow][startCol]
+            if piece[1] == "K":
+                if not attackMap:
+                    attackMap.append(self.getEnemyAttackMap())
+                if abs(endCol - startCol) == 2: # castling, not out of or through check
+                    return not inCheck and not attackMap[0][startRow][(startCol + endCol) // 2] and \
+                        not attackMap[0][endRow][endCol]
+                return not attackMap[0][endRow][endCol]
+            if len(checks) > 1: # double check, only the king can move
+                return False
+            pin = pinDirections.get((startRow, startCol))
+            if pin is not None and (endRow - startRow) * pin[1] != (endCol - startCol) * pin[0]:
+                return False # leaves the pin line
+            isEnpassant = piece[1] == "p" and startCol != endCol and board[endRow][endCol] == "--"
+            if checks and (endRow, endCol) not in validSquares and \
+                    not (isEnpassant and (startRow, endCol) == (checkRow, checkCol)):
+                return False # doesn't capture the checking piece or block the check
+            return not isEnpassant or not self.enpassantExposesKing(startRow, startCol, endCol, enemyColor)
+        return isLegal
+
+    """
+    Pseudo-legal move IDs of the piece on r, c (pins and checks are not looked at): the captures and promotions
+    when captures is True, the quiet moves including castling when it is False, and both when it is None"""
+    def getPieceMoveIDs(self, r, c, captures):
+        board = self.board
+        piece = board[r][c]
+        type = piece[1]
+        enemyColor = "b" if piece[0] == "w" else "w"
+        startSq = r * 8 + c
+        quiets = captures is not True
+        captures = captures is not False
+        moveIDs = []
+        if type == "p":
+            step = -1 if piece[0] == "w" else 1
+            endRow = r + step
+            promotion = endRow == 0 or endRow == 7
+            targets = []
+            if captures:
+                for endCol in (c - 1, c + 1):
+                    if 0 <= endCol < 8 and (board[endRow][endCol][0] == enemyColor or
+                                            (endRow, endCol) == self.enpassantPossible):
+                        targets.append(endRow * 8 + endCol)
+                if promotion and board[endRow][c] == "--":
+                    targets.append(endRow * 8 + c)
+            if quiets and not promotion and board[endRow][c] == "--":
+                targets.append(endRow * 8 + c)
+                if r == (6 if piece[0] == "w" else 1) and board[endRow + step][c] == "--":
+                    targets.append((endRow + step) * 8 + c)
+            for endSq in targets:
+                if promotion:
+                    moveIDs.extend(startSq | endSq << 6 | code << 12 for code in (1, 2, 3, 4))
+                else:
+                    moveIDs.append(startSq | endSq << 6)
+        elif type == "N" or type == "K":
+            for endRow, endCol in (KNIGHT_TARGETS if type == "N" else KING_TARGETS)[r][c]:
+                target = board[endRow][endCol]
+                if (target == "--" and quiets) or (target[0] == enemyColor and captures):
+                    moveIDs.append(startSq | (endRow * 8 + endCol) << 6)
+            if type == "K" and quiets and c == 4 and r == (7 if piece[0] == "w" else 0):
+                rights = self.currentCastlingRight
+                kingside, queenside = (rights.wks, rights.wqs) if piece[0] == "w" else (rights.bks, rights.bqs)
+                if kingside and board[r][5] == "--" and board[r][6] == "--":
+                    moveIDs.append(startSq | (startSq + 2) << 6)
+                if queenside and board[r][3] == "--" and board[r][2] == "--" and board[r][1] == "--":
+                    moveIDs.append(startSq | (startSq - 2) << 6)
+        else:
+            rays = ROOK_RAYS if type == "R" else BISHOP_RAYS if type == "B" else QUEEN_RAYS
+            for d, ray in rays[r][c]:
+                for endRow, endCol in ray:
+                    target = board[endRow][endCol]
+                    if target == "--":
+                        if quiets:
+                            moveIDs.append(startSq | (endRow * 8 + endCol) << 6)
+                        continue
+                    if captures and target[0] == enemyColor:
+                        moveIDs.append(startSq | (endRow * 8 + endCol) << 6)
+                    break
+        return moveIDs
+
+    """
+    Build the Move for a packed move ID in the current position, castling and en passant are worked out from the board"""
+    def moveFromID(self, moveID):
+        startRow, startCol = divmod(moveID & 63, 8)
+        endRow, endCol = divmod(moveID >> 6 & 63, 8)
+        pieceMoved = self.board[startRow][startCol]
+        isEnpassantMove = pieceMoved[1] == "p" and startCol != endCol and self.board[endRow][endCol] == "--"
+        isCastleMove = pieceMoved[1] == "K" and abs(endCol - startCol) == 2
+        promotion = moveID >> 12
+        promotionChoice = Move.promotionPieces[promotion - 1] if promotion else "Q"
+        return Move((startRow, startCol), (endRow, endCol), self.board, isEnpassantMove, isCastleMove, promotionChoice)
+
     """All moves without considering checks"""
     def getAllPossibleMoves(self):
         moves = []
@@ -121,120 +705,105 @@ class GameState():
                 break
 
         if self.whiteToMove: #white pawn moves
-            if self.board[r-1][c] == "--": # A pawn can advance
-                if not piecePinned or pinDirection == (-1, 0):
-                    moves.append(Move((r, c), (r-1, c), self.board))
-                    if r == 6 and self.board[r-2][c] == "--": # A pawn can advance twice
-                        moves.append(Move((r, c), (r-2, c), self.board))
-            #  captures
-            if c - 1 >= 0:  # capture to left
-                if self.board[r-1][c-1][0] == "b":
-                    if not piecePinned or pinDirection == (-1, -1):
-                        moves.append(Move((r, c), (r-1, c-1), self.board))
-            if c + 1 <= 7:  # capture to right
-                if self.board[r-1][c+1][0] == "b":
-                    if not piecePinned or pinDirection == (-1, 1):
-                        moves.append(Move((r, c), (r-1, c+1), self.board))
+            moveAmount = -1
+            startRow = 6
+            enemyColor = "b"
         else: # black pawn moves
-            if self.board[r+1][c] == "--": # 1 square move
-                if not piecePinned or pinDirection == (1, 0):
-                    moves.append(Move((r, c),(r+1, c), self.board)) # 1 sq move
-                    if r == 1 and self.board[r+2][c] == "--":
-                        moves.append(Move((r, c),(r+2,c), self.board)) #2 sq move
-            #  captures
-            if c - 1 >= 0: # captures left
-                if self.board[r+1][c-1][0] == "w":
-                    if not piecePinned or pinDirection == (-1, -1):
-                        moves.append(Move((r, c),(r+1, c-1), self.board))
-            if c + 1 <= 7: # captures right
-                if self.board[r+1][c+1][0] == "w":
-                    if not piecePinned or pinDirection == (1, 1):
-                        moves.append(Move((r, c), (r+1, c+1), self.board))
+            moveAmount = 1
+            startRow = 1
+            enemyColor = "w"
 
-        # add pawn promotions later
+        if self.board[r+moveAmount][c] == "--": # A pawn can advance
+            if not piecePinned or pinDirection == (moveAmount, 0) or pinDirection == (-moveAmount, 0):
+                self.addPawnMove((r, c), (r+moveAmount, c), moves)
+                if r == startRow and self.board[r+2*moveAmount][c] == "--": # A pawn can advance twice
+                    moves.append(Move((r, c), (r+2*moveAmount, c), self.board))
+        #  captures
+        for colOffset in (-1, 1): # capture to left and right
+            endCol = c + colOffset
+            if 0 <= endCol <= 7:
+                if not piecePinned or pinDirection == (moveAmount, colOffset) or pinDirection == (-moveAmount, -colOffset):
+                    if self.board[r+moveAmount][endCol][0] == enemyColor:
+                        self.addPawnMove((r, c), (r+moveAmount, endCol), moves)
+                    elif (r+moveAmount, endCol) == self.enpassantPossible:
+                        if not self.enpassantExposesKing(r, c, endCol, enemyColor):
+                            moves.append(Move((r, c), (r+moveAmount, endCol), self.board, isEnpassantMove=True))
 
+    """
+    Add a pawn move to the list, a pawn reaching the last rank adds one move for every promotion piece"""
+    def addPawnMove(self, startSq, endSq, moves):
+        if endSq[0] == 0 or endSq[0] == 7:
+            for promotionChoice in ("Q", "R", "B", "N"):
+                moves.append(Move(startSq, endSq, self.board, promotionChoice=promotionChoice))
+        else:
+            moves.append(Move(startSq, endSq, self.board))
 
+    """
+    En passant removes two pawns from the same rank, which can uncover a rook or queen attacking the king"""
+    def enpassantExposesKing(self, r, c, endCol, enemyColor):
+        kingRow, kingCol = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+        if kingRow != r:
+            return False
+        step = 1 if kingCol < c else -1
+        col = kingCol + step
+        while 0 <= col < 8:
+            if col != c and col != endCol:
+                piece = self.board[r][col]
+                if piece != "--":
+                    return piece[0] == enemyColor and (piece[1] == "R" or piece[1] == "Q")
+            col += step
+        return False
 
 
     """Get all the rook moves for the rook located at row, col and add these moves to the list"""
     def getRookMoves(self, r, c, moves):
+        self.getSlidingMoves(r, c, moves, ROOK_RAYS, self.board[r][c][1] != "Q")
+
+    """
+    Add the moves along the precomputed rays of a rook or bishop (a queen is both). A queen's pin is only removed
+    from the list by its bishop moves, so the rook half still sees it"""
+    def getSlidingMoves(self, r, c, moves, rays, removePin):
         piecePinned = False
         pinDirection = ()
         for i in range(len(self.pins)-1, -1, -1):
             if self.pins[i][0] == r and self.pins[i][1] == c:
                 piecePinned = True
                 pinDirection = (self.pins[i][2], self.pins[i][3])
-                if self.board[r][c][1] != "Q": # can't remove queen from pin on rook moves, only remove if on bishop moves
+                if removePin:
                     self.pins.remove(self.pins[i])
                 break
-        directions = ((-1, 0), (0, -1), (1, 0), (0, 1)) # up, left, down, right
         enemyColor = "b" if self.whiteToMove else "w"
-        for d in directions:
-            for i in range(1,8):
-                endRow = r + d[0] * i
-                endCol = c + d[1] * i
-                if 0 <= endRow <8 and 0 <= endCol <8:#on board
-                    if not piecePinned or pinDirection == d or pinDirection == (-d[0], -d[1]):
-                        endPiece =self.board[endRow][endCol]
-                        if endPiece == "--":  # empty space valid
-                            moves.append(Move((r,c), (endRow,endCol), self.board))
-                        elif endPiece[0] == enemyColor:  # enemy piece valid
-                            moves.append(Move((r,c), (endRow, endCol), self.board))
-                            break   # can't go beyond enemy piece.
-                        else:  # it is friendly piece.
-                            break
-                else:  # off board
-                    break
+        board = self.board
+        for d, ray in rays[r][c]:
+            if not piecePinned or pinDirection == d or pinDirection == (-d[0], -d[1]):
+                for endRow, endCol in ray:
+                    endPiece = board[endRow][endCol]
+                    if endPiece == "--":  # empty space valid
+                        moves.append(Move((r,c), (endRow,endCol), board))
+                    elif endPiece[0] == enemyColor:  # enemy piece valid
+                        moves.append(Move((r,c), (endRow, endCol), board))
+                        break   # can't go beyond enemy piece.
+                    else:  # it is friendly piece.
+                        break
 
     """Get all the knight moves for the knight located at row, col and add these moves to the list"""
     def getKnightMoves(self, r, c, moves):
         piecePinned = False
-        pinDirection = ()
         for i in range(len(self.pins)-1, -1, -1):
             if self.pins[i][0] == r and self.pins[i][1] == c:
                 piecePinned = True
-                pinDirection = (self.pins[i][2], self.pins[i][3])
                 self.pins.remove(self.pins[i])
                 break
-        knightMoves = ((-2,-1), (-2,1), (-1,-2), (-1, 2), (-1, 2), (1, -2), (2, -1), (2, 1))
+        if piecePinned: # a pinned knight can never move
+            return
         allyColor = "w" if self.whiteToMove else "b"
-        for m in knightMoves:
-            endRow = r + m[0]
-            endCol = c + m[1]
-            if 0 <= endRow <8 and 0 <= endCol < 8:
-                if not piecePinned:
-                    endPiece = self.board[endRow][endCol]
-                    if endPiece[0] != allyColor: # opponent's piece
-                        moves.append(Move((r,c), (endRow, endCol), self.board))
+        for endRow, endCol in KNIGHT_TARGETS[r][c]:
+            if self.board[endRow][endCol][0] != allyColor: # empty or opponent's piece
+                moves.append(Move((r,c), (endRow, endCol), self.board))
 
     """Get all the bishop moves for the bishop located at row, col and add these moves to the list"""
     def getBishopMoves(self, r, c, moves):
-        piecePinned = False
-        pinDirection = ()
-        for i in range(len(self.pins)-1,-1,-1):
-            if self.pins[i][0] == r and self.pins[i][1] == c:
-                piecePinned = True
-                pinDirection = (self.pins[i][2], self.pins[i][3])
-                self.pins.remove(self.pins[i])
-                break
-        directions = ((-1, 1), (1, -1), (1, 1), (-1,-1))
-        enemyColor = "b" if self.whiteToMove else "w"
-        for d in directions:
-            for i in range (1,8):
-                endRow = r + d[0]*i
-                endCol = c + d[1]*i
-                if 0 <= endRow < 8 and 0 <= endCol < 8:
-                    if not piecePinned or pinDirection == d or pinDirection == (-d[0], -d[1]):
-                        endPiece = self.board[endRow][endCol]
-                        if endPiece == "--":
-                            moves.append(Move((r,c), (endRow,endCol), self.board))
-                        elif endPiece[0] == enemyColor:
-                            moves.append(Move((r,c), (endRow, endCol), self.board))
-                            break
-                        else:
-                            break
-                else:
-                    break
+        self.getSlidingMoves(r, c, moves, BISHOP_RAYS, True)
 
     """Get all the queens moves for the queens located at row, col and add these moves to the list"""
     def getQueenMoves(self, r, c, moves):
@@ -243,29 +812,72 @@ class GameState():
 
     """Get all the king moves for the king located at row, col and add these moves to the list"""
     def getKingMoves(self, r, c, moves):
-        rowMoves = (-1, -1, -1, 0, 0, 1, 1, 1)
-        colMoves = (-1, 0, 1, -1, 1, -1, 0, 1)
         allyColor = "w" if self.whiteToMove else "b"
-        for i in range(8):
-            endRow = r + rowMoves[i]
-            endCol = c + colMoves[i]
-            if 0 <= endRow < 8 and 0 <= endCol < 8:
-                endPiece = self.board[endRow][endCol]
-                if endPiece[0] != allyColor:  # not an ally piece (empty or enemy piece)
-                    # place king on end square and check for checks
-                    if allyColor == "w":
-                        self.whiteKingLocation = (endRow,endCol)
-                    else:
-                        self.blackKingLocation = (endRow,endCol)
-                    inCheck, pins, checks = self.checkForPinsAndChecks()
-                    if not inCheck:
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
-                    #  place king back on original location
-                    if allyColor == "w":
-                        self.whiteKingLocation = (r, c)
-                    else:
-                        self.blackKingLocation = (r, c)
+        for endRow, endCol in KING_TARGETS[r][c]:
+            if self.board[endRow][endCol][0] != allyColor:  # not an ally piece (empty or enemy piece)
+                if self.enemyAttackMap is None:
+                    self.enemyAttackMap = self.getEnemyAttackMap()
+                if not self.enemyAttackMap[endRow][endCol]:  # the enemy doesn't attack the end square
+                    moves.append(Move((r, c), (endRow, endCol), self.board))
 
+    """
+    Generate all valid castle moves for the king at (r, c) and add them to the list of moves"""
+    def getCastleMoves(self, r, c, moves):
+        if self.inCheck:
+            return  # can't castle while we are in check
+        if (self.whiteToMove and self.currentCastlingRight.wks) or (not self.whiteToMove and self.currentCastlingRight.bks):
+            self.getKingsideCastleMoves(r, c, moves)
+        if (self.whiteToMove and self.currentCastlingRight.wqs) or (not self.whiteToMove and self.currentCastlingRight.bqs):
+            self.getQueensideCastleMoves(r, c, moves)
+
+    def getKingsideCastleMoves(self, r, c, moves):
+        if self.board[r][c+1] == "--" and self.board[r][c+2] == "--":
+            if self.enemyAttackMap is None:
+                self.enemyAttackMap = self.getEnemyAttackMap()
+            if not self.enemyAttackMap[r][c+1] and not self.enemyAttackMap[r][c+2]:
+                moves.append(Move((r, c), (r, c+2), self.board, isCastleMove=True))
+
+    def getQueensideCastleMoves(self, r, c, moves):
+        if self.board[r][c-1] == "--" and self.board[r][c-2] == "--" and self.board[r][c-3] == "--":
+            if self.enemyAttackMap is None:
+                self.enemyAttackMap = self.getEnemyAttackMap()
+            if not self.enemyAttackMap[r][c-1] and not self.enemyAttackMap[r][c-2]:
+                moves.append(Move((r, c), (r, c-2), self.board, isCastleMove=True))
+
+    """
+    Every square the enemy attacks as an 8x8 list of booleans, built at most once per position by getValidMoves.
+    The king of the side to move is left off the board so rook, bishop and queen attacks go through it,
+    otherwise the king could step back along the line it is being checked on"""
+    def getEnemyAttackMap(self):
+        attackMap = [[False] * 8 for _ in range(8)]
+        enemyColor = "b" if self.whiteToMove else "w"
+        allyKing = "bK" if enemyColor == "w" else "wK"
+        pawnRow = 1 if enemyColor == "b" else -1 # enemy pawns attack one row towards us
+        board = self.board
+        for r in range(8):
+            row = board[r]
+            for c in range(8):
+                if row[c][0] != enemyColor:
+                    continue
+                type = row[c][1]
+                if type == "p":
+                    if 0 <= r + pawnRow < 8:
+                        if c - 1 >= 0:
+                            attackMap[r + pawnRow][c - 1] = True
+                        if c + 1 <= 7:
+                            attackMap[r + pawnRow][c + 1] = True
+                elif type == "N" or type == "K":
+                    for endRow, endCol in (KNIGHT_TARGETS if type == "N" else KING_TARGETS)[r][c]:
+                        attackMap[endRow][endCol] = True
+                else:
+                    rays = ROOK_RAYS if type == "R" else BISHOP_RAYS if type == "B" else QUEEN_RAYS
+                    for d, ray in rays[r][c]:
+                        for endRow, endCol in ray:
+                            attackMap[endRow][endCol] = True
+                            endPiece = board[endRow][endCol]
+                            if endPiece != "--" and endPiece != allyKing:  # blocked, but not by our king
+                                break
+        return attackMap
 
     """
     Returns if the player is in check, a list of pins, and a list of checks"""
@@ -284,52 +896,72 @@ class GameState():
             allyColor = "b"
             startRow = self.blackKingLocation[0]
             startCol = self.blackKingLocation[1]
+        board = self.board
         # check outward from king for pins and checks, keep track fo the pins
-        directions = ((-1, 0), (1, 0), (0, -1), (0, 1), (1,-1), (-1, 1), (1, 1), (-1, -1))
-        for j in range(len(directions)):
-            d = directions[j]
+        rays = QUEEN_RAYS[startRow][startCol]
+        for j in range(8):
+            d, ray = rays[j]
             possiblePin = () # reset possible pins
-            for i in range(1,8):
-                endRow = startRow + d[0] * 1
-                endCol = startCol + d[1] * 1
-                if 0 <= endRow < 8 and 0 <= endCol < 8:
-                    endPiece = self.board[endRow][endCol]
-                    if endPiece[0] == allyColor:
-                        if possiblePin == ():  # 1st allied piece could be pinned
-                            possiblePin = (endRow,endCol, d[0], d[1])
-                        else:  # 2nd allied piece, so no pins or check possible in this direction
+            for i in range(len(ray)):
+                endRow, endCol = ray[i]
+                endPiece = board[endRow][endCol]
+                if endPiece[0] == allyColor:
+                    if possiblePin == ():  # 1st allied piece could be pinned
+                        possiblePin = (endRow,endCol, d[0], d[1])
+                    else:  # 2nd allied piece, so no pins or check possible in this direction
+                        break
+                elif endPiece[0] == enemyColor:
+                    type = endPiece[1]
+                    # 5 possibilities here in this complex conditional
+                    # 1) orthogonally away from king and piece is a rook
+                    # 2) diagonally away from king and piece is a bishop
+                    # 3) 1 square away diagonally from king and piece is a pawn
+                    # 4) any direction and piece is a queen
+                    # 5) any direction 1 square away and piece is a king
+                    if (0 <= j <= 3 and type == "R") or \
+                            (4 <=j <= 7 and type == "B") or \
+                            (i == 0 and type == "p" and ((enemyColor == "w" and 6 <= j <= 7) or (enemyColor == "b" and 4 <= j <= 5))) or \
+                            (type == "Q") or (i == 0 and type == "K"):
+                        if possiblePin == ():  # no piece blocking, so check
+                            inCheck = True
+                            checks.append((endRow, endCol, d[0], d[1]))
                             break
-                    elif endPiece[0] == enemyColor:
-                        type = endPiece[1]
-
-                        if (0 <= j <= 3 and type == "R") or \
-                                (4 <=j <= 7 and type == "B") or \
-                                (i == 1 and type == "p" and ((enemyColor == "w" and 6 <= j <= 7) or (enemyColor == "b" and 4 <= j <= 5))) or \
-                                (type == "Q") or (i == 1 and type == "K"):
-                            if possiblePin == ():  # no piece blocking, so check
-                                inCheck = True
-                                checks.append((endRow, endCol, d[0], d[1]))
-                                break
-                            else:  # piece blocking so pin
-                                pins.append(possiblePin)
-                                break
-                        else:  # enemy piece not applying check:
+                        else:  # piece blocking so pin
+                            pins.append(possiblePin)
                             break
-                else:
-                    break  # off board
+                    else:  # enemy piece not applying check:
+                        break
         #  check for knight checks
-        knightMoves = ((-2, -1), (-1, -2), (-2, 1), (2, -1), (1, -2), (-1, 2), (2, 1), (1, 2))
-        for m in knightMoves:
-            endRow = startRow + m[0]
-            endCol = startCol + m[1]
-            if 0 <= endRow < 8 and 0 <= endCol < 8:
-                endPiece = self.board[endRow][endCol]
-                if endPiece[0] == allyColor and endPiece[1] == "N":  # enemy knight attacking king
-                    inCheck = True
-                    checks.append((endRow,endCol, m[0], m[1]))
+        for endRow, endCol in KNIGHT_TARGETS[startRow][startCol]:
+            endPiece = board[endRow][endCol]
+            if endPiece[0] == enemyColor and endPiece[1] == "N":  # enemy knight attacking king
+                inCheck = True
+                checks.append((endRow,endCol, endRow - startRow, endCol - startCol))
         return inCheck, pins, checks
 
+class CastleRights():
+    def __init__(self, wks, bks, wqs, bqs):
+        self.wks = wks
+        self.bks = bks
+        self.wqs = wqs
+        self.bqs = bqs
+
+    def copy(self):
+        return CastleRights(self.wks, self.bks, self.wqs, self.bqs)
+
+    """
+    The four rights packed into a number from 0 to 15"""
+    def getIndex(self):
+        return self.wks | self.bks << 1 | self.wqs << 2 | self.bqs << 3
+
 class Move():
+    # a move is identified by a packed 15 bit moveID, so it fits an array("H") and can key a dict or set:
+    #   bits 0-5 start square, bits 6-11 end square (square = row * 8 + col),
+    #   bits 12-14 promotion piece (0 = no promotion, 1 = Q, 2 = R, 3 = B, 4 = N)
+    # castling and en passant are not part of the ID, GameState.moveFromID works them out from the board
+    __slots__ = ("startRow", "startCol", "endRow", "endCol", "pieceMoved", "pieceCaptured", "isPawnPromotion",
+                 "promotionChoice", "isEnpassantMove", "isCastleMove", "moveID")
+
     # maps keys to values
     # key : value
     ranksToRows = {"1": 7, "2": 6, "3": 5, "4": 4,
@@ -338,15 +970,28 @@ class Move():
     filesToCols = {"a": 0, "b": 1, "c": 2, "d": 3,
                    "e": 4, "f": 5, "g": 6, "h": 7}
     colsToFiles = {v: k for k, v in filesToCols.items()}
+    promotionPieces = ("Q", "R", "B", "N")
+    promotionCodes = {"Q": 1, "R": 2, "B": 3, "N": 4}
 
-    def __init__(self, startSq, endSq, board):
-        self.startRow = startSq[0]
-        self.startCol = startSq[1]
-        self.endRow = endSq[0]
-        self.endCol = endSq[1]
-        self.pieceMoved = board[self.startRow][self.startCol]
-        self.pieceCaptured = board[self.endRow][self.endCol]
-        self.moveID = self.startRow * 1000 + self.startCol * 100 + self.endRow * 10 + self.endCol
+    def __init__(self, startSq, endSq, board, isEnpassantMove=False, isCastleMove=False, promotionChoice="Q"):
+        self.startRow = startRow = startSq[0]
+        self.startCol = startCol = startSq[1]
+        self.endRow = endRow = endSq[0]
+        self.endCol = endCol = endSq[1]
+        self.pieceMoved = pieceMoved = board[startRow][startCol]
+        self.pieceCaptured = board[endRow][endCol]
+        # pawn promotion
+        self.isPawnPromotion = (pieceMoved == "wp" and endRow == 0) or (pieceMoved == "bp" and endRow == 7)
+        self.promotionChoice = promotionChoice
+        # en passant, the captured pawn is the enemy pawn beside the start square
+        self.isEnpassantMove = isEnpassantMove
+        if isEnpassantMove:
+            self.pieceCaptured = "bp" if pieceMoved == "wp" else "wp"
+        # castle move
+        self.isCastleMove = isCastleMove
+        self.moveID = startRow * 8 + startCol | (endRow * 8 + endCol) << 6
+        if self.isPawnPromotion: # each promotion piece is a different move
+            self.moveID |= self.promotionCodes[promotionChoice] << 12
         # print(self.moveID)
     """
     Overriding the equals method"""
@@ -356,8 +1001,40 @@ class Move():
             return self.moveID == other.moveID
         return False
 
+    def __hash__(self):
+        return self.moveID
+
     def getChessNotation(self):
-        return self.getRankFile(self.startRow, self.startCol) + self.getRankFile(self.endRow, self.endCol)
+        notation = self.getRankFile(self.startRow, self.startCol) + self.getRankFile(self.endRow, self.endCol)
+        if self.isPawnPromotion:
+            notation += self.promotionChoice.lower()
+        return notation
 
     def getRankFile(self, r, c):
-        return self.colsToFiles[c] + self.rowsToRanks[r]
\ No newline at end of file
+        return self.colsToFiles[c] + self.rowsToRanks[r]
+
+    """
+    Chess notation of a packed move ID without building the Move"""
+    @classmethod
+    def notationFromID(cls, moveID):
+        startRow, startCol = divmod(moveID & 63, 8)
+        endRow, endCol = divmod(moveID >> 6 & 63, 8)
+        notation = cls.colsToFiles[startCol] + cls.rowsToRanks[startRow] + cls.colsToFiles[endCol] + cls.rowsToRanks[endRow]
+        if moveID >> 12:
+            notation += cls.promotionPieces[(moveID >> 12) - 1].lower()
+        return notation
+
+    """
+    Packed move ID of a move in chess notation ("e2e4", "e7e8q"), raises ValueError when it can't be read. Whether
+    the move is valid is up to the caller, e.g. moveID in gs.getValidMoveIDs()"""
+    @classmethod
+    def idFromNotation(cls, notation):
+        if len(notation) not in (4, 5) or notation[0] not in cls.filesToCols or notation[1] not in cls.ranksToRows or \
+                notation[2] not in cls.filesToCols or notation[3] not in cls.ranksToRows or \
+                (len(notation) == 5 and notation[4].upper() not in cls.promotionCodes):
+            raise ValueError("cannot read move %r" % notation)
+        moveID = cls.ranksToRows[notation[1]] * 8 + cls.filesToCols[notation[0]] | \
+                 (cls.ranksToRows[notation[3]] * 8 + cls.filesToCols[notation[2]]) << 6
+        if len(notation) == 5:
+            moveID |= cls.promotionCodes[notation[4].upper()] << 12
+        return moveID
@@ -2,25 +2,102 @@
 This is our main driver file. It will be responsible for handling user input and displaying the current GameState object.
 """
 
+import hashlib
+import os
+
 import pygame as p
-from Chess import ChessEngine
+from Chess import ChessBitboard, ChessEngine, ChessWorker
 
 WIDTH = HEIGHT = 512 #400 is another good option
 DIMENSION = 8 #dimensions are 8x8
 SQ_SIZE = HEIGHT//DIMENSION
 MAX_FPS = 15 #for animation later on
 IMAGES = {}
+PIECES = ["wp", "wR", "wN", "wB", "wQ", "wK", "bp", "bR", "bN", "bB", "bQ", "bK"]
+SPRITE_CACHE_DIR = "images/.cache" #rasterized piece atlases, one png per square size and version of the SVGs
+ATLASES = {} #square size -> piece images, a resize back to a size seen before costs nothing
+SPRITE_SOURCE_HASH = None #version of the SVGs, worked out once per run
+BOARD_SURFACE = None #the empty board, drawn once and copied from
+HIGHLIGHT_SURFACE = None #shade for the squares of the hint move
+USE_BITBOARDS = False #play on the bitboard backend, same rules and API but faster move generation
+PLAYER_ONE = True #True if a human is playing white, False if the engine plays white
+PLAYER_TWO = True #same as above but for black
+ENGINE_THINK_TIME = 2.0 #seconds the engine spends on its move or on a hint ('h')
 
 """
-Initialize a global dictionary of images. This will be called exactly once in the main
+Initialize a global dictionary of images for the current SQ_SIZE. The pieces come from one atlas image that is only
+rasterized from the SVGs the first time a size is used, see loadAtlas
 """
 
 def loadImages():
-    pieces = ["wp", "wR", "wN", "wB", "wQ", "wK", "bp", "bR", "bN", "bB", "bQ", "bK"]
-    for piece in pieces:
-        IMAGES[piece] = p.transform.scale(p.image.load("images/" + piece + ".svg"), (SQ_SIZE*3.4, SQ_SIZE*3.4))
+    if SQ_SIZE not in ATLASES:
+        atlas = loadAtlas(SQ_SIZE)
+        ATLASES[SQ_SIZE] = {piece: atlas.subsurface(p.Rect(i*SQ_SIZE, 0, SQ_SIZE, SQ_SIZE)) for i, piece in enumerate(PIECES)}
+    IMAGES.clear()
+    IMAGES.update(ATLASES[SQ_SIZE])
     #NOTE: we can access an image by saying 'IMAGES['wp']'
 
+"""
+Short hash of the contents of the piece SVGs, a changed piece set gets new atlases whatever its file dates say. The
+SVGs are small, they are read once per run and the hash is kept for the resizes
+"""
+def getSpriteSourceHash():
+    global SPRITE_SOURCE_HASH
+    if SPRITE_SOURCE_HASH is None:
+        digest = hashlib.sha1()
+        for piece in PIECES:
+            with open("images/" + piece + ".svg", "rb") as svgFile:
+                digest.update(svgFile.read())
+        SPRITE_SOURCE_HASH = digest.hexdigest()[:16]
+    return SPRITE_SOURCE_HASH
+
+"""
+All 12 pieces at one square size side by side in a single surface. Read from the sprite cache when it has this
+size and version of the SVGs, otherwise rasterized and saved there for the next launch
+"""
+def loadAtlas(size):
+    path = os.path.join(SPRITE_CACHE_DIR, "pieces-%d-%s.png" % (size, getSpriteSourceHash()))
+    if os.path.exists(path):
+        try:
+            return p.image.load(path).convert_alpha()
+        except p.error:
+            pass # unreadable cache file, rasterize again
+    atlas = p.Surface((size*len(PIECES), size), p.SRCALPHA)
+    for i, piece in enumerate(PIECES):
+        image = p.transform.scale(p.image.load("images/" + piece + ".svg"), (size*3.4, size*3.4))
+        atlas.blit(image, (i*size, 0), p.Rect(0, 0, size, size)) # the part that shows on the square
+    try:
+        os.makedirs(SPRITE_CACHE_DIR, exist_ok=True)
+        tempPath = path[:-4] + ".%d.png" % os.getpid()
+        p.image.save(atlas, tempPath)
+        os.replace(tempPath, path) # another board starting at the same time never reads half a file
+    except (OSError, p.error):
+        pass # read only install, the atlas still works for this run
+    return atlas
+
+"""
+Change the board to fit a resized window. The piece images of a size used before are reused
+"""
+def resizeBoard(width, height):
+    global WIDTH, HEIGHT, SQ_SIZE
+    SQ_SIZE = max(8, min(width, height)//DIMENSION)
+    WIDTH = HEIGHT = SQ_SIZE*DIMENSION
+    screen = p.display.set_mode((WIDTH, HEIGHT), p.RESIZABLE)
+    loadImages()
+    loadSurfaces()
+    return screen
+
+"""
+Pre-render the empty board and the highlight once, squares are then copied from them instead of drawn every frame
+"""
+def loadSurfaces():
+    global BOARD_SURFACE, HIGHLIGHT_SURFACE
+    BOARD_SURFACE = p.Surface((WIDTH, HEIGHT))
+    drawBoard(BOARD_SURFACE)
+    HIGHLIGHT_SURFACE = p.Surface((SQ_SIZE, SQ_SIZE))
+    HIGHLIGHT_SURFACE.set_alpha(110) # transparency value, 0 is transparent and 255 is opaque
+    HIGHLIGHT_SURFACE.fill(p.Color("yellow"))
+
 
 """
 The main driver for our code. This will handle user input and updating the graphics.
@@ -28,22 +105,38 @@ The main driver for our code. This will handle user input and updating the graph
 
 def main():
     p.init()
-    screen = p.display.set_mode((WIDTH, HEIGHT))
+    screen = p.display.set_mode((WIDTH, HEIGHT), p.RESIZABLE)
     clock = p.time.Clock()
     screen.fill(p.Color("white"))
-    gs = ChessEngine.GameState()
-    validMoves = gs.getValidMoves()
+    gs = ChessBitboard.GameState() if USE_BITBOARDS else ChessEngine.GameState()
+    validMoves = set(gs.getValidMoveIDs()) # packed move IDs, an O(1) lookup for the clicked move
     moveMade = False # flag variable when a move is made
     loadImages() # only do this once, before the while loop
+    loadSurfaces()
     running = True
     sqSelected = () # no square is selected, keep track of the last click of the user (tuple: (row, col))
     playerClicks = [] # keep track of payer clicks (two tuples: [(6,4), (4,4)]
+    worker = ChessWorker.EngineWorker() # the engine thinks on its own thread so the window stays responsive
+    engineThinking = False # the worker is searching for the engine's own move (not a hint)
+    hintMove = None # move ID suggested by the engine after 'h' is pressed
+    drawnSquares = {} # what each square showed on the last frame, only squares that changed are drawn again
     while running:
-        for e in p.event.get():
+        humanTurn = (gs.whiteToMove and PLAYER_ONE) or (not gs.whiteToMove and PLAYER_TWO)
+        waitingForEngine = engineThinking or not worker.isIdle() or (not humanTurn and len(validMoves) != 0)
+        if drawnSquares and not waitingForEngine:
+            events = [p.event.wait()] + p.event.get() # nothing to animate, sleep until there is input
+        else:
+            events = p.event.get()
+        for e in events:
             if e.type == p.QUIT:
                 running = False
+            elif e.type == p.VIDEOEXPOSE: # the window was covered or restored, draw everything again
+                drawnSquares.clear()
+            elif e.type == p.VIDEORESIZE:
+                screen = resizeBoard(e.w, e.h)
+                drawnSquares.clear()
             # mouse handler
-            elif e.type == p.MOUSEBUTTONDOWN:
+            elif e.type == p.MOUSEBUTTONDOWN and humanTurn:
                 location = p.mouse.get_pos() # (x,y) location of the mouse
                 col = location[0]//SQ_SIZE
                 row = location[1]//SQ_SIZE
@@ -57,8 +150,9 @@ def main():
                 if len(playerClicks) == 2: # after the 2nd click
                     move = ChessEngine.Move(playerClicks[0], playerClicks[1], gs.board)
                     print(move.getChessNotation())
-                    if move in validMoves:
-                        gs.makeMove(move)
+                    if move.moveID in validMoves:
+                        worker.cancel() # a hint for the old position is no use any more
+                        gs.makeMove(gs.moveFromID(move.moveID)) # the engine's move knows about castling, en passant and promotion
                         moveMade = True
                         sqSelected = () #reset user clicks
                         playerClicks = []
@@ -67,22 +161,78 @@ def main():
             # key handlers
             elif e.type == p.KEYDOWN:
                 if e.key == p.K_z: # undo when 'z' is pressed
+                    worker.cancel() # stop thinking about the position that is being taken back
+                    engineThinking = False
                     gs.undoMove()
                     moveMade = True
+                elif e.key == p.K_h and humanTurn and len(validMoves) != 0: # ask the engine for a hint
+                    hintMove = None
+                    worker.start(gs, ENGINE_THINK_TIME)
         if moveMade:
-            validMoves = gs.getValidMoves()
+            validMoves = set(gs.getValidMoveIDs())
             moveMade = False
+            hintMove = None
+            sqSelected = ()
+            playerClicks = []
 
-        drawGameState(screen, gs)
+        # the engine plays its move once the worker is done, the loop keeps drawing in the meantime
+        humanTurn = (gs.whiteToMove and PLAYER_ONE) or (not gs.whiteToMove and PLAYER_TWO)
+        if not humanTurn and not engineThinking and len(validMoves) != 0:
+            worker.start(gs, ENGINE_THINK_TIME)
+            engineThinking = True
+        result = worker.poll()
+        if result is not None:
+            if engineThinking:
+                engineThinking = False
+                if result.bestMove is not None:
+                    gs.makeMove(gs.moveFromID(result.bestMove))
+                    moveMade = True
+            else:
+                hintMove = result.bestMove
+        drawCaption(worker.getProgress() if worker.isBusy() else None, engineThinking)
+
+        dirtyRects = drawGameState(screen, gs, hintMove, drawnSquares)
+        if dirtyRects:
+            p.display.update(dirtyRects)
         clock.tick(MAX_FPS)
-        p.display.flip()
 
 """
-It is responsible for all the graphics within the current game state"""
-def drawGameState(screen, gs):
-    drawBoard(screen) # draw squares on the board
-    # add in piece highlighting or move suggestions (later)
-    drawPieces(screen, gs.board) # draw pieces on top of those squares
+Show what the engine is doing in the window title: the depth it has finished and its best move so far"""
+def drawCaption(progress, engineThinking):
+    caption = "UIChess"
+    if progress is not None:
+        caption += " - %s depth %d, best %s (%+d)" % ("thinking" if engineThinking else "hint", progress.depth,
+                                                     ChessEngine.Move.notationFromID(progress.bestMove), progress.score)
+    if p.display.get_caption()[0] != caption:
+        p.display.set_caption(caption)
+
+"""
+It is responsible for all the graphics within the current game state. Only the squares that look different from
+the last frame (drawnSquares) are drawn, their rects are returned for p.display.update"""
+def drawGameState(screen, gs, hintMove=None, drawnSquares=None):
+    if drawnSquares is None:
+        drawnSquares = {}
+    hintSquares = () if hintMove is None else (hintMove & 63, hintMove >> 6 & 63)
+    dirtyRects = []
+    for r in range(DIMENSION):
+        for c in range(DIMENSION):
+            sq = r*8 + c
+            state = (gs.board[r][c], sq in hintSquares)
+            if drawnSquares.get(sq) != state:
+                drawnSquares[sq] = state
+                rect = p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE)
+                drawSquare(screen, rect, *state)
+                dirtyRects.append(rect)
+    return dirtyRects
+
+"""
+Draw one square: the board under it, the hint shade and the piece"""
+def drawSquare(screen, rect, piece, highlighted):
+    screen.blit(BOARD_SURFACE, rect, rect) # copy the square from the pre-rendered board
+    if highlighted:
+        screen.blit(HIGHLIGHT_SURFACE, rect) # show the engine's hint
+    if piece != "--": # not empty square
+        screen.blit(IMAGES[piece], rect)
 
 """
 Draw the squares on the board. The top left square is always light
@@ -93,15 +243,6 @@ def drawBoard(screen):
         for c in range(DIMENSION):
             color = colors[((r+c)%2)]
             p.draw.rect(screen, color, p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))
-"""
-Draw the pieces on the board using the current GameState.board
-"""
-def drawPieces(screen, board):
-    for r in range(DIMENSION):
-        for c in range(DIMENSION):
-            piece = board[r][c]
-            if piece != "--": # not empty square
-                screen.blit(IMAGES[piece], p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,134 @@
+"""
+PGN reading and standard algebraic notation (SAN) for GameState. Games are read one at a time from any iterable of
+lines, so a file of any size can be streamed:
+
+    with open("games.pgn") as pgnFile:
+        for game in readGames(pgnFile):
+            gs = GameState()
+            for san in game["moves"]:
+                gs.makeMove(gs.moveFromID(parseSAN(gs, san)))
+"""
+
+import re
+
+from Chess import ChessEngine
+
+SAN_PATTERN = re.compile(r"^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$")
+TOKEN_PATTERN = re.compile(r"\{[^}]*\}|;[^\n]*|\$\d+|\(|\)|[^\s{}();]+")
+MOVE_NUMBER_PATTERN = re.compile(r"^\d+\.+")
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+
+"""
+The move ID of a SAN move ("e4", "Nbd7", "exd8=Q+", "O-O") in the position, raises ValueError when it is not one of
+the valid moves or when it is ambiguous"""
+def parseSAN(gs, san):
+    san = san.rstrip("+#!?").replace("0", "O")
+    validMoves = gs.getValidMoveIDs()
+    if san in ("O-O", "O-O-O"):
+        endCol = 6 if san == "O-O" else 2
+        for moveID in validMoves:
+            startRow, startCol = divmod(moveID & 63, 8)
+            if gs.board[startRow][startCol][1] == "K" and startCol == 4 and (moveID >> 6 & 63) % 8 == endCol:
+                return moveID
+        raise ValueError("illegal move %r" % san)
+    match = SAN_PATTERN.match(san)
+    if match is None:
+        raise ValueError("cannot parse move %r" % san)
+    piece, fromFile, fromRank, target, promotion = match.groups()
+    piece = piece or "p"
+    endSq = ChessEngine.Move.ranksToRows[target[1]] * 8 + ChessEngine.Move.filesToCols[target[0]]
+    promotionCode = ChessEngine.Move.promotionCodes[promotion] if promotion else 0
+    found = []
+    for moveID in validMoves:
+        if moveID >> 6 & 63 != endSq or moveID >> 12 != promotionCode:
+            continue
+        startRow, startCol = divmod(moveID & 63, 8)
+        if gs.board[startRow][startCol][1] != piece:
+            continue
+        if fromFile is not None and ChessEngine.Move.colsToFiles[startCol] != fromFile:
+            continue
+        if fromRank is not None and ChessEngine.Move.rowsToRanks[startRow] != fromRank:
+            continue
+        found.append(moveID)
+    if len(found) != 1:
+        raise ValueError("%s move %r" % ("ambiguous" if found else "illegal", san))
+    return found[0]
+
+"""
+SAN of a valid move ID in the position, with "+" or "#" when it gives check or mate"""
+def getSAN(gs, moveID):
+    move = gs.moveFromID(moveID)
+    if move.isCastleMove:
+        san = "O-O" if move.endCol == 6 else "O-O-O"
+    else:
+        piece = move.pieceMoved[1]
+        target = move.getRankFile(move.endRow, move.endCol)
+        capture = move.pieceCaptured != "--"
+        if piece == "p":
+            san = (move.colsToFiles[move.startCol] + "x" if capture else "") + target
+            if move.isPawnPromotion:
+                san += "=" + move.promotionChoice
+        else:
+            # other pieces of the same type that can reach the target square
+            others = [otherID & 63 for otherID in gs.getValidMoveIDs() if otherID != moveID and
+                      otherID >> 6 & 63 == moveID >> 6 & 63 and gs.board[(otherID & 63) // 8][otherID & 7] == move.pieceMoved]
+            disambiguation = ""
+            if others:
+                if all(sq % 8 != move.startCol for sq in others):
+                    disambiguation = move.colsToFiles[move.startCol]
+                elif all(sq // 8 != move.startRow for sq in others):
+                    disambiguation = move.rowsToRanks[move.startRow]
+                else:
+                    disambiguation = move.getRankFile(move.startRow, move.startCol)
+            san = piece + disambiguation + ("x" if capture else "") + target
+    gs.makeMove(move)
+    replies = gs.getValidMoveIDs() # also works out inCheck
+    if gs.inCheck:
+        san += "#" if len(replies) == 0 else "+"
+    gs.undoMove()
+    return san
+
+"""
+Split PGN movetext into SAN moves and the result, skipping move numbers, comments, NAGs and variations"""
+def parseMovetext(movetext):
+    moves = []
+    result = None
+    variationDepth = 0
+    for token in TOKEN_PATTERN.findall(movetext):
+        if token == "(":
+            variationDepth += 1
+        elif token == ")":
+            variationDepth -= 1
+        elif variationDepth > 0 or token[0] in "{;$":
+            continue
+        elif token in RESULTS:
+            result = token
+        else:
+            token = MOVE_NUMBER_PATTERN.sub("", token)
+            if token:
+                moves.append(token)
+    return moves, result
+
+"""
+Generator of the games in an iterable of PGN lines. Each game is a dictionary with its "headers", the SAN "moves"
+of the main line and the "result". Only one game is held in memory at a time"""
+def readGames(lines):
+    headers = {}
+    movetext = []
+    for line in lines:
+        line = line.strip()
+        if line.startswith("[") and line.endswith("]"):
+            if movetext: # a header after movetext starts the next game
+                yield makeGame(headers, movetext)
+                headers = {}
+                movetext = []
+            key, _, value = line[1:-1].partition(" ")
+            headers[key] = value.strip().strip('"')
+        elif line:
+            movetext.append(line)
+    if headers or movetext:
+        yield makeGame(headers, movetext)
+
+def makeGame(headers, movetext):
+    moves, result = parseMovetext("\n".join(movetext))
+    return {"headers": headers, "moves": moves, "result": result or headers.get("Result")}
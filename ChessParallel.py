@@ -0,0 +1,239 @@
+"""
+Multi-core perft and search. Python threads can't run move generation on more than one core at a time, so the root
+of the tree is split into subtrees that are handed to a pool of worker processes and the results are merged.
+
+Workers never get Move objects (they hold a reference to the board), a task is just the FEN of the root position,
+the move IDs leading to the subtree and a depth, and the answer is plain numbers.
+
+    counts = parallelDivide(STARTING_FEN, 5, workers=32)   # {"e2e4": 9771632, ...}
+    result = parallelSearch(gs, maxTime=5.0, workers=32)    # SearchResult, like Searcher.search
+
+    python -m Chess.ChessParallel perft --depth 5 --workers 32
+    python -m Chess.ChessParallel search --fen "<fen>" --time 5 --workers 32
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from Chess import ChessEngine, ChessPerft, ChessSearch
+
+ENGINE_NAMES = {gameStateClass: name for name, gameStateClass in ChessPerft.ENGINES.items()}
+
+TASKS_PER_WORKER = 4 # perft splits deeper than the root until there are this many subtrees per worker
+
+WORKER_SEARCHER = None # one Searcher per worker process, see getWorkerSearcher
+WORKER_HASH_MEGABYTES = 16
+
+"""
+Build a GameState from the serialized form: engine name, FEN, the zobrist keys of the positions played before
+(for repetitions) and the move IDs to play from there"""
+def loadPosition(engine, fen, history=(), moveIDs=()):
+    gs = ChessPerft.ENGINES[engine]()
+    gs.loadFEN(fen)
+    if history:
+        gs.zobristKeyLog = list(history)
+    for moveID in moveIDs:
+        gs.makeMove(gs.moveFromID(moveID))
+    return gs
+
+def defaultWorkers():
+    return os.cpu_count() or 1
+
+"""
+Worker side of perft: the node count of one subtree"""
+def perftTask(engine, fen, moveIDs, depth):
+    return moveIDs, ChessPerft.perft(loadPosition(engine, fen, moveIDs=moveIDs), depth)
+
+"""
+Split the tree into move ID paths from the root, one ply deeper each time, until there are enough subtrees to keep
+every worker busy or the split reaches the leaves"""
+def splitTasks(gs, depth, minTasks):
+    paths = [()]
+    splitDepth = 0
+    while len(paths) < minTasks and splitDepth < depth - 1:
+        deeper = []
+        for path in paths:
+            for moveID in path:
+                gs.makeMove(gs.moveFromID(moveID))
+            deeper.extend(path + (moveID,) for moveID in gs.getValidMoveIDs())
+            for _ in path:
+                gs.undoMove()
+        paths = deeper
+        splitDepth += 1
+    return paths, depth - splitDepth
+
+"""
+Perft split by root move over a process pool, returns a dictionary of move notation to node count like
+ChessPerft.divide"""
+def parallelDivide(fen, depth, workers=None, engine="list", executor=None):
+    workers = workers or defaultWorkers()
+    gs = loadPosition(engine, fen)
+    counts = {ChessEngine.Move.notationFromID(moveID): 0 for moveID in gs.getValidMoveIDs()}
+    if depth <= 1:
+        return {notation: 1 for notation in counts} if depth == 1 else {}
+    paths, remainingDepth = splitTasks(gs, depth, workers * TASKS_PER_WORKER)
+    ownExecutor = executor is None
+    if ownExecutor:
+        executor = ProcessPoolExecutor(workers)
+    try:
+        futures = [executor.submit(perftTask, engine, fen, path, remainingDepth) for path in paths]
+        for future in futures:
+            path, nodes = future.result()
+            counts[ChessEngine.Move.notationFromID(path[0])] += nodes
+    finally:
+        if ownExecutor:
+            executor.shutdown()
+    return counts
+
+def parallelPerft(fen, depth, workers=None, engine="list", executor=None):
+    if depth == 0:
+        return 1
+    return sum(parallelDivide(fen, depth, workers, engine, executor).values())
+
+"""
+Run parallel perft on a FEN at a single depth and return the result as a dictionary, see ChessPerft.runPosition"""
+def runPosition(name, fen, depth, expected=None, showDivide=False, engine="list", workers=None, executor=None):
+    workers = workers or defaultWorkers()
+    start = time.perf_counter()
+    counts = parallelDivide(fen, depth, workers, engine, executor)
+    nodes = sum(counts.values())
+    seconds = time.perf_counter() - start
+    result = {"name": name, "engine": engine, "fen": fen, "depth": depth, "workers": workers, "nodes": nodes,
+              "expected": expected, "ok": None if expected is None else nodes == expected,
+              "seconds": round(seconds, 6), "nps": int(nodes / seconds) if seconds > 0 else None}
+    if showDivide:
+        result["divide"] = counts
+    return result
+
+"""
+The Searcher of this process, created on first use with hashMegabytes (by default the size given to
+initSearchWorker) and kept between tasks so its transposition table carries over. Every module that searches in
+pool processes shares it"""
+def getWorkerSearcher(hashMegabytes=None):
+    global WORKER_SEARCHER
+    if WORKER_SEARCHER is None:
+        WORKER_SEARCHER = ChessSearch.Searcher(hashMegabytes or WORKER_HASH_MEGABYTES)
+    return WORKER_SEARCHER
+
+def initSearchWorker(hashMegabytes):
+    global WORKER_HASH_MEGABYTES
+    WORKER_HASH_MEGABYTES = hashMegabytes
+
+"""
+Worker side of the root split search: the position after one root move searched to depth, or until the deadline
+(wall clock, so tasks that waited in the queue stop together with the others). Returns the move, the score from the
+child's point of view, its pv, the nodes and whether the depth was completed"""
+def searchTask(engine, fen, history, rootMove, depth, deadline):
+    remaining = None if deadline is None else deadline - time.time()
+    if remaining is not None and remaining <= 0: # the round is out of time before this move started
+        return rootMove, 0, [], 0, False
+    gs = loadPosition(engine, fen, history, (rootMove,))
+    result = getWorkerSearcher().search(gs, maxTime=remaining, maxDepth=depth)
+    # a mate found early holds at every deeper depth, and a position without moves needs no search
+    finished = result.depth >= depth or result.bestMove is None or \
+        abs(result.score) >= ChessSearch.MATE_SCORE - ChessSearch.MAX_PLY
+    return rootMove, result.score, list(result.pv), result.nodes, finished
+
+"""
+Turn a score of the position after a root move into a score of the root, mate distances grow by one ply"""
+def scoreFromChild(score):
+    score = -score
+    if score >= ChessSearch.MATE_SCORE - ChessSearch.MAX_PLY:
+        score -= 1
+    elif score <= -(ChessSearch.MATE_SCORE - ChessSearch.MAX_PLY):
+        score += 1
+    return score
+
+"""
+Root split search over a process pool, in rounds of one depth: every root move is searched to the same depth by
+the workers, the results are merged and the next round goes one ply deeper while the time manager allows it. A
+round cut off by the deadline is thrown away, the result is the best move of the last complete round. Alpha-beta
+can't share bounds between the workers, so this searches more nodes than Searcher.search for the same depth, but
+with enough cores it gets deeper in the same time."""
+def parallelSearch(gs, maxTime=None, maxDepth=None, workers=None, hashMegabytes=16, executor=None):
+    workers = workers or defaultWorkers()
+    timeManager = ChessSearch.TimeManager(maxTime=maxTime)
+    rootMoves = list(gs.getValidMoveIDs())
+    if not rootMoves:
+        return ChessSearch.SearchResult(None, -ChessSearch.MATE_SCORE if gs.inCheck else 0, 0, [], 0, 0.0)
+    if maxTime is None and maxDepth is None:
+        maxDepth = 5
+    if maxDepth is not None and maxDepth <= 1: # the children would be searched to depth 0, nothing to split
+        return ChessSearch.Searcher(hashMegabytes).search(gs, maxDepth=1)
+    maxChildDepth = ChessSearch.MAX_PLY - 2 if maxDepth is None else maxDepth - 1
+    # the workers share the deadline as wall clock time
+    deadline = None if maxTime is None else time.time() + timeManager.hardDeadline - time.perf_counter()
+    engine = ENGINE_NAMES[type(gs)]
+    fen = gs.getFEN()
+    history = tuple(gs.zobristKeyLog)
+
+    ownExecutor = executor is None
+    if ownExecutor:
+        executor = ProcessPoolExecutor(min(workers, len(rootMoves)), initializer=initSearchWorker,
+                                       initargs=(hashMegabytes,))
+    nodes = 0
+    best = None
+    try:
+        for childDepth in range(1, maxChildDepth + 1):
+            if childDepth > 1 and not timeManager.canStartIteration():
+                break
+            roundDeadline = None if childDepth == 1 else deadline # the first round always finishes
+            futures = [executor.submit(searchTask, engine, fen, history, moveID, childDepth, roundDeadline)
+                       for moveID in rootMoves]
+            results = [future.result() for future in futures]
+            nodes += sum(result[3] for result in results)
+            if not all(result[4] for result in results):
+                break
+            scored = sorted(((scoreFromChild(score), moveID, pv) for moveID, score, pv, _, _ in results),
+                            key=lambda result: result[0], reverse=True)
+            best = (scored[0][0], [scored[0][1]] + scored[0][2], childDepth + 1)
+            rootMoves = [moveID for _, moveID, _ in scored] # best first, so they finish first next round
+            if all(abs(score) >= ChessSearch.MATE_SCORE - ChessSearch.MAX_PLY or not pv for score, _, pv in scored):
+                break # every root move is decided
+    finally:
+        if ownExecutor:
+            executor.shutdown()
+    score, pv, depth = best
+    return ChessSearch.SearchResult(pv[0], score, depth, pv, nodes, timeManager.elapsed())
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perft and search split over a pool of worker processes")
+    parser.add_argument("mode", choices=("perft", "search"))
+    parser.add_argument("--fen", help="position, perft runs the standard suite when not given")
+    parser.add_argument("--depth", type=int, default=None, help="depth (perft suite: maximum depth)")
+    parser.add_argument("--expected", type=int, default=None, help="known perft node count for --fen at --depth")
+    parser.add_argument("--divide", action="store_true", help="also report the perft node count of each root move")
+    parser.add_argument("--time", type=float, default=None, help="seconds to search")
+    parser.add_argument("--hash", type=float, default=16, help="transposition table size in MB of each search worker")
+    parser.add_argument("--engine", choices=sorted(ChessPerft.ENGINES), default="bitboard")
+    parser.add_argument("--workers", type=int, default=defaultWorkers(), help="number of worker processes")
+    args = parser.parse_args(argv)
+
+    if args.mode == "search":
+        gs = loadPosition(args.engine, args.fen or ChessPerft.STARTING_FEN)
+        result = parallelSearch(gs, args.time, args.depth, args.workers, args.hash)
+        print(json.dumps(dict(result.toDict(), workers=args.workers, final=True)), flush=True)
+        return 0
+
+    failures = 0
+    with ProcessPoolExecutor(args.workers) as executor: # started once for the whole suite
+        if args.fen:
+            results = [runPosition("custom", args.fen, args.depth or 1, args.expected, args.divide, args.engine,
+                                   args.workers, executor)]
+        else:
+            results = (runPosition(name, fen, depth, expectedCounts[depth - 1], engine=args.engine,
+                                   workers=args.workers, executor=executor)
+                       for name, fen, expectedCounts in ChessPerft.PERFT_POSITIONS
+                       for depth in range(1, min(args.depth or ChessPerft.DEFAULT_SUITE_DEPTH, len(expectedCounts)) + 1))
+        for result in results:
+            if result["ok"] is False:
+                failures += 1
+            print(json.dumps(result), flush=True)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""
+Perft (performance test) harness for the move generator. It walks the tree of legal moves to a fixed depth and
+counts the leaf nodes, which can be compared against the well known node counts of standard test positions.
+A wrong count means GameState.getValidMoves produced an illegal move or missed a legal one, and the timing
+gives the move generation throughput in nodes per second.
+
+Every result is printed as one JSON object per line so runs can be saved and compared between releases.
+
+    python -m Chess.ChessPerft                      # run the standard suite
+    python -m Chess.ChessPerft --depth 4            # run the suite up to depth 4
+    python -m Chess.ChessPerft --fen "<fen>" --depth 3 --divide
+    python -m Chess.ChessPerft --engine bitboard     # test the bitboard backend instead of the board list
+    python -m Chess.ChessPerft --hash 64             # cache the valid moves of repeated positions in 64 MB
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from Chess import ChessBitboard, ChessEngine, ChessTransposition
+
+STARTING_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# standard perft positions with their known node counts by depth: https://www.chessprogramming.org/Perft_Results
+PERFT_POSITIONS = [
+    ("startpos", STARTING_FEN,
+     [20, 400, 8902, 197281, 4865609]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862, 4085603]),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     [14, 191, 2812, 43238, 674624]),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     [6, 264, 9467, 422333]),
+    ("position5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     [44, 1486, 62379, 2103487]),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594]),
+]
+
+DEFAULT_SUITE_DEPTH = 3
+
+ENGINES = {"list": ChessEngine.GameState, "bitboard": ChessBitboard.GameState}
+
+"""
+Count the leaf nodes of the legal move tree below the current position"""
+def perft(gs, depth):
+    if depth == 0:
+        return 1
+    moveIDs = gs.getValidMoveIDs()
+    if depth == 1: # bulk counting, the leaves don't need to be made
+        return len(moveIDs)
+    nodes = 0
+    for moveID in moveIDs:
+        gs.makeMove(gs.moveFromID(moveID))
+        nodes += perft(gs, depth - 1)
+        gs.undoMove()
+    return nodes
+
+"""
+Perft split by root move, returns a dictionary of move notation to node count. Comparing this against another
+engine's divide output is the fastest way to find the move that is generated wrong"""
+def divide(gs, depth):
+    counts = {}
+    for moveID in gs.getValidMoveIDs():
+        gs.makeMove(gs.moveFromID(moveID))
+        counts[ChessEngine.Move.notationFromID(moveID)] = perft(gs, depth - 1)
+        gs.undoMove()
+    return counts
+
+"""
+Run perft (or divide) on a FEN at a single depth and return the result as a dictionary"""
+def runPosition(name, fen, depth, expected=None, showDivide=False, engine="list", hashMegabytes=0):
+    gs = ENGINES[engine]()
+    gs.loadFEN(fen)
+    if hashMegabytes:
+        gs.transpositionTable = ChessTransposition.TranspositionTable(hashMegabytes)
+    start = time.perf_counter()
+    if showDivide:
+        counts = divide(gs, depth)
+        nodes = sum(counts.values())
+    else:
+        nodes = perft(gs, depth)
+    seconds = time.perf_counter() - start
+    result = {"name": name, "engine": engine, "fen": fen, "depth": depth, "nodes": nodes, "expected": expected,
+              "ok": None if expected is None else nodes == expected,
+              "seconds": round(seconds, 6), "nps": int(nodes / seconds) if seconds > 0 else None}
+    if showDivide:
+        result["divide"] = counts
+    if gs.transpositionTable is not None:
+        result["hash"] = gs.transpositionTable.getStats()
+    return result
+
+"""
+Run every standard position from depth 1 up to maxDepth, yields one result per position and depth"""
+def runSuite(maxDepth=DEFAULT_SUITE_DEPTH, positions=PERFT_POSITIONS, engine="list", hashMegabytes=0):
+    for name, fen, expectedCounts in positions:
+        for depth in range(1, min(maxDepth, len(expectedCounts)) + 1):
+            yield runPosition(name, fen, depth, expectedCounts[depth - 1], engine=engine, hashMegabytes=hashMegabytes)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perft node counts and move generation speed for ChessEngine")
+    parser.add_argument("--fen", help="position to test, runs the standard suite when not given")
+    parser.add_argument("--depth", type=int, default=None, help="search depth (suite: maximum depth)")
+    parser.add_argument("--expected", type=int, default=None, help="known node count for --fen at --depth")
+    parser.add_argument("--divide", action="store_true", help="also report the node count of each root move")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="list", help="GameState backend to test")
+    parser.add_argument("--hash", type=float, default=0, help="transposition table size in MB for the move cache")
+    args = parser.parse_args(argv)
+
+    if args.fen:
+        results = [runPosition("custom", args.fen, args.depth or 1, args.expected, args.divide, args.engine, args.hash)]
+    else:
+        results = runSuite(args.depth or DEFAULT_SUITE_DEPTH, engine=args.engine, hashMegabytes=args.hash)
+
+    totalNodes = 0
+    totalSeconds = 0.0
+    failures = 0
+    for result in results:
+        totalNodes += result["nodes"]
+        totalSeconds += result["seconds"]
+        if result["ok"] is False:
+            failures += 1
+        print(json.dumps(result), flush=True)
+    summary = {"summary": True, "engine": args.engine, "nodes": totalNodes, "seconds": round(totalSeconds, 6),
+               "nps": int(totalNodes / totalSeconds) if totalSeconds > 0 else None, "failures": failures}
+    print(json.dumps(summary), flush=True)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
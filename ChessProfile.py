@@ -0,0 +1,211 @@
+"""
+Opt-in instrumentation of the engine hot paths, without an external profiler. Nothing is wrapped until a Profiler is
+enabled, so a normal run pays nothing; while enabled it counts the calls and the time (inclusive of what they call) of
+the move generation of both engines (the piece generators of GameState.moveFunctions, generateMoveIDs, and what the
+staged generator of the search runs on: getPieceMoveIDs and getEnemyAttackMap, the bitboard attackedSquares and
+getPins), checkForPinsAndChecks, makeMove and undoMove, and the Move objects allocated. Every makeMove is a node for
+the nodes per second. getStagedMoveIDs itself is not timed, it only returns a generator.
+
+    profiler = ChessProfile.Profiler()
+    profiler.enable()
+    profiler.startDump("stats.json", interval=5) # optional, rewrites the file with getStats() every 5 seconds
+    ...
+    print(profiler.getStats())
+    profiler.disable()
+
+    python -m Chess.ChessProfile --fen "<fen>" --perft 4 --engine list
+    python -m Chess.ChessProfile --depth 5 --dump stats.json --interval 1
+
+The moveFunctions dictionary holds bound methods, so a GameState created before enable() keeps calling the plain
+piece generators until it is passed to attach(). disable() points those of the states it knows of back at the
+plain methods.
+"""
+
+import argparse
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import weakref
+
+from Chess import ChessEngine, ChessPerft, ChessSearch
+
+PIECE_GENERATORS = ("getPawnMoves", "getRookMoves", "getKnightMoves", "getBishopMoves", "getQueenMoves", "getKingMoves")
+INSTRUMENTED_METHODS = PIECE_GENERATORS + ("getPieceMoveIDs", "getEnemyAttackMap", "attackedSquares", "getPins",
+                                           "checkForPinsAndChecks", "makeMove", "undoMove", "generateMoveIDs")
+
+ACTIVE_PROFILER = None # the enabled Profiler, the class methods can only be wrapped once
+
+class Profiler():
+    def __init__(self):
+        self.enabled = False
+        self.counters = {} # name: [calls, seconds]
+        self.allocations = [0]
+        self.originals = [] # (owner, name, function) to put back on disable
+        self.states = weakref.WeakSet() # GameStates whose moveFunctions hold instrumented methods
+        self.start = None
+        self.seconds = 0.0 # enabled time before the current start
+        self.dumpThread = None
+        self.dumpStop = threading.Event()
+
+    """
+    Wrap the methods of both engines and Move.__init__. Only one Profiler can be enabled at a time"""
+    def enable(self):
+        global ACTIVE_PROFILER
+        if self.enabled:
+            return
+        if ACTIVE_PROFILER is not None:
+            raise RuntimeError("another Profiler is already enabled")
+        ACTIVE_PROFILER = self
+        for engine in ChessPerft.ENGINES.values():
+            for name in INSTRUMENTED_METHODS:
+                if name in vars(engine): # only the methods the class defines itself, not the inherited ones
+                    function = vars(engine)[name]
+                    key = "%s.%s" % (engine.__module__.split(".")[-1], name)
+                    counter = self.counters.setdefault(key, [0, 0.0])
+                    self.originals.append((engine, name, function))
+                    setattr(engine, name, self.makeTimer(function, counter))
+        self.originals.append((ChessEngine.Move, "__init__", ChessEngine.Move.__init__))
+        ChessEngine.Move.__init__ = self.makeAllocationCounter(ChessEngine.Move.__init__)
+        self.originals.append((ChessEngine.GameState, "__init__", ChessEngine.GameState.__init__))
+        ChessEngine.GameState.__init__ = self.makeStateTracker(ChessEngine.GameState.__init__)
+        self.enabled = True
+        self.start = time.perf_counter()
+
+    """
+    Put the original methods back, the counters are kept"""
+    def disable(self):
+        global ACTIVE_PROFILER
+        if not self.enabled:
+            return
+        self.stopDump()
+        for owner, name, function in reversed(self.originals):
+            setattr(owner, name, function)
+        self.originals = []
+        for gs in list(self.states): # nothing may go through the wrappers once disabled
+            self.attach(gs)
+        self.states = weakref.WeakSet()
+        self.seconds += time.perf_counter() - self.start
+        self.enabled = False
+        ACTIVE_PROFILER = None
+
+    """
+    Point the moveFunctions of a GameState at the piece generators of its class as they are now: the instrumented
+    ones for a state made before enable(), the plain ones again after disable()"""
+    def attach(self, gs):
+        gs.moveFunctions = {piece: getattr(gs, function.__name__) for piece, function in gs.moveFunctions.items()}
+        if self.enabled:
+            self.states.add(gs)
+
+    def reset(self):
+        for counter in self.counters.values():
+            counter[0] = 0
+            counter[1] = 0.0
+        self.allocations[0] = 0
+        self.seconds = 0.0
+        if self.enabled:
+            self.start = time.perf_counter()
+
+    def makeTimer(self, function, counter):
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            if not self.enabled: # a bound method kept from before disable()
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                counter[0] += 1
+                counter[1] += time.perf_counter() - start
+        return timed
+
+    def makeAllocationCounter(self, function):
+        allocations = self.allocations
+        @functools.wraps(function)
+        def counted(*args, **kwargs):
+            allocations[0] += 1
+            function(*args, **kwargs)
+        return counted
+
+    def makeStateTracker(self, function):
+        states = self.states
+        @functools.wraps(function)
+        def tracked(gs, *args, **kwargs):
+            function(gs, *args, **kwargs)
+            states.add(gs)
+        return tracked
+
+    def getElapsed(self):
+        return self.seconds + (time.perf_counter() - self.start if self.enabled else 0.0)
+
+    """
+    The counters as a dictionary that can be dumped as JSON. The counts are not locked, with several threads in
+    the engine at once they are close but not exact"""
+    def getStats(self):
+        seconds = self.getElapsed()
+        nodes = sum(counter[0] for name, counter in self.counters.items() if name.endswith(".makeMove"))
+        methods = {}
+        for name, (calls, methodSeconds) in sorted(self.counters.items()):
+            methods[name] = {"calls": calls, "seconds": round(methodSeconds, 6),
+                             "microsecondsPerCall": round(methodSeconds / calls * 1e6, 3) if calls else None}
+        return {"enabled": self.enabled, "seconds": round(seconds, 6), "nodes": nodes,
+                "nodesPerSecond": int(nodes / seconds) if seconds > 0 else None,
+                "moveAllocations": self.allocations[0],
+                "allocationsPerNode": round(self.allocations[0] / nodes, 3) if nodes else None, "methods": methods}
+
+    """
+    Write getStats() to path every interval seconds on a background thread, until stopDump or disable"""
+    def startDump(self, path, interval=10.0):
+        self.stopDump()
+        self.dumpStop.clear()
+        self.dumpThread = threading.Thread(target=self.dumpLoop, args=(path, interval), daemon=True)
+        self.dumpThread.start()
+
+    def stopDump(self):
+        if self.dumpThread is None:
+            return
+        self.dumpStop.set()
+        self.dumpThread.join()
+        self.dumpThread = None
+
+    def dumpLoop(self, path, interval):
+        while not self.dumpStop.wait(interval):
+            self.dump(path)
+        self.dump(path) # the final numbers
+
+    def dump(self, path):
+        tempPath = path + ".tmp"
+        with open(tempPath, "w", encoding="utf-8") as dumpFile:
+            json.dump(self.getStats(), dumpFile)
+        os.replace(tempPath, path) # readers never see a half written file
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a search or perft with the engine instrumented")
+    parser.add_argument("--fen", default=ChessPerft.STARTING_FEN)
+    parser.add_argument("--engine", choices=sorted(ChessPerft.ENGINES), default="bitboard")
+    parser.add_argument("--depth", type=int, default=4, help="search depth")
+    parser.add_argument("--perft", type=int, default=None, help="run perft to this depth instead of a search")
+    parser.add_argument("--dump", default=None, help="JSON file rewritten with the stats while running")
+    parser.add_argument("--interval", type=float, default=10.0, help="seconds between dumps")
+    args = parser.parse_args(argv)
+
+    profiler = Profiler()
+    profiler.enable()
+    if args.dump:
+        profiler.startDump(args.dump, args.interval)
+    try:
+        gs = ChessPerft.ENGINES[args.engine]()
+        gs.loadFEN(args.fen)
+        if args.perft is not None:
+            ChessPerft.perft(gs, args.perft)
+        else:
+            ChessSearch.Searcher().search(gs, maxDepth=args.depth)
+    finally:
+        profiler.disable()
+    print(json.dumps(profiler.getStats()), flush=True)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,401 @@
+"""
+Alpha-beta search on top of GameState (either engine). Negamax with a transposition table, iterative deepening
+under a deadline based time manager, move ordering (hash move, MVV-LVA captures, killer moves, history heuristic)
+and a quiescence search of captures at the leaves. It returns the best move with its principal variation.
+
+    searcher = Searcher()
+    result = searcher.search(gs, maxTime=2.0)
+    gs.makeMove(gs.moveFromID(result.bestMove))
+
+    python -m Chess.ChessSearch --fen "<fen>" --time 2
+"""
+
+import argparse
+import itertools
+import json
+import sys
+import time
+
+from Chess import ChessBitboard, ChessBook, ChessEngine, ChessTransposition
+
+MATE_SCORE = 100000
+INFINITY = 1000000
+MAX_PLY = 128
+NODES_BETWEEN_TIME_CHECKS = 1024
+
+PIECE_VALUES = {"p": 100, "N": 320, "B": 330, "R": 500, "Q": 900, "K": 0}
+
+# piece square tables from white's point of view, row 0 is the 8th rank like GameState.board
+PIECE_SQUARE_TABLES = {
+    "p": ((0, 0, 0, 0, 0, 0, 0, 0),
+          (50, 50, 50, 50, 50, 50, 50, 50),
+          (10, 10, 20, 30, 30, 20, 10, 10),
+          (5, 5, 10, 25, 25, 10, 5, 5),
+          (0, 0, 0, 20, 20, 0, 0, 0),
+          (5, -5, -10, 0, 0, -10, -5, 5),
+          (5, 10, 10, -20, -20, 10, 10, 5),
+          (0, 0, 0, 0, 0, 0, 0, 0)),
+    "N": ((-50, -40, -30, -30, -30, -30, -40, -50),
+          (-40, -20, 0, 0, 0, 0, -20, -40),
+          (-30, 0, 10, 15, 15, 10, 0, -30),
+          (-30, 5, 15, 20, 20, 15, 5, -30),
+          (-30, 0, 15, 20, 20, 15, 0, -30),
+          (-30, 5, 10, 15, 15, 10, 5, -30),
+          (-40, -20, 0, 5, 5, 0, -20, -40),
+          (-50, -40, -30, -30, -30, -30, -40, -50)),
+    "B": ((-20, -10, -10, -10, -10, -10, -10, -20),
+          (-10, 0, 0, 0, 0, 0, 0, -10),
+          (-10, 0, 5, 10, 10, 5, 0, -10),
+          (-10, 5, 5, 10, 10, 5, 5, -10),
+          (-10, 0, 10, 10, 10, 10, 0, -10),
+          (-10, 10, 10, 10, 10, 10, 10, -10),
+          (-10, 5, 0, 0, 0, 0, 5, -10),
+          (-20, -10, -10, -10, -10, -10, -10, -20)),
+    "R": ((0, 0, 0, 0, 0, 0, 0, 0),
+          (5, 10, 10, 10, 10, 10, 10, 5),
+          (-5, 0, 0, 0, 0, 0, 0, -5),
+          (-5, 0, 0, 0, 0, 0, 0, -5),
+          (-5, 0, 0, 0, 0, 0, 0, -5),
+          (-5, 0, 0, 0, 0, 0, 0, -5),
+          (-5, 0, 0, 0, 0, 0, 0, -5),
+          (0, 0, 0, 5, 5, 0, 0, 0)),
+    "Q": ((-20, -10, -10, -5, -5, -10, -10, -20),
+          (-10, 0, 0, 0, 0, 0, 0, -10),
+          (-10, 0, 5, 5, 5, 5, 0, -10),
+          (-5, 0, 5, 5, 5, 5, 0, -5),
+          (0, 0, 5, 5, 5, 5, 0, -5),
+          (-10, 5, 5, 5, 5, 5, 0, -10),
+          (-10, 0, 5, 0, 0, 0, 0, -10),
+          (-20, -10, -10, -5, -5, -10, -10, -20)),
+    "K": ((-30, -40, -40, -50, -50, -40, -40, -30),
+          (-30, -40, -40, -50, -50, -40, -40, -30),
+          (-30, -40, -40, -50, -50, -40, -40, -30),
+          (-30, -40, -40, -50, -50, -40, -40, -30),
+          (-20, -30, -30, -40, -40, -30, -30, -20),
+          (-10, -20, -20, -20, -20, -20, -20, -10),
+          (20, 20, 0, 0, 0, 0, 20, 20),
+          (20, 30, 10, 0, 0, 10, 30, 20)),
+}
+
+"""
+PIECE_SQUARE_VALUES[piece][row][col] is the material plus square value of a piece, positive for white and
+negative for black (black reads the white table upside down)"""
+def buildPieceSquareValues():
+    values = {}
+    for type, table in PIECE_SQUARE_TABLES.items():
+        values["w" + type] = [[PIECE_VALUES[type] + table[r][c] for c in range(8)] for r in range(8)]
+        values["b" + type] = [[-(PIECE_VALUES[type] + table[7 - r][c]) for c in range(8)] for r in range(8)]
+    return values
+
+PIECE_SQUARE_VALUES = buildPieceSquareValues()
+
+"""
+Static evaluation in centipawns from the point of view of the side to move"""
+def evaluate(gs):
+    score = 0
+    for r in range(8):
+        row = gs.board[r]
+        for c in range(8):
+            piece = row[c]
+            if piece != "--":
+                score += PIECE_SQUARE_VALUES[piece][r][c]
+    return score if gs.whiteToMove else -score
+
+"""
+True for captures (en passant included) and promotions, the moves the quiescence search looks at"""
+def isTactical(gs, moveID):
+    endRow, endCol = divmod(moveID >> 6 & 63, 8)
+    if gs.board[endRow][endCol] != "--" or moveID >> 12:
+        return True
+    startRow, startCol = divmod(moveID & 63, 8)
+    return startCol != endCol and gs.board[startRow][startCol][1] == "p"
+
+"""
+Mate scores are stored in the table relative to the node so they stay right when reached at another ply"""
+def scoreToTable(score, ply):
+    if score > MATE_SCORE - MAX_PLY:
+        return score + ply
+    if score < -MATE_SCORE + MAX_PLY:
+        return score - ply
+    return score
+
+def scoreFromTable(score, ply):
+    if score > MATE_SCORE - MAX_PLY:
+        return score - ply
+    if score < -MATE_SCORE + MAX_PLY:
+        return score + ply
+    return score
+
+class SearchAborted(Exception):
+    pass
+
+"""
+Works out the deadlines of a search. With a fixed move time the whole time can be used. With a clock the search
+gets a slice of the remaining time, does not start another iteration after half of the slice has gone (it would
+most likely not finish) and is stopped at the hard deadline whatever happens."""
+class TimeManager():
+    def __init__(self, maxTime=None, remaining=None, increment=0.0, movesToGo=None, safetyMargin=0.05):
+        self.start = time.perf_counter()
+        if maxTime is not None:
+            budget = max(0.0, maxTime - safetyMargin)
+            self.softDeadline = self.start + budget
+            self.hardDeadline = self.start + budget
+        elif remaining is not None:
+            budget = remaining / (movesToGo if movesToGo else 30) + increment * 0.8
+            budget = max(0.0, min(budget, remaining * 0.5 - safetyMargin))
+            self.softDeadline = self.start + budget * 0.5
+            self.hardDeadline = self.start + budget
+        else: # no time limit, stopped by depth or stop()
+            self.softDeadline = None
+            self.hardDeadline = None
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def canStartIteration(self):
+        return self.softDeadline is None or time.perf_counter() < self.softDeadline
+
+    def isOutOfTime(self):
+        return self.hardDeadline is not None and time.perf_counter() >= self.hardDeadline
+
+class SearchResult():
+    def __init__(self, bestMove, score, depth, pv, nodes, seconds):
+        self.bestMove = bestMove # move ID, None when there is no legal move
+        self.score = score # centipawns from the side to move, +-(MATE_SCORE - plies) for a mate
+        self.depth = depth
+        self.pv = pv # principal variation as a list of move IDs
+        self.nodes = nodes
+        self.seconds = seconds
+
+    """
+    Number of moves to mate (negative when getting mated), None when the score is not a mate"""
+    def getMateIn(self):
+        if abs(self.score) < MATE_SCORE - MAX_PLY:
+            return None
+        plies = MATE_SCORE - abs(self.score)
+        return (plies + 1) // 2 if self.score > 0 else -((plies + 1) // 2)
+
+    def toDict(self):
+        return {"bestMove": ChessEngine.Move.notationFromID(self.bestMove) if self.bestMove is not None else None,
+                "score": self.score, "mateIn": self.getMateIn(), "depth": self.depth,
+                "pv": [ChessEngine.Move.notationFromID(moveID) for moveID in self.pv], "nodes": self.nodes,
+                "seconds": round(self.seconds, 6), "nps": int(self.nodes / self.seconds) if self.seconds > 0 else None}
+
+class Searcher():
+    def __init__(self, hashMegabytes=16, hashPolicy="depth", book=None):
+        self.transpositionTable = ChessTransposition.TranspositionTable(hashMegabytes, hashPolicy)
+        self.book = book # ChessBook.OpeningBook, its moves are played without searching
+        self.history = [0] * 4096 # indexed by the start and end square part of the move ID
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        self.stopped = False
+        self.canAbort = True
+        self.nodes = 0
+
+    """
+    Ask a running search to stop, it returns the result of the last completed iteration (depth 1 is always
+    completed first). The flag is cleared when a search ends, so a stop() that lands just before the search starts
+    still stops it"""
+    def stop(self):
+        self.stopped = True
+
+    """
+    Iterative deepening search of the position. Runs until maxDepth is done, the time manager runs out or stop()
+    is called; onIteration(result) is called after every completed depth. The position is left unchanged.
+    A position in the opening book returns the book move at once, with depth 0 and no nodes."""
+    def search(self, gs, maxTime=None, maxDepth=None, timeManager=None, onIteration=None):
+        if self.book is not None:
+            bookMove = self.book.getMove(gs)
+            if bookMove is not None:
+                self.stopped = False
+                return SearchResult(bookMove, 0, 0, [bookMove], 0, 0.0)
+        try:
+            return self.iterativeDeepening(gs, maxTime, maxDepth, timeManager, onIteration)
+        finally:
+            self.stopped = False
+
+    def iterativeDeepening(self, gs, maxTime, maxDepth, timeManager, onIteration):
+        if timeManager is None:
+            timeManager = TimeManager(maxTime=maxTime)
+        if maxDepth is None:
+            maxDepth = MAX_PLY - 1 if timeManager.hardDeadline is not None else 4
+        maxDepth = max(1, maxDepth)
+        self.timeManager = timeManager
+        self.nodes = 0
+        self.rootLength = len(gs.moveLog)
+        self.transpositionTable.newSearch()
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        self.history = [value // 8 for value in self.history] # age the history of earlier searches
+
+        if len(gs.getValidMoveIDs()) == 0:
+            return SearchResult(None, -MATE_SCORE if gs.inCheck else 0, 0, [], 0, timeManager.elapsed())
+        result = None
+        for depth in range(1, maxDepth + 1):
+            # depth 1 is never aborted, there is no move to answer with before it is done
+            self.canAbort = depth > 1
+            if depth > 1 and not timeManager.canStartIteration():
+                break
+            self.pvTable = [[] for _ in range(MAX_PLY + 1)]
+            try:
+                score = self.negamax(gs, depth, 0, -INFINITY, INFINITY)
+            except SearchAborted:
+                while len(gs.moveLog) > self.rootLength: # unwind the moves made by the aborted iteration
+                    gs.undoMove()
+                break
+            pv = self.extendPV(gs, self.pvTable[0], depth)
+            # the root always has a pv, its first move raises alpha from -INFINITY
+            result = SearchResult(pv[0], score, depth, pv, self.nodes, timeManager.elapsed())
+            if onIteration is not None:
+                onIteration(result)
+            if abs(score) >= MATE_SCORE - depth: # found a forced mate, deeper won't change it
+                break
+        result.nodes = self.nodes
+        result.seconds = timeManager.elapsed()
+        return result
+
+    """
+    A hash cutoff inside the principal variation leaves it short, follow the best moves stored in the table to
+    fill it up to the searched depth again"""
+    def extendPV(self, gs, pv, depth):
+        pv = list(pv)
+        for moveID in pv:
+            gs.makeMove(gs.moveFromID(moveID))
+        while len(pv) < depth:
+            entry = self.transpositionTable.probe(gs.zobristKey)
+            if entry is None or entry.bestMove is None or entry.bestMove not in gs.getValidMoveIDs():
+                break
+            pv.append(entry.bestMove)
+            gs.makeMove(gs.moveFromID(entry.bestMove))
+        for _ in pv:
+            gs.undoMove()
+        return pv
+
+    """
+    Check the clock every so many nodes and abort the search when it is out of time or stopped"""
+    def checkTime(self):
+        if self.canAbort and (self.stopped or self.timeManager.isOutOfTime()):
+            raise SearchAborted()
+
+    def negamax(self, gs, depth, ply, alpha, beta):
+        self.nodes += 1
+        if self.nodes % NODES_BETWEEN_TIME_CHECKS == 0:
+            self.checkTime()
+        self.pvTable[ply] = []
+        key = gs.zobristKey
+        if ply > 0 and key in gs.zobristKeyLog[-3::-2]: # repetition, count it as a draw
+            return 0
+        if depth <= 0:
+            return self.quiescence(gs, ply, alpha, beta)
+
+        hashMove = None
+        entry = self.transpositionTable.probe(key)
+        if entry is not None:
+            hashMove = entry.bestMove
+            if ply > 0 and entry.depth >= depth:
+                score = scoreFromTable(entry.score, ply)
+                if entry.flag == ChessTransposition.EXACT or \
+                        (entry.flag == ChessTransposition.LOWER_BOUND and score >= beta) or \
+                        (entry.flag == ChessTransposition.UPPER_BOUND and score <= alpha):
+                    return score
+
+        if ply >= MAX_PLY - 1:
+            if len(gs.getValidMoveIDs()) == 0:
+                return -MATE_SCORE + ply if gs.inCheck else 0
+            return evaluate(gs)
+
+        # staged generation, a cutoff by the hash move or a capture never generates the quiet moves
+        moves = gs.getStagedMoveIDs(hashMove, self.killers[ply], self.history)
+        inCheck = gs.inCheck
+        originalAlpha = alpha
+        bestScore = -INFINITY
+        bestMove = None
+        for moveID in moves:
+            tactical = isTactical(gs, moveID)
+            gs.makeMove(gs.moveFromID(moveID))
+            score = -self.negamax(gs, depth - 1, ply + 1, -beta, -alpha)
+            gs.undoMove()
+            if score > bestScore:
+                bestScore = score
+                bestMove = moveID
+                if score > alpha:
+                    alpha = score
+                    self.pvTable[ply] = [moveID] + self.pvTable[ply + 1]
+                    if alpha >= beta: # cutoff, remember quiet moves that caused it
+                        if not tactical:
+                            killers = self.killers[ply]
+                            if killers[0] != moveID:
+                                killers[1] = killers[0]
+                                killers[0] = moveID
+                            self.history[moveID & 4095] += depth * depth
+                        break
+        if bestMove is None: # no legal move
+            return -MATE_SCORE + ply if inCheck else 0
+
+        if bestScore <= originalAlpha:
+            flag = ChessTransposition.UPPER_BOUND
+        elif bestScore >= beta:
+            flag = ChessTransposition.LOWER_BOUND
+        else:
+            flag = ChessTransposition.EXACT
+        self.transpositionTable.store(key, depth, scoreToTable(bestScore, ply), flag, bestMove)
+        return bestScore
+
+    """
+    Search captures and promotions only until the position is quiet, so the static evaluation is not taken in
+    the middle of an exchange. When in check every evasion is searched"""
+    def quiescence(self, gs, ply, alpha, beta):
+        self.nodes += 1
+        if self.nodes % NODES_BETWEEN_TIME_CHECKS == 0:
+            self.checkTime()
+        self.pvTable[ply] = []
+        moves = gs.getStagedMoveIDs(None, self.killers[ply], self.history)
+        inCheck = gs.inCheck
+        firstMove = next(moves, None) # one legal move is enough to rule out mate and stalemate
+        if firstMove is None:
+            return -MATE_SCORE + ply if inCheck else 0
+        if ply >= MAX_PLY - 1:
+            return evaluate(gs)
+        if not inCheck:
+            standPat = evaluate(gs)
+            if standPat >= beta:
+                return standPat
+            if standPat > alpha:
+                alpha = standPat
+        for moveID in itertools.chain((firstMove,), moves):
+            if not inCheck and not isTactical(gs, moveID): # the captures and promotions came first
+                break
+            gs.makeMove(gs.moveFromID(moveID))
+            score = -self.quiescence(gs, ply + 1, -beta, -alpha)
+            gs.undoMove()
+            if score > alpha:
+                alpha = score
+                self.pvTable[ply] = [moveID] + self.pvTable[ply + 1]
+                if alpha >= beta:
+                    break
+        return alpha
+
+"""
+Convenience wrapper, returns the best Move for the position (or None when there is no legal move)"""
+def findBestMove(gs, maxTime=1.0, maxDepth=None):
+    result = Searcher().search(gs, maxTime=maxTime, maxDepth=maxDepth)
+    return gs.moveFromID(result.bestMove) if result.bestMove is not None else None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search a position with the ChessEngine alpha-beta searcher")
+    parser.add_argument("--fen", default="rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1")
+    parser.add_argument("--time", type=float, default=None, help="seconds to search")
+    parser.add_argument("--depth", type=int, default=None, help="maximum depth")
+    parser.add_argument("--hash", type=float, default=16, help="transposition table size in MB")
+    parser.add_argument("--engine", choices=("list", "bitboard"), default="bitboard")
+    parser.add_argument("--book", default=None, help="opening book file made by ChessBook")
+    args = parser.parse_args(argv)
+
+    gs = ChessBitboard.GameState() if args.engine == "bitboard" else ChessEngine.GameState()
+    gs.loadFEN(args.fen)
+    searcher = Searcher(args.hash, book=ChessBook.OpeningBook(args.book) if args.book else None)
+    onIteration = lambda result: print(json.dumps(result.toDict()), flush=True)
+    result = searcher.search(gs, maxTime=args.time, maxDepth=args.depth, onIteration=onIteration)
+    print(json.dumps(dict(result.toDict(), final=True)), flush=True)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,380 @@
+"""
+Asyncio game server, many games from one process over local TCP. The protocol is one JSON object per line each way,
+every request has a "cmd" and may have an "id" that is sent back with the answer:
+
+    {"cmd": "new"}                                  -> {"ok": true, "session": "1", "fen": "...", "status": "ongoing", ...}
+    {"cmd": "new", "fen": "<fen>"}
+    {"cmd": "move", "session": "1", "move": "e2e4"} -> the new position, or {"ok": false, "error": "illegal move e2e5"}
+    {"cmd": "moves", "session": "1"}                -> {"ok": true, "moves": ["a2a3", ...]}
+    {"cmd": "undo", "session": "1"}
+    {"cmd": "position", "session": "1"}
+    {"cmd": "search", "session": "1", "time": 1.0, "depth": null, "play": false}
+    {"cmd": "close", "session": "1"}
+
+Sessions are kept small: a game is its starting FEN and an array of 2 byte move IDs, not a GameState with a Move
+object per ply. Only the most recently used sessions keep a live GameState, the others are rebuilt by replaying
+their moves when they are used again, and sessions left idle are closed. Searches run in a process pool so a slow
+search never holds up the other clients.
+
+    python -m Chess.ChessServer serve --port 8765
+    python -m Chess.ChessServer bench --clients 200 --moves 40      # starts its own server unless --port is given
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import sys
+import time
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from Chess import ChessEngine, ChessParallel, ChessPerft
+
+DEFAULT_PORT = 8765
+MAX_SEARCH_TIME = 10.0 # seconds, longer searches asked for by a client are cut to this
+
+class Session():
+    __slots__ = ("sessionID", "startFEN", "moveIDs", "lastUsed")
+
+    def __init__(self, sessionID, startFEN):
+        self.sessionID = sessionID
+        self.startFEN = startFEN
+        self.moveIDs = array("H")
+        self.lastUsed = time.monotonic()
+
+class SessionPool():
+    def __init__(self, engine="bitboard", maxSessions=100000, maxLiveStates=512, idleTimeout=600.0):
+        self.engine = engine
+        self.maxSessions = maxSessions
+        self.maxLiveStates = maxLiveStates
+        self.idleTimeout = idleTimeout
+        self.sessions = {}
+        self.liveStates = OrderedDict() # session ID -> GameState, least recently used first
+        self.sessionIDs = itertools.count(1)
+
+    """
+    Start a new game, from the standard position or a FEN. Raises ValueError for a bad FEN or a full server"""
+    def create(self, fen=None):
+        if len(self.sessions) >= self.maxSessions:
+            self.evictIdle()
+            if len(self.sessions) >= self.maxSessions:
+                raise ValueError("too many sessions")
+        fen = fen or ChessPerft.STARTING_FEN
+        try:
+            gs = ChessParallel.loadPosition(self.engine, fen)
+            gs.getValidMoveIDs()
+        except ValueError as error:
+            raise ValueError("bad FEN %r: %s" % (fen, error))
+        session = Session(str(next(self.sessionIDs)), fen)
+        self.sessions[session.sessionID] = session
+        self.setLiveState(session, gs)
+        return session
+
+    def get(self, sessionID):
+        session = self.sessions.get(sessionID)
+        if session is None:
+            raise ValueError("unknown session %r" % sessionID)
+        session.lastUsed = time.monotonic()
+        return session
+
+    def close(self, sessionID):
+        self.sessions.pop(sessionID, None)
+        self.liveStates.pop(sessionID, None)
+
+    def setLiveState(self, session, gs):
+        self.liveStates[session.sessionID] = gs
+        self.liveStates.move_to_end(session.sessionID)
+        while len(self.liveStates) > self.maxLiveStates:
+            self.liveStates.popitem(last=False)
+
+    """
+    The GameState of a session, rebuilt from its starting FEN and move IDs when it is not live any more"""
+    def getState(self, session):
+        gs = self.liveStates.get(session.sessionID)
+        if gs is None:
+            gs = ChessParallel.loadPosition(self.engine, session.startFEN, moveIDs=session.moveIDs)
+        self.setLiveState(session, gs)
+        return gs
+
+    """
+    Play a move given in chess notation, raises ValueError when it can't be read or is not valid"""
+    def play(self, session, notation):
+        moveID = ChessEngine.Move.idFromNotation(notation)
+        gs = self.getState(session)
+        if moveID not in gs.getValidMoveIDs():
+            raise ValueError("illegal move %s" % notation)
+        gs.makeMove(gs.moveFromID(moveID))
+        session.moveIDs.append(moveID)
+        return gs
+
+    def undo(self, session):
+        gs = self.getState(session)
+        if session.moveIDs:
+            session.moveIDs.pop()
+            gs.undoMove()
+        return gs
+
+    """
+    Close the sessions that have not been used for idleTimeout seconds, returns how many"""
+    def evictIdle(self):
+        oldest = time.monotonic() - self.idleTimeout
+        idle = [sessionID for sessionID, session in self.sessions.items() if session.lastUsed < oldest]
+        for sessionID in idle:
+            self.close(sessionID)
+        return len(idle)
+
+    def getStats(self):
+        return {"sessions": len(self.sessions), "liveStates": len(self.liveStates), "engine": self.engine}
+
+"""
+The position of a session as sent to the client"""
+def describePosition(session, gs):
+    moves = gs.getValidMoveIDs()
+    return {"session": session.sessionID, "fen": gs.getFEN(), "ply": len(session.moveIDs),
+            "status": "checkmate" if gs.checkmate else "stalemate" if gs.stalemate else "ongoing",
+            "inCheck": gs.inCheck, "legalMoves": len(moves)}
+
+"""
+Runs in the pool: search the position given as engine, FEN and zobrist history"""
+def searchPosition(engine, fen, history, maxTime, maxDepth):
+    gs = ChessParallel.loadPosition(engine, fen, history)
+    return ChessParallel.getWorkerSearcher().search(gs, maxTime=maxTime, maxDepth=maxDepth).toDict()
+
+"""
+A field of a request, the default when it is missing or null. A value of another type raises ValueError (a bool is
+not taken for a number)"""
+def getField(request, name, types, default=None):
+    types = types if isinstance(types, tuple) else (types,)
+    value = request.get(name)
+    if value is None:
+        return default
+    if not isinstance(value, types) or (isinstance(value, bool) and bool not in types):
+        raise ValueError("bad %s field %r" % (name, value))
+    return value
+
+class GameServer():
+    def __init__(self, pool=None, searchWorkers=None, evictInterval=30.0):
+        self.pool = pool or SessionPool()
+        self.searchWorkers = searchWorkers
+        self.evictInterval = evictInterval
+        self.executor = None # started with the first search
+        self.server = None
+        self.evictTask = None
+        self.commands = {"new": self.cmdNew, "move": self.cmdMove, "moves": self.cmdMoves, "undo": self.cmdUndo,
+                         "position": self.cmdPosition, "search": self.cmdSearch, "close": self.cmdClose,
+                         "stats": self.cmdStats}
+
+    async def start(self, host="127.0.0.1", port=DEFAULT_PORT):
+        self.server = await asyncio.start_server(self.handleClient, host, port)
+        self.evictTask = asyncio.ensure_future(self.evictLoop())
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self.evictTask is not None:
+            self.evictTask.cancel()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+
+    async def evictLoop(self):
+        while True:
+            await asyncio.sleep(self.evictInterval)
+            self.pool.evictIdle()
+
+    """
+    Answer the requests of one connection in order until it closes"""
+    async def handleClient(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = await self.handleLine(line)
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError): # ValueError: a line over the stream limit
+            pass
+        except asyncio.CancelledError: # the server is shutting down
+            pass
+        finally:
+            writer.close()
+
+    async def handleLine(self, line):
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("a request must be a JSON object")
+        except ValueError as error:
+            return {"ok": False, "error": "bad request: %s" % error}
+        cmd = request.get("cmd")
+        command = self.commands.get(cmd) if isinstance(cmd, str) else None
+        try:
+            if command is None:
+                raise ValueError("unknown command %r" % request.get("cmd"))
+            response = dict(await command(request), ok=True)
+        except ValueError as error:
+            response = {"ok": False, "error": str(error)}
+        if "id" in request:
+            response["id"] = request["id"]
+        return response
+
+    async def cmdNew(self, request):
+        session = self.pool.create(getField(request, "fen", str))
+        return describePosition(session, self.pool.getState(session))
+
+    async def cmdMove(self, request):
+        session = self.pool.get(getField(request, "session", str))
+        return describePosition(session, self.pool.play(session, getField(request, "move", str, "")))
+
+    async def cmdMoves(self, request):
+        session = self.pool.get(getField(request, "session", str))
+        gs = self.pool.getState(session)
+        return {"session": session.sessionID, "moves": [ChessEngine.Move.notationFromID(moveID)
+                                                        for moveID in gs.getValidMoveIDs()]}
+
+    async def cmdUndo(self, request):
+        session = self.pool.get(getField(request, "session", str))
+        return describePosition(session, self.pool.undo(session))
+
+    async def cmdPosition(self, request):
+        session = self.pool.get(getField(request, "session", str))
+        return describePosition(session, self.pool.getState(session))
+
+    """
+    Search in the process pool, the event loop keeps serving the other clients meanwhile. With "play" the best move
+    is made as well, unless the game moved on while the search ran"""
+    async def cmdSearch(self, request):
+        session = self.pool.get(getField(request, "session", str))
+        gs = self.pool.getState(session)
+        if len(gs.getValidMoveIDs()) == 0:
+            raise ValueError("the game is over")
+        maxTime = min(getField(request, "time", (int, float), 1.0), MAX_SEARCH_TIME)
+        maxDepth = getField(request, "depth", int)
+        if maxTime <= 0 or (maxDepth is not None and maxDepth < 1):
+            raise ValueError("time and depth must be positive")
+        play = getField(request, "play", bool, False)
+        moveIDs = array("H", session.moveIDs) # the game as it was when the search started
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(self.searchWorkers)
+        result = await asyncio.get_running_loop().run_in_executor(
+            self.executor, searchPosition, self.pool.engine, gs.getFEN(), tuple(gs.zobristKeyLog), maxTime,
+            maxDepth)
+        response = {"session": session.sessionID, "search": result}
+        # an undo and another move meanwhile give the same ply count, compare the moves themselves
+        if play and session.sessionID in self.pool.sessions and session.moveIDs == moveIDs:
+            response.update(describePosition(session, self.pool.play(session, result["bestMove"])))
+        return response
+
+    async def cmdClose(self, request):
+        self.pool.close(getField(request, "session", str))
+        return {}
+
+    async def cmdStats(self, request):
+        return self.pool.getStats()
+
+class GameClient():
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.requestIDs = itertools.count(1)
+
+    @classmethod
+    async def connect(cls, host="127.0.0.1", port=DEFAULT_PORT):
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    """
+    Send one request and wait for its answer"""
+    async def request(self, cmd, **fields):
+        fields.update(cmd=cmd, id=next(self.requestIDs))
+        self.writer.write(json.dumps(fields).encode() + b"\n")
+        await self.writer.drain()
+        return json.loads(await self.reader.readline())
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else None
+
+"""
+Load test: every client plays random legal moves in its own session (a new game when one ends) and the latency of
+each move request is measured. Starts a server in this process when no port is given"""
+async def runBenchmark(clients=100, moves=50, host="127.0.0.1", port=None, engine="bitboard", seed=0):
+    server = None
+    if port is None:
+        server = GameServer(SessionPool(engine))
+        port = await server.start(host, 0)
+    latencies = []
+    rng = random.Random(seed)
+
+    async def playGames():
+        client = await GameClient.connect(host, port)
+        session = (await client.request("new"))["session"]
+        for _ in range(moves):
+            legalMoves = (await client.request("moves", session=session))["moves"]
+            if not legalMoves:
+                session = (await client.request("new"))["session"]
+                legalMoves = (await client.request("moves", session=session))["moves"]
+            start = time.perf_counter()
+            response = await client.request("move", session=session, move=rng.choice(legalMoves))
+            latencies.append(time.perf_counter() - start)
+            if not response["ok"]:
+                raise RuntimeError(response["error"])
+        await client.close()
+
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(playGames() for _ in range(clients)))
+    finally:
+        if server is not None:
+            await server.stop()
+    seconds = time.perf_counter() - start
+    return {"clients": clients, "moves": len(latencies), "seconds": round(seconds, 6),
+            "movesPerSecond": int(len(latencies) / seconds) if seconds > 0 else None,
+            "latencyMs": {"p50": round(percentile(latencies, 0.5) * 1000, 3),
+                          "p99": round(percentile(latencies, 0.99) * 1000, 3),
+                          "max": round(max(latencies) * 1000, 3)}}
+
+async def serve(host, port, pool, searchWorkers):
+    server = GameServer(pool, searchWorkers)
+    port = await server.start(host, port)
+    print(json.dumps({"listening": "%s:%d" % (host, port), "engine": pool.engine}), flush=True)
+    try:
+        await asyncio.Event().wait() # until the process is interrupted
+    finally:
+        await server.stop()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="JSON lines game server for many concurrent GameStates")
+    parser.add_argument("mode", choices=("serve", "bench"))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=None, help="port to serve on (%d) or benchmark" % DEFAULT_PORT)
+    parser.add_argument("--engine", choices=sorted(ChessPerft.ENGINES), default="bitboard")
+    parser.add_argument("--max-sessions", type=int, default=100000)
+    parser.add_argument("--live-states", type=int, default=512, help="sessions that keep a GameState in memory")
+    parser.add_argument("--idle-timeout", type=float, default=600.0, help="seconds before an unused session is closed")
+    parser.add_argument("--search-workers", type=int, default=None, help="processes for searches (default: cores)")
+    parser.add_argument("--clients", type=int, default=100, help="bench: concurrent connections")
+    parser.add_argument("--moves", type=int, default=50, help="bench: moves played by every client")
+    args = parser.parse_args(argv)
+
+    if args.mode == "bench":
+        print(json.dumps(asyncio.run(runBenchmark(args.clients, args.moves, args.host, args.port, args.engine))))
+        return 0
+    pool = SessionPool(args.engine, args.max_sessions, args.live_states, args.idle_timeout)
+    try:
+        asyncio.run(serve(args.host, DEFAULT_PORT if args.port is None else args.port, pool, args.search_workers))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
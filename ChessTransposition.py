@@ -0,0 +1,134 @@
+"""
+Transposition table keyed by GameState.zobristKey. Each entry can hold the valid move IDs of a position (so the
+moves of a repeated position are generated only once) and a search result (depth, score, bound and best move).
+
+The table has a fixed memory budget, worked out as a number of entries when it is created, and one of two
+replacement policies once it is full:
+    "depth" - a fixed size array indexed by key, a slot is only overwritten by a search at least as deep
+              (or by anything once the old entry is from a previous search)
+    "lru"   - the least recently used position is evicted
+"""
+
+import sys
+from array import array
+from collections import OrderedDict
+
+# search score bounds
+EXACT = 0
+LOWER_BOUND = 1 # the score failed high, the real score is at least this
+UPPER_BOUND = 2 # the score failed low, the real score is at most this
+
+REPLACEMENT_POLICIES = ("depth", "lru")
+
+class TranspositionEntry():
+    __slots__ = ("key", "depth", "score", "flag", "bestMove", "moves", "inCheck", "generation")
+
+    def __init__(self, key, generation):
+        self.key = key
+        self.depth = -1 # no search result yet
+        self.score = 0
+        self.flag = EXACT
+        self.bestMove = None
+        self.moves = None # array of valid move IDs
+        self.inCheck = False
+        self.generation = generation
+
+class TranspositionTable():
+    def __init__(self, megabytes=16, policy="depth"):
+        if policy not in REPLACEMENT_POLICIES:
+            raise ValueError("unknown replacement policy %r, expected one of %s" % (policy, ", ".join(REPLACEMENT_POLICIES)))
+        self.policy = policy
+        # an entry plus a typical list of valid moves, the slot (list or dict) and the key
+        self.entryBytes = sys.getsizeof(TranspositionEntry(0, 0)) + sys.getsizeof(array("H", range(40))) + \
+                          sys.getsizeof(1 << 63) + 16
+        self.capacity = max(1, int(megabytes * 1024 * 1024) // self.entryBytes)
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.clear()
+
+    def clear(self):
+        if self.policy == "depth":
+            self.slots = [None] * self.capacity
+        else:
+            self.slots = OrderedDict()
+        self.size = 0
+
+    """
+    Start a new search, entries from earlier searches can then be replaced whatever their depth"""
+    def newSearch(self):
+        self.generation += 1
+
+    """
+    Return the entry for the key or None"""
+    def probe(self, key):
+        if self.policy == "depth":
+            entry = self.slots[key % self.capacity]
+            if entry is not None and entry.key != key:
+                entry = None
+        else:
+            entry = self.slots.get(key)
+            if entry is not None:
+                self.slots.move_to_end(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    """
+    Find the entry for the key to write to, or make room for a new one. Returns None when the depth preferred
+    slot holds a deeper result of the current search"""
+    def getEntryForStore(self, key, depth):
+        if self.policy == "depth":
+            index = key % self.capacity
+            entry = self.slots[index]
+            if entry is not None and entry.key == key:
+                return entry
+            if entry is not None and entry.generation == self.generation and entry.depth > depth:
+                return None
+            if entry is None:
+                self.size += 1
+            entry = TranspositionEntry(key, self.generation)
+            self.slots[index] = entry
+            return entry
+        entry = self.slots.get(key)
+        if entry is not None:
+            self.slots.move_to_end(key)
+            return entry
+        if self.size >= self.capacity:
+            self.slots.popitem(last=False)
+        else:
+            self.size += 1
+        entry = TranspositionEntry(key, self.generation)
+        self.slots[key] = entry
+        return entry
+
+    """
+    Cache the valid move IDs of a position"""
+    def storeMoves(self, key, moves, inCheck):
+        entry = self.getEntryForStore(key, -1)
+        if entry is not None:
+            entry.moves = moves
+            entry.inCheck = inCheck
+
+    """
+    Save a search result for a position"""
+    def store(self, key, depth, score, flag, bestMove=None):
+        entry = self.getEntryForStore(key, depth)
+        if entry is None:
+            return
+        if depth >= entry.depth or entry.generation != self.generation:
+            entry.depth = depth
+            entry.score = score
+            entry.flag = flag
+            if bestMove is not None: # keep the old best move for move ordering if this search found none
+                entry.bestMove = bestMove
+            entry.generation = self.generation
+
+    """
+    Usage numbers of the table as a dictionary"""
+    def getStats(self):
+        probes = self.hits + self.misses
+        return {"policy": self.policy, "capacity": self.capacity, "size": self.size, "hits": self.hits,
+                "misses": self.misses, "hitRate": self.hits / probes if probes else 0.0}
@@ -0,0 +1,239 @@
+"""
+UCI (Universal Chess Interface) front end, so the engine can be run by chess GUIs and tournament managers:
+
+    python -m Chess.ChessUCI
+
+Supports uci, isready, ucinewgame, setoption (Hash), position startpos/fen ... moves ..., go with wtime, btime,
+winc, binc, movestogo, movetime, depth, infinite and ponder, stop, ponderhit and quit. Searches run on a
+background thread so stop and ponderhit are read while the engine thinks. pygame is never imported here.
+
+With "go ponder" the position already has the reply the engine expects (the ponder move of its last bestmove), and
+it is searched without a time limit until the GUI sends ponderhit (the opponent played it, the clock of the go
+command starts now) or stop (it didn't, the result is thrown away by the GUI).
+"""
+
+import sys
+import threading
+
+from Chess import ChessBitboard, ChessBook, ChessEngine, ChessPerft, ChessSearch
+
+ENGINE_NAME = "UIChess"
+ENGINE_AUTHOR = "Ujjwal Pandit"
+DEFAULT_HASH = 16
+MAX_HASH = 1024
+
+class UCIEngine():
+    def __init__(self, output=None):
+        self.output = output or sys.stdout
+        self.outputLock = threading.Lock()
+        self.hashMegabytes = DEFAULT_HASH
+        self.book = None
+        self.searcher = ChessSearch.Searcher(self.hashMegabytes)
+        self.gs = ChessBitboard.GameState()
+        self.positionFEN = ChessPerft.STARTING_FEN # None after a bad position command, go answers bestmove 0000
+        self.positionMoves = []
+        self.thread = None
+        self.timeManager = None
+        self.goArgs = {}
+        self.release = threading.Event() # set when a ponder or infinite search may send its bestmove
+        self.commands = {"uci": self.cmdUCI, "isready": self.cmdIsReady, "ucinewgame": self.cmdNewGame,
+                         "setoption": self.cmdSetOption, "position": self.cmdPosition, "go": self.cmdGo,
+                         "stop": self.cmdStop, "ponderhit": self.cmdPonderHit}
+
+    def send(self, line):
+        with self.outputLock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    """
+    Read commands until quit or the end of the input"""
+    def run(self, lines=None):
+        for line in lines or sys.stdin:
+            tokens = line.split()
+            if not tokens:
+                continue
+            if tokens[0] == "quit":
+                break
+            command = self.commands.get(tokens[0])
+            if command is not None:
+                command(tokens[1:])
+        self.cmdStop([])
+
+    def cmdUCI(self, args):
+        self.send("id name %s" % ENGINE_NAME)
+        self.send("id author %s" % ENGINE_AUTHOR)
+        self.send("option name Hash type spin default %d min 1 max %d" % (DEFAULT_HASH, MAX_HASH))
+        self.send("option name Ponder type check default false")
+        self.send("option name BookFile type string default <empty>")
+        self.send("uciok")
+
+    def cmdIsReady(self, args):
+        self.send("readyok")
+
+    def cmdNewGame(self, args):
+        self.waitForSearch()
+        # a clean table and history for the new game
+        self.searcher = ChessSearch.Searcher(self.hashMegabytes, book=self.book)
+
+    def cmdSetOption(self, args):
+        # setoption name <id> [value <x>]
+        if "value" not in args or "name" not in args:
+            return
+        name = " ".join(args[args.index("name") + 1:args.index("value")]).lower()
+        value = " ".join(args[args.index("value") + 1:])
+        if name == "hash" and value.isdigit():
+            self.waitForSearch()
+            self.hashMegabytes = max(1, min(MAX_HASH, int(value)))
+            self.searcher = ChessSearch.Searcher(self.hashMegabytes, book=self.book)
+        elif name == "bookfile":
+            self.waitForSearch()
+            if self.book is not None:
+                self.book.close()
+            self.book = None
+            if value and value != "<empty>":
+                try:
+                    self.book = ChessBook.OpeningBook(value)
+                except (OSError, ValueError) as error:
+                    self.send("info string cannot open book: %s" % error)
+            self.searcher.book = self.book
+
+    """
+    position [startpos | fen <fen>] [moves <move> ...]. When the new position is the current one with moves added
+    (the usual case during a game) only the new moves are played, otherwise the position is set up again. After a
+    bad FEN or an illegal move there is no position until the next good position command: a move for a board the
+    GUI doesn't have would be illegal there"""
+    def cmdPosition(self, args):
+        self.waitForSearch()
+        movesIndex = args.index("moves") if "moves" in args else len(args)
+        if args and args[0] == "fen":
+            fen = " ".join(args[1:movesIndex])
+        else:
+            fen = ChessPerft.STARTING_FEN
+        moves = args[movesIndex + 1:]
+        if fen == self.positionFEN and moves[:len(self.positionMoves)] == self.positionMoves:
+            newMoves = moves[len(self.positionMoves):]
+        else:
+            self.positionFEN = None # the board no longer matches the old position, whatever happens next
+            try:
+                self.gs.loadFEN(fen)
+            except ValueError as error:
+                self.send("info string bad fen %s: %s" % (fen, error))
+                self.positionMoves = []
+                return
+            self.positionFEN = fen
+            self.positionMoves = []
+            newMoves = moves
+        for notation in newMoves:
+            try:
+                moveID = ChessEngine.Move.idFromNotation(notation)
+            except ValueError:
+                moveID = None
+            if moveID is None or moveID not in self.gs.getValidMoveIDs():
+                self.send("info string illegal move %s" % notation)
+                self.positionFEN = None
+                self.positionMoves = []
+                return
+            self.gs.makeMove(self.gs.moveFromID(moveID))
+            self.positionMoves.append(notation)
+
+    """
+    The time manager for the go arguments, seconds from the side to move's clock"""
+    def makeTimeManager(self, goArgs):
+        if "movetime" in goArgs:
+            return ChessSearch.TimeManager(maxTime=goArgs["movetime"] / 1000)
+        side = "w" if self.gs.whiteToMove else "b"
+        if side + "time" in goArgs:
+            return ChessSearch.TimeManager(remaining=goArgs[side + "time"] / 1000,
+                                           increment=goArgs.get(side + "inc", 0) / 1000,
+                                           movesToGo=goArgs.get("movestogo"))
+        return ChessSearch.TimeManager() # depth or infinite, no deadline
+
+    def cmdGo(self, args):
+        self.waitForSearch()
+        goArgs = {}
+        flags = set()
+        i = 0
+        while i < len(args):
+            if args[i] in ("ponder", "infinite"):
+                flags.add(args[i])
+                i += 1
+            elif i + 1 < len(args) and args[i + 1].lstrip("-").isdigit():
+                goArgs[args[i]] = int(args[i + 1])
+                i += 2
+            else:
+                i += 1
+        self.goArgs = goArgs
+        self.release.clear()
+        if flags: # ponder and infinite: no clock and the bestmove waits for ponderhit or stop
+            self.timeManager = ChessSearch.TimeManager()
+        else:
+            self.timeManager = self.makeTimeManager(goArgs)
+            self.release.set()
+        maxDepth = goArgs.get("depth", ChessSearch.MAX_PLY - 1)
+        self.thread = threading.Thread(target=self.search, args=(maxDepth,), daemon=True)
+        self.thread.start()
+
+    def search(self, maxDepth):
+        result = ChessSearch.SearchResult(None, 0, 0, [], 0, 0.0)
+        if self.positionFEN is None:
+            self.send("info string no position, send a valid position command")
+        else:
+            try:
+                result = self.searcher.search(self.gs, maxDepth=maxDepth, timeManager=self.timeManager,
+                                              onIteration=self.sendInfo)
+            except Exception as error: # the GUI waits for a bestmove whatever happened
+                self.send("info string search failed: %s" % error)
+        self.release.wait() # UCI: no bestmove while pondering or in infinite mode until stop/ponderhit
+        if result.bestMove is None:
+            self.send("bestmove 0000")
+        elif len(result.pv) > 1:
+            self.send("bestmove %s ponder %s" % (ChessEngine.Move.notationFromID(result.bestMove),
+                                                 ChessEngine.Move.notationFromID(result.pv[1])))
+        else:
+            self.send("bestmove %s" % ChessEngine.Move.notationFromID(result.bestMove))
+
+    def sendInfo(self, result):
+        mateIn = result.getMateIn()
+        score = "mate %d" % mateIn if mateIn is not None else "cp %d" % result.score
+        milliseconds = int(result.seconds * 1000)
+        self.send("info depth %d score %s nodes %d nps %d time %d pv %s" % (
+            result.depth, score, result.nodes, int(result.nodes / result.seconds) if result.seconds > 0 else 0,
+            milliseconds, " ".join(ChessEngine.Move.notationFromID(moveID) for moveID in result.pv)))
+
+    """
+    The opponent played the expected move: the ponder search goes on as a normal search under the clock of the
+    go command, starting now"""
+    def cmdPonderHit(self, args):
+        if self.timeManager is None:
+            return
+        clock = self.makeTimeManager(self.goArgs)
+        self.timeManager.start = clock.start
+        self.timeManager.softDeadline = clock.softDeadline
+        self.timeManager.hardDeadline = clock.hardDeadline
+        self.release.set()
+
+    def cmdStop(self, args):
+        if self.thread is not None and self.thread.is_alive():
+            self.searcher.stop()
+        self.release.set()
+        self.waitForSearch()
+
+    """
+    Wait for the running search to send its bestmove, the GameState belongs to the search thread until then. A
+    ponder or infinite search is stopped first, it would never end by itself"""
+    def waitForSearch(self):
+        if self.thread is None:
+            return
+        if not self.release.is_set():
+            self.searcher.stop()
+            self.release.set()
+        self.thread.join()
+        self.thread = None
+        self.searcher.stopped = False # a stop that came after the search ended must not hit the next one
+
+def main():
+    UCIEngine().run()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
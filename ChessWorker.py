@@ -0,0 +1,100 @@
+"""
+Background engine worker so the pygame loop keeps drawing and handling input while the engine thinks.
+
+The worker searches a snapshot of the GameState (rebuilt from its FEN, plus the position history for repetitions)
+on a daemon thread, so the game the UI shows is never touched by the search. The UI polls it once per frame:
+
+    worker = EngineWorker()
+    worker.start(gs, maxTime=2.0)       # cancels whatever was running
+    ...
+    progress = worker.getProgress()     # SearchResult of the last completed depth, or None
+    result = worker.poll()              # the final SearchResult once, then None
+    worker.cancel()                     # e.g. when the user takes a move back
+"""
+
+import threading
+
+from Chess import ChessSearch
+
+"""
+Copy a GameState through its FEN into a new GameState of the same engine. The zobrist history is copied as well
+so the search still sees repetitions of positions played before the snapshot"""
+def takeSnapshot(gs):
+    snapshot = type(gs)()
+    snapshot.loadFEN(gs.getFEN())
+    snapshot.zobristKeyLog = list(gs.zobristKeyLog)
+    return snapshot
+
+class EngineWorker():
+    def __init__(self, hashMegabytes=16):
+        self.searcher = ChessSearch.Searcher(hashMegabytes)
+        self.lock = threading.Lock()
+        self.thread = None
+        self.jobID = 0 # increased for every job, results of older jobs are dropped
+        self.progress = None
+        self.result = None
+
+    """
+    Start searching the position in the background, a running search is cancelled first"""
+    def start(self, gs, maxTime=1.0, maxDepth=None):
+        self.cancel()
+        snapshot = takeSnapshot(gs)
+        with self.lock:
+            self.jobID += 1
+            jobID = self.jobID
+        self.thread = threading.Thread(target=self.run, args=(snapshot, maxTime, maxDepth, jobID), daemon=True)
+        self.thread.start()
+        return jobID
+
+    def run(self, snapshot, maxTime, maxDepth, jobID):
+        onIteration = lambda result: self.setProgress(jobID, result)
+        result = self.searcher.search(snapshot, maxTime=maxTime, maxDepth=maxDepth, onIteration=onIteration)
+        with self.lock:
+            if jobID == self.jobID:
+                self.result = result
+
+    def setProgress(self, jobID, result):
+        with self.lock:
+            if jobID == self.jobID:
+                self.progress = result
+
+    """
+    Stop the running search and forget its result, returns once the search thread has finished"""
+    def cancel(self):
+        with self.lock:
+            self.jobID += 1
+            self.progress = None
+            self.result = None
+        if self.thread is not None:
+            if self.thread.is_alive():
+                self.searcher.stop()
+                self.thread.join()
+            self.searcher.stopped = False # a stop that came after the search ended must not hit the next one
+            self.thread = None
+
+    def isBusy(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    """
+    True when no search is running and there is no result waiting to be polled, the UI can then sleep until input"""
+    def isIdle(self):
+        if self.isBusy(): # checked first, the result is set before the thread ends
+            return False
+        with self.lock:
+            return self.result is None
+
+    """
+    The result of the last completed depth of the running search (current depth, best move so far), or None"""
+    def getProgress(self):
+        with self.lock:
+            return self.progress
+
+    """
+    Returns the final SearchResult once when the search is done, None otherwise"""
+    def poll(self):
+        with self.lock:
+            result = self.result
+            self.result = None
+        if result is not None:
+            self.thread = None
+        return result